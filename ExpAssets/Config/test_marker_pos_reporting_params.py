@@ -66,3 +66,12 @@ append_hostname = False
 #########################################
 # PROJECT-SPECIFIC VARS
 #########################################
+# Trial recording format: "csv" (text) or "bin" (memory-mappable binary) files in
+# OptiData, or "db" (a frame store beside the project database, *_frames.db)
+opti_data_format = "csv"
+# Write per-trial motion-to-photon latency stamps/summaries alongside OptiData
+record_latency = True
+# Receive and parse NatNet frames in a separate process (shared-memory handoff)
+opti_ingest_process = False
+# Seconds to wait for the first tracking frame of a trial before giving up
+opti_first_frame_timeout = 2.0
@@ -54,5 +54,16 @@ CREATE TABLE trials (
     id integer primary key autoincrement not null,
     participant_id integer not null references participants(id),
     block_num integer not null,
-    trial_num integer not null
+    trial_num integer not null,
+    frames_received integer not null,
+    frames_dropped integer not null,
+    frames_duplicated integer not null,
+    frames_reordered integer not null,
+    /* movement summary from OptiTracker.movement_summary(): s, cm/s and cm; null where not found */
+    reaction_time real,
+    movement_time real,
+    peak_velocity real,
+    time_to_peak_velocity real,
+    path_length real,
+    endpoint_error real
 );
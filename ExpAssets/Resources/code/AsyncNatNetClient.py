@@ -0,0 +1,437 @@
+"""
+NatNet client on an asyncio event loop.
+
+NatNetClient gives each of its command and data sockets a blocking thread.
+AsyncNatNetClient runs both channels as asyncio datagram endpoints on one
+event loop instead, with keep-alives sent on a timer and timeouts on
+connecting and on the stream going quiet. Frames come out of an async
+iterator, so one loop can follow several servers without a thread per socket:
+
+    async with AsyncNatNetClient({"server_ip": "192.168.0.10"}) as client:
+        async for frame in client:
+            hand = frame.marker_sets["hand"]
+
+Only marker sets are decoded; for the other frame sections, or for listener
+callbacks on a background thread, use NatNetClient.
+"""
+
+import asyncio
+import socket
+import struct
+import warnings
+import numpy as np
+from time import perf_counter_ns
+from typing import AsyncIterator, Dict, NamedTuple, Tuple, Union
+
+from FrameSequence import FrameSequence
+from MotiveStreamParser import MotiveStreamParser
+
+NAT_CONNECT = 0
+NAT_SERVERINFO = 1
+NAT_REQUEST = 2
+NAT_FRAMEOFDATA = 7
+NAT_KEEPALIVE = 10
+
+_message_header = struct.Struct("<HH")
+
+# NAT_CONNECT payload: "Ping", padding, then the NatNet version requested (4.1)
+_connect_payload = b"Ping" + bytes(260) + bytes([4, 1, 0, 0])
+
+
+class MocapFrame(NamedTuple):
+    """
+    One frame of marker positions from a NatNet server.
+
+    Attributes:
+        server (str): Address of the server the frame came from
+        frame_number (int): Frame number reported by the server
+        received (int): perf_counter_ns at which the packet arrived
+        marker_sets (Dict[str, np.ndarray]): Read-only [n_markers, 3] float32
+            positions (metres) keyed by marker set label; where labels repeat
+            within a frame, the first set with the label is kept
+    """
+
+    server: str
+    frame_number: int
+    received: int
+    marker_sets: Dict[str, np.ndarray]
+
+
+class _Channel(asyncio.DatagramProtocol):
+    """Hands datagrams from one socket to the client."""
+
+    def __init__(self, on_datagram, on_error):
+        self.__on_datagram = on_datagram
+        self.__on_error = on_error
+
+    def datagram_received(self, data: bytes, address: Tuple[str, int]) -> None:
+        self.__on_datagram(data)
+
+    def error_received(self, exc: Exception) -> None:
+        self.__on_error(exc)
+
+
+class AsyncNatNetClient(object):
+    """
+    Receives a NatNet stream on the running asyncio event loop.
+
+    Frames are queued as they arrive and taken off by iterating over the
+    client. The queue is bounded: if the consumer falls behind, the oldest
+    frames are discarded (and counted) so it always catches up to the newest.
+
+    Attributes:
+        settings (dict): Connection settings (see __init__)
+        server_info (dict): Application name and versions reported by the server
+        frame_stats (dict): Sequence counters as in NatNetClient, plus "overflow"
+            (frames discarded because the queue was full)
+        connected (bool): True between a successful startup() and shutdown()
+
+    Methods:
+        startup(): Open both channels and connect to the server
+        frames(): Async iterator over received frames (also iter(client))
+        send_command(command): Send a command string to the server
+        reset_frame_stats(): Zero the sequence counters
+        shutdown(): Close both channels and end iteration
+    """
+
+    def __init__(
+        self,
+        instance_settings: Dict[str, Union[str, int, float, bool, tuple]] = {},
+        queue_size: int = 8,
+    ):
+        """
+        Initialize the AsyncNatNetClient object.
+
+        Args:
+            instance_settings (dict, optional): Overrides for the default settings:
+                server_ip, local_ip, multicast, command_port, data_port and
+                use_multicast as in NatNetClient; marker_set_labels (None
+                decodes every set); discard_stale_frames and
+                stream_reset_frames as in NatNetClient; connect_timeout (s to
+                wait for the server to answer); frame_timeout (s without a
+                frame before iteration raises TimeoutError, 0 waits forever);
+                keep_alive_interval (s between unicast keep-alives).
+            queue_size (int, optional): Frames held for the consumer. Defaults to 8.
+        """
+        if queue_size < 1:
+            raise ValueError("Queue size must be at least one frame.")
+
+        self.settings = {
+            "server_ip": "127.0.0.1",
+            "local_ip": "127.0.0.1",
+            "multicast": "239.255.42.99",
+            "command_port": 1510,
+            "data_port": 1511,
+            "use_multicast": True,
+            "marker_set_labels": None,
+            "discard_stale_frames": True,
+            "stream_reset_frames": 10,
+            "connect_timeout": 2.0,
+            "frame_timeout": 1.0,
+            "keep_alive_interval": 1.0,
+        }
+        self.settings.update(instance_settings)
+
+        self.server_info = {}
+        self.__sequence = FrameSequence(
+            self.settings["stream_reset_frames"], self.settings["discard_stale_frames"]
+        )
+        self.__overflow = 0
+
+        self.__queue_size = queue_size
+        self.__queue: Union[asyncio.Queue, None] = None
+        self.__server_answered: Union[asyncio.Future, None] = None
+        self.__command_transport = None
+        self.__data_transport = None
+        self.__keep_alive_task: Union[asyncio.Task, None] = None
+        self.__error: Union[Exception, None] = None
+        self.__connected = False
+
+    @property
+    def connected(self) -> bool:
+        """Get whether the client is connected to the server."""
+        return self.__connected
+
+    async def __aenter__(self) -> "AsyncNatNetClient":
+        await self.startup()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.shutdown()
+
+    def __aiter__(self) -> AsyncIterator[MocapFrame]:
+        return self.frames()
+
+    async def startup(self) -> None:
+        """
+        Open the command and data channels and connect to the server.
+
+        Raises:
+            TimeoutError: If the server does not answer within connect_timeout
+            OSError: If either socket cannot be opened
+        """
+        if self.__connected:
+            return
+
+        loop = asyncio.get_running_loop()
+        self.__queue = asyncio.Queue(self.__queue_size)
+        self.__server_answered = loop.create_future()
+        self.__error = None
+
+        try:
+            self.__data_transport, _ = await loop.create_datagram_endpoint(
+                lambda: _Channel(self.__datagram_received, self.__error_received),
+                sock=self.__create_data_socket(),
+            )
+            self.__command_transport, _ = await loop.create_datagram_endpoint(
+                lambda: _Channel(self.__datagram_received, self.__error_received),
+                sock=self.__create_command_socket(),
+            )
+
+            self.__send(NAT_CONNECT, _connect_payload)
+
+            try:
+                await asyncio.wait_for(
+                    self.__server_answered, self.settings["connect_timeout"]
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"NatNet server at {self.settings['server_ip']} did not answer "
+                    f"within {self.settings['connect_timeout']} s."
+                ) from None
+        except BaseException:
+            self.__close_transports()
+            raise
+
+        if not self.settings["use_multicast"]:
+            self.__keep_alive_task = loop.create_task(self.__keep_alive())
+
+        self.__connected = True
+
+    async def shutdown(self) -> None:
+        """Close both channels; iteration ends once queued frames are consumed."""
+        if self.__keep_alive_task is not None:
+            self.__keep_alive_task.cancel()
+            try:
+                await self.__keep_alive_task
+            except asyncio.CancelledError:
+                pass
+            self.__keep_alive_task = None
+
+        self.__close_transports()
+
+        if self.__connected:
+            self.__connected = False
+            # wake the consumer; None marks the end of the stream
+            self.__enqueue(None)
+
+    async def frames(self) -> AsyncIterator[MocapFrame]:
+        """
+        Iterate over frames as they arrive, until shutdown().
+
+        Raises:
+            TimeoutError: If no frame arrives within frame_timeout
+            OSError: If a channel reported a socket error
+        """
+        if self.__queue is None:
+            raise RuntimeError("startup() must be awaited before iterating.")
+
+        timeout = self.settings["frame_timeout"] or None
+
+        while True:
+            try:
+                frame = await asyncio.wait_for(self.__queue.get(), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"No frame from {self.settings['server_ip']} within {timeout} s."
+                ) from None
+
+            if self.__error is not None:
+                raise self.__error
+
+            if frame is None:
+                return
+
+            yield frame
+
+    def send_command(self, command: str) -> None:
+        """
+        Send a command string (e.g. "TimelinePlay") to the server.
+
+        Args:
+            command (str): Command to send
+        """
+        self.__send(NAT_REQUEST, command.encode("utf-8"))
+
+    @property
+    def frame_stats(self) -> dict:
+        """Get the sequence counters, plus frames lost to a full queue ("overflow")."""
+        return {**self.__sequence.stats, "overflow": self.__overflow}
+
+    def reset_frame_stats(self) -> None:
+        """Zero the frame sequence counters."""
+        self.__sequence.reset()
+        self.__overflow = 0
+
+    async def __keep_alive(self) -> None:
+        # Motive stops unicast streaming to clients it has not heard from
+        while True:
+            await asyncio.sleep(self.settings["keep_alive_interval"])
+            self.__send(NAT_KEEPALIVE)
+
+    def __send(self, message_id: int, payload: bytes = b"") -> None:
+        size = 0 if message_id == NAT_KEEPALIVE else len(payload) + 1
+        self.__command_transport.sendto(
+            _message_header.pack(message_id, size) + payload + b"\0",
+            (self.settings["server_ip"], self.settings["command_port"]),
+        )
+
+    def __datagram_received(self, data: bytes) -> None:
+        received = perf_counter_ns()
+
+        if len(data) < _message_header.size:
+            return
+
+        message_id, _ = _message_header.unpack_from(data, 0)
+
+        if message_id == NAT_FRAMEOFDATA:
+            frame = self.__unpack_frame(data, received)
+            if frame is not None:
+                self.__enqueue(frame)
+
+        elif message_id == NAT_SERVERINFO:
+            self.__unpack_server_info(data)
+
+    def __error_received(self, exc: Exception) -> None:
+        # surfaced to the consumer, which is woken if waiting
+        self.__error = exc
+        self.__enqueue(None)
+
+    def __unpack_frame(self, data: bytes, received: int) -> Union[MocapFrame, None]:
+        parser = MotiveStreamParser(data, offset=_message_header.size)
+        index = parser.index(sections=False)
+
+        if not self.__sequence.check(index.frame_number):
+            return None
+
+        labels = self.settings["marker_set_labels"]
+        marker_sets = {}
+
+        for label, offset, count in index.marker_sets:
+            if label in marker_sets:
+                warnings.warn(
+                    f"Frame {index.frame_number} holds more than one marker set "
+                    f"labelled '{label}'; only the first is kept."
+                )
+                continue
+
+            if labels is None or label in labels:
+                parser.seek_to(offset)
+                # a view onto data, which is immutable and owned by the frame
+                marker_sets[label] = parser.parse_markers(count)
+
+        return MocapFrame(
+            self.settings["server_ip"], index.frame_number, received, marker_sets
+        )
+
+    def __unpack_server_info(self, data: bytes) -> None:
+        offset = _message_header.size
+        name, _, _ = data[offset : offset + 256].partition(b"\0")
+
+        self.server_info = {
+            "application_name": name.decode("utf-8"),
+            "server_version": tuple(data[offset + 256 : offset + 260]),
+            "nat_net_version": tuple(data[offset + 260 : offset + 264]),
+        }
+
+        if self.__server_answered is not None and not self.__server_answered.done():
+            self.__server_answered.set_result(True)
+
+    def __enqueue(self, frame: Union[MocapFrame, None]) -> None:
+        if self.__queue.full():
+            self.__queue.get_nowait()
+            self.__overflow += 1
+
+        self.__queue.put_nowait(frame)
+
+    def __close_transports(self) -> None:
+        for transport in (self.__command_transport, self.__data_transport):
+            if transport is not None:
+                transport.close()
+
+        self.__command_transport = self.__data_transport = None
+
+    def __create_command_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        if self.settings["use_multicast"]:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            sock.bind(("", 0))
+        else:
+            # unicast frames are sent back to this socket
+            sock.bind((self.settings["local_ip"], 0))
+
+        sock.setblocking(False)
+        return sock
+
+    def __create_data_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        if self.settings["use_multicast"]:
+            sock.setsockopt(
+                socket.IPPROTO_IP,
+                socket.IP_ADD_MEMBERSHIP,
+                socket.inet_aton(self.settings["multicast"])
+                + socket.inet_aton(self.settings["local_ip"]),
+            )
+            sock.bind((self.settings["local_ip"], self.settings["data_port"]))
+        else:
+            sock.bind(("", 0))
+
+        sock.setblocking(False)
+        return sock
+
+
+async def merge_frames(*clients: AsyncNatNetClient) -> AsyncIterator[MocapFrame]:
+    """
+    Interleave the frames of several started clients, in order of arrival.
+
+    Iteration ends once every client has shut down; an error from any client
+    (e.g. a frame timeout) stops the others and is raised here.
+
+    Args:
+        *clients (AsyncNatNetClient): Clients to follow, already started
+
+    Yields:
+        MocapFrame: Each client's frames, tagged with its server address
+    """
+    merged = asyncio.Queue()
+
+    async def pump(client: AsyncNatNetClient) -> None:
+        try:
+            async for frame in client:
+                await merged.put(frame)
+        except Exception as e:
+            await merged.put(e)
+        finally:
+            await merged.put(None)
+
+    tasks = [asyncio.create_task(pump(client)) for client in clients]
+    running = len(tasks)
+
+    try:
+        while running:
+            item = await merged.get()
+
+            if item is None:
+                running -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
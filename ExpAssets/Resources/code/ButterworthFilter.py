@@ -0,0 +1,143 @@
+import numpy as np
+from functools import lru_cache
+from scipy.signal import butter, sosfilt_zi, sosfiltfilt
+
+
+@lru_cache(maxsize=32)
+def butter_sos(
+    order: int, cutoff: float, sample_rate: float, filtype: str = "low"
+) -> np.ndarray:
+    """
+    Design a Butterworth filter once per parameter set.
+
+    Args:
+        order (int): Order of the Butterworth filter
+        cutoff (float): Cutoff frequency in Hz
+        sample_rate (float): Sampling rate in Hz
+        filtype (str, optional): Type of filter. Defaults to "low".
+
+    Returns:
+        np.ndarray: Second-order sections, shared between callers (do not modify)
+    """
+    return butter(N=order, Wn=cutoff, btype=filtype, output="sos", fs=sample_rate)
+
+
+@lru_cache(maxsize=32)
+def _steady_state(
+    order: int, cutoff: float, sample_rate: float, filtype: str
+) -> np.ndarray:
+    return sosfilt_zi(butter_sos(order, cutoff, sample_rate, filtype))
+
+
+def filtfilt(
+    data: np.ndarray,
+    order: int,
+    cutoff: float,
+    sample_rate: float,
+    filtype: str = "low",
+) -> np.ndarray:
+    """
+    Zero-phase (dual-pass) filter every column of data at once, for offline use.
+
+    Args:
+        data (np.ndarray): [samples, channels] array, filtered along axis 0
+        order (int): Order of the Butterworth filter
+        cutoff (float): Cutoff frequency in Hz
+        sample_rate (float): Sampling rate in Hz
+        filtype (str, optional): Type of filter. Defaults to "low".
+
+    Returns:
+        np.ndarray: Filtered float array of the same shape
+    """
+    sos = butter_sos(order, cutoff, sample_rate, filtype)
+    return sosfiltfilt(sos=sos, x=np.asarray(data, dtype=float), axis=0)
+
+
+class StreamingButterworth(object):
+    """
+    A causal Butterworth filter applied one sample at a time.
+
+    Keeps the filter state between calls, so each update costs a fixed number
+    of multiply-adds per channel regardless of how much data came before. The
+    state is initialised to steady state at the first sample to avoid a
+    start-up transient. All channels (e.g. x, y, z) are filtered together.
+
+    Attributes:
+        output (np.ndarray): Most recent filtered sample (NaN before the first update)
+
+    Methods:
+        update(sample): Filter one sample and return the filtered value
+        reset(): Discard the filter state
+    """
+
+    def __init__(
+        self,
+        order: int = 2,
+        cutoff: float = 10,
+        sample_rate: float = 120,
+        filtype: str = "low",
+        channels: int = 3,
+    ):
+        """
+        Initialize the StreamingButterworth object.
+
+        Args:
+            order (int, optional): Order of the Butterworth filter. Defaults to 2.
+            cutoff (float, optional): Cutoff frequency in Hz. Defaults to 10.
+            sample_rate (float, optional): Sampling rate in Hz. Defaults to 120.
+            filtype (str, optional): Type of filter. Defaults to "low".
+            channels (int, optional): Number of channels filtered together. Defaults to 3.
+        """
+        sos = butter_sos(order, cutoff, sample_rate, filtype)
+
+        # per-section coefficients, shaped to broadcast over channels
+        self.__b = sos[:, :3, None]
+        self.__a = sos[:, 4:, None]
+        self.__zi = _steady_state(order, cutoff, sample_rate, filtype)[:, :, None]
+
+        self.__state = np.zeros((len(sos), 2, channels))
+        self.__output = np.full(channels, np.nan)
+        self.__primed = False
+
+    @property
+    def output(self) -> np.ndarray:
+        """Get the most recent filtered sample."""
+        return self.__output.copy()
+
+    def update(self, sample: np.ndarray) -> np.ndarray:
+        """
+        Filter one sample (direct form II transposed, cascaded sections).
+
+        Samples containing NaN (e.g. fully occluded frames) leave the state
+        untouched and return the last filtered value.
+
+        Args:
+            sample (np.ndarray): One value per channel
+
+        Returns:
+            np.ndarray: Filtered sample
+        """
+        x = np.asarray(sample, dtype=float)
+
+        if np.isnan(x).any():
+            return self.output
+
+        if not self.__primed:
+            self.__state[:] = self.__zi * x
+            self.__primed = True
+
+        b, a, z = self.__b, self.__a, self.__state
+        for s in range(len(z)):
+            y = b[s, 0] * x + z[s, 0]
+            z[s, 0] = b[s, 1] * x - a[s, 0] * y + z[s, 1]
+            z[s, 1] = b[s, 2] * x - a[s, 1] * y
+            x = y
+
+        self.__output = x
+        return self.output
+
+    def reset(self) -> None:
+        """Discard the filter state, e.g. between trials."""
+        self.__state[:] = 0
+        self.__output[:] = np.nan
+        self.__primed = False
@@ -0,0 +1,304 @@
+import numpy as np
+from threading import Lock
+from typing import Tuple, Union
+
+
+class FrameBuffer(object):
+    """
+    A fixed-capacity ring buffer holding the most recent frames of marker data.
+
+    Storage is preallocated as a dense [capacity, marker_count, 3] float array,
+    alongside the frame number of each slot. Markers absent from a frame are
+    stored as NaN, and flagged in a per-frame validity mask as they arrive.
+
+    Attributes:
+        capacity (int): Maximum number of frames retained
+        marker_count (int): Number of markers stored per frame
+        frames_written (int): Total number of frames appended since last clear
+        frame_span (int): Frame periods from the oldest stored frame to the newest, inclusive
+        missing_counts (np.ndarray): Frames each marker was absent from since last clear
+
+    Methods:
+        append(frame_number, positions): Store a frame, overwriting the oldest if full
+        latest(num_frames): Return the most recent frames in chronological order
+        validity(num_frames): Return the validity mask of the most recent frames
+        clear(): Discard all stored frames
+    """
+
+    def __init__(self, capacity: int, marker_count: int):
+        """
+        Initialize the FrameBuffer object.
+
+        Args:
+            capacity (int): Maximum number of frames retained
+            marker_count (int): Number of markers stored per frame
+        """
+
+        if capacity < 1:
+            raise ValueError("Buffer capacity must be at least one frame.")
+
+        if marker_count < 1:
+            raise ValueError("Marker count must be at least one.")
+
+        self.__capacity = capacity
+        self.__marker_count = marker_count
+
+        self.__frame_numbers = np.zeros(capacity, dtype=np.int64)
+        self.__positions = np.full((capacity, marker_count, 3), np.nan)
+        self.__valid = np.zeros((capacity, marker_count), dtype=bool)
+        self.__missing = np.zeros(marker_count, dtype=np.int64)
+
+        # total frames appended; next write goes to __head % capacity
+        self.__head = 0
+        self.__lock = Lock()
+
+    @property
+    def capacity(self) -> int:
+        """Get the maximum number of frames retained."""
+        return self.__capacity
+
+    @property
+    def marker_count(self) -> int:
+        """Get the number of markers stored per frame."""
+        return self.__marker_count
+
+    @property
+    def frames_written(self) -> int:
+        """Get the number of frames appended since last clear."""
+        return self.__head
+
+    @property
+    def frame_span(self) -> int:
+        """Get the frame periods from the oldest stored frame to the newest, inclusive."""
+        with self.__lock:
+            if self.__head == 0:
+                return 0
+
+            oldest = max(self.__head - self.__capacity, 0) % self.__capacity
+            newest = (self.__head - 1) % self.__capacity
+            return int(self.__frame_numbers[newest] - self.__frame_numbers[oldest]) + 1
+
+    @property
+    def missing_counts(self) -> np.ndarray:
+        """Get the number of frames each marker was absent from since last clear."""
+        return self.__missing.copy()
+
+    def __len__(self) -> int:
+        return min(self.__head, self.__capacity)
+
+    def append(self, frame_number: int, positions: np.ndarray) -> None:
+        """
+        Store a frame of marker positions.
+
+        Args:
+            frame_number (int): Frame number reported by the tracking system
+            positions (np.ndarray): [n_markers, 3] array of marker positions;
+                markers beyond marker_count are discarded.
+        """
+        n = min(len(positions), self.__marker_count)
+
+        with self.__lock:
+            slot = self.__head % self.__capacity
+
+            self.__frame_numbers[slot] = frame_number
+            self.__positions[slot, :n] = positions[:n]
+            self.__positions[slot, n:] = np.nan
+
+            valid = self.__valid[slot]
+            np.logical_not(np.isnan(self.__positions[slot]).any(axis=1), out=valid)
+            self.__missing += ~valid
+
+            self.__head += 1
+
+    def latest(self, num_frames: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the most recent frames in chronological order.
+
+        Args:
+            num_frames (int, optional): Number of frames to return. Defaults to 1.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Frame numbers, and a
+                [frames, marker_count, 3] copy of their marker positions.
+        """
+        if num_frames < 0:
+            raise ValueError("Number of frames cannot be negative.")
+
+        with self.__lock:
+            num_frames = min(num_frames, self.__head, self.__capacity)
+            idx = np.arange(self.__head - num_frames, self.__head) % self.__capacity
+
+            # fancy indexing copies, so callers never see later writes
+            return self.__frame_numbers[idx], self.__positions[idx]
+
+    def validity(self, num_frames: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the validity mask of the most recent frames in chronological order.
+
+        Args:
+            num_frames (int, optional): Number of frames to return. Defaults to 1.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Frame numbers, and a [frames, marker_count]
+                boolean mask, True where a marker was present.
+        """
+        if num_frames < 0:
+            raise ValueError("Number of frames cannot be negative.")
+
+        with self.__lock:
+            num_frames = min(num_frames, self.__head, self.__capacity)
+            idx = np.arange(self.__head - num_frames, self.__head) % self.__capacity
+
+            return self.__frame_numbers[idx], self.__valid[idx]
+
+    def clear(self) -> None:
+        """Discard all stored frames."""
+        with self.__lock:
+            self.__positions[:] = np.nan
+            self.__valid[:] = False
+            self.__missing[:] = 0
+            self.__head = 0
+
+
+class LatestFrame(object):
+    """
+    A lock-free, double-buffered slot holding the newest frame.
+
+    Intended for one writer (the data thread) and one reader (the render loop).
+    The writer alternates between two preallocated slots and bumps a sequence
+    number before and after each write, seqlock style; the reader copies the
+    last completed slot and only retries if the writer lapped it mid-copy,
+    which takes two further writes. Neither side ever blocks.
+
+    Attributes:
+        marker_count (int): Number of markers stored per frame
+        writes (int): Frames published since last clear
+        reads (int): Calls to read() since last clear
+        stale_reads (int): Reads returning the same frame as the previous read
+        retries (int): Reads repeated because a write overtook them
+
+    Methods:
+        publish(frame_number, positions, smoothed): Store a frame (writer side)
+        read(): Return the newest complete frame (reader side)
+        clear(): Discard the stored frame and reset counters
+    """
+
+    def __init__(self, marker_count: int):
+        """
+        Initialize the LatestFrame object.
+
+        Args:
+            marker_count (int): Number of markers stored per frame
+        """
+        if marker_count < 1:
+            raise ValueError("Marker count must be at least one.")
+
+        self.__marker_count = marker_count
+
+        self.__frame_numbers = np.full(2, -1, dtype=np.int64)
+        self.__positions = np.full((2, marker_count, 3), np.nan)
+        self.__smoothed = np.full((2, 3), np.nan)
+
+        self.clear()
+
+    @property
+    def marker_count(self) -> int:
+        """Get the number of markers stored per frame."""
+        return self.__marker_count
+
+    @property
+    def writes(self) -> int:
+        """Get the number of frames published since last clear."""
+        return self.__sequence // 2
+
+    @property
+    def reads(self) -> int:
+        """Get the number of calls to read() since last clear."""
+        return self.__reads
+
+    @property
+    def stale_reads(self) -> int:
+        """Get the number of reads that returned an already-read frame."""
+        return self.__stale_reads
+
+    @property
+    def retries(self) -> int:
+        """Get the number of reads repeated because a write overtook them."""
+        return self.__retries
+
+    def publish(
+        self,
+        frame_number: int,
+        positions: np.ndarray,
+        smoothed: Union[np.ndarray, None] = None,
+    ) -> None:
+        """
+        Store a frame, making it visible to the reader once complete.
+
+        Args:
+            frame_number (int): Frame number reported by the tracking system
+            positions (np.ndarray): [n_markers, 3] array of marker positions;
+                markers beyond marker_count are discarded.
+            smoothed (np.ndarray, optional): [3] filtered centroid as of this
+                frame, stored in the same slot so it is read alongside it.
+                Defaults to None (stored as NaN).
+        """
+        n = min(len(positions), self.__marker_count)
+
+        # odd while writing; write k lands in slot k % 2
+        self.__sequence += 1
+        slot = (self.__sequence // 2 + 1) % 2
+
+        self.__frame_numbers[slot] = frame_number
+        self.__positions[slot, :n] = positions[:n]
+        self.__positions[slot, n:] = np.nan
+        self.__smoothed[slot] = np.nan if smoothed is None else smoothed
+
+        self.__sequence += 1
+
+    def read(self) -> Tuple[int, np.ndarray, np.ndarray]:
+        """
+        Return the newest complete frame without blocking.
+
+        Returns:
+            Tuple[int, np.ndarray, np.ndarray]: Frame number (-1 before any
+                frame), a [marker_count, 3] copy of its marker positions, and
+                a [3] copy of the filtered centroid published with it.
+        """
+        self.__reads += 1
+
+        while True:
+            before = self.__sequence
+            completed = before // 2
+            slot = completed % 2
+
+            frame_number = int(self.__frame_numbers[slot])
+            positions = self.__positions[slot].copy()
+            smoothed = self.__smoothed[slot].copy()
+
+            # the slot is only reused by write completed + 2, which starts at this sequence
+            if self.__sequence < 2 * completed + 3:
+                break
+
+            self.__retries += 1
+
+        if completed == self.__last_read and completed:
+            self.__stale_reads += 1
+        self.__last_read = completed
+
+        if completed == 0:
+            return -1, positions, smoothed
+
+        return frame_number, positions, smoothed
+
+    def clear(self) -> None:
+        """Discard the stored frame and reset counters."""
+        self.__sequence = 0
+        self.__last_read = 0
+        self.__reads = 0
+        self.__stale_reads = 0
+        self.__retries = 0
+
+        self.__frame_numbers[:] = -1
+        self.__positions[:] = np.nan
+        self.__smoothed[:] = np.nan
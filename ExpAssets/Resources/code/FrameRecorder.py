@@ -0,0 +1,522 @@
+import csv
+import sqlite3
+import struct
+import warnings
+import numpy as np
+from itertools import repeat
+from threading import Event, Lock, Thread
+from typing import IO, List, Tuple, Union
+
+# Binary frame files: a fixed-width header followed by contiguous little-endian
+# records, one per marker, so they can be np.memmap'd and tail-sliced directly.
+FRAME_FILE_MAGIC = b"OTFR"
+FRAME_FILE_VERSION = 1
+FRAME_FILE_HEADER = struct.Struct("<4sHHII16x")
+
+frame_record_dtype = np.dtype(
+    [
+        ("frame_number", "<u4"),
+        ("pos_x", "<f4"),
+        ("pos_y", "<f4"),
+        ("pos_z", "<f4"),
+    ]
+)
+
+
+def open_frame_file(path: str) -> np.memmap:
+    """
+    Memory-map the records of a binary frame file without reading them.
+
+    Args:
+        path (str): Path to a file written by BinaryFrameRecorder
+
+    Returns:
+        np.memmap: Read-only array of frame_record_dtype records
+
+    Raises:
+        ValueError: If the file is not a binary frame file of a supported version
+    """
+    with open(path, "rb") as file:
+        header = file.read(FRAME_FILE_HEADER.size)
+
+    if len(header) < FRAME_FILE_HEADER.size:
+        raise ValueError(f"File is too short to be a frame file:\n{path}")
+
+    magic, version, record_size, _, _ = FRAME_FILE_HEADER.unpack(header)
+
+    if magic != FRAME_FILE_MAGIC or version != FRAME_FILE_VERSION:
+        raise ValueError(f"Not a version {FRAME_FILE_VERSION} frame file:\n{path}")
+
+    if record_size != frame_record_dtype.itemsize:
+        raise ValueError(f"Unexpected record size ({record_size}) in:\n{path}")
+
+    return np.memmap(
+        path, dtype=frame_record_dtype, mode="r", offset=FRAME_FILE_HEADER.size
+    )
+
+
+def is_frame_file(path: str) -> bool:
+    """Whether the file at path starts with the binary frame file magic."""
+    with open(path, "rb") as file:
+        return file.read(len(FRAME_FILE_MAGIC)) == FRAME_FILE_MAGIC
+
+
+# SQLite frame stores: one row per marker per frame, keyed by trial. Kept in a
+# standalone database file beside the klibs project database rather than in it,
+# since the store is switched to write-ahead logging (see connect_frame_store).
+FRAMES_TABLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    participant_id integer not null,
+    block_num integer not null,
+    trial_num integer not null,
+    frame_number integer not null,
+    marker integer not null,
+    pos_x real,
+    pos_y real,
+    pos_z real
+);
+
+-- positions included, so window queries are answered from the index alone
+DROP INDEX IF EXISTS frames_trial_frame_marker;
+CREATE INDEX IF NOT EXISTS frames_trial_frame_marker_xyz
+    ON frames (
+        participant_id, block_num, trial_num, frame_number, marker, pos_x, pos_y, pos_z
+    );
+"""
+
+# (participant_id, block_num, trial_num)
+TrialKey = Tuple[int, int, int]
+
+# Rows returned by frame store queries; positions are NaN where a marker was occluded
+frame_row_dtype = np.dtype(
+    [
+        ("frame_number", "i8"),
+        ("marker", "i8"),
+        ("pos_x", "f8"),
+        ("pos_y", "f8"),
+        ("pos_z", "f8"),
+    ]
+)
+
+_TRIAL = "participant_id = ? AND block_num = ? AND trial_num = ?"
+_COLUMNS = "frame_number, marker, pos_x, pos_y, pos_z"
+
+
+def connect_frame_store(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite frame store, creating the frames table and index if missing.
+
+    The database is switched to write-ahead logging, so queries can read the
+    frames of a trial while a recorder is still appending to it. The journal
+    mode is stored in the file and outlives the connection, so point this at a
+    standalone frame store, not a database other programs (e.g. klibs) open.
+
+    Args:
+        path (str): Path of the frame store's database file
+
+    Returns:
+        sqlite3.Connection: Connection usable from any one thread at a time
+    """
+    connection = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # under WAL, NORMAL only syncs at checkpoints and cannot corrupt the database
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(FRAMES_TABLE_SCHEMA)
+
+    return connection
+
+
+def query_latest_frames(
+    connection: sqlite3.Connection, trial: TrialKey, num_frames: int
+) -> np.ndarray:
+    """
+    Get the rows of a trial's last num_frames frame periods, by indexed lookup.
+
+    Args:
+        connection (sqlite3.Connection): Open frame store
+        trial (TrialKey): (participant_id, block_num, trial_num) of the trial
+        num_frames (int): Window length, counted by frame number
+
+    Returns:
+        np.ndarray: frame_row_dtype rows ordered by frame number, then marker
+    """
+    rows = connection.execute(
+        f"SELECT {_COLUMNS} FROM frames WHERE {_TRIAL} AND frame_number > "
+        f"(SELECT MAX(frame_number) FROM frames WHERE {_TRIAL}) - ? "
+        "ORDER BY frame_number, marker",
+        (*trial, *trial, num_frames),
+    ).fetchall()
+
+    return np.array(rows, dtype=frame_row_dtype)
+
+
+def query_frame_range(
+    connection: sqlite3.Connection, trial: TrialKey, first_frame: int, last_frame: int
+) -> np.ndarray:
+    """
+    Get the rows of a trial's frames numbered first_frame to last_frame, inclusive.
+
+    Args:
+        connection (sqlite3.Connection): Open frame store
+        trial (TrialKey): (participant_id, block_num, trial_num) of the trial
+        first_frame (int): First frame number
+        last_frame (int): Last frame number
+
+    Returns:
+        np.ndarray: frame_row_dtype rows ordered by frame number, then marker
+    """
+    rows = connection.execute(
+        f"SELECT {_COLUMNS} FROM frames WHERE {_TRIAL} "
+        "AND frame_number BETWEEN ? AND ? ORDER BY frame_number, marker",
+        (*trial, first_frame, last_frame),
+    ).fetchall()
+
+    return np.array(rows, dtype=frame_row_dtype)
+
+
+class FrameRecorder(object):
+    """
+    Persists marker frames to disk without blocking the thread that produces them.
+
+    The output file is opened once per recording. Frames passed to record() are
+    queued in memory and written out by a background thread, either every
+    flush_interval seconds or as soon as flush_size frames are pending.
+
+    Attributes:
+        path (str): Path of the file being written
+        flush_interval (float): Maximum seconds between writes to disk
+        flush_size (int): Number of pending frames that triggers an early write
+        frames_recorded (int): Number of frames queued since the recorder was opened
+
+    Methods:
+        open(): Open the output file and start the writer thread
+        record(frame_number, positions): Queue a frame of marker positions
+        flush(): Write all pending frames immediately
+        close(): Write remaining frames, stop the writer thread and close the file
+    """
+
+    header = ["pos_x", "pos_y", "pos_z", "frame_number"]
+
+    def __init__(self, path: str, flush_interval: float = 0.1, flush_size: int = 120):
+        """
+        Initialize the FrameRecorder object.
+
+        Args:
+            path (str): Path of the file to write
+            flush_interval (float, optional): Seconds between writes. Defaults to 0.1.
+            flush_size (int, optional): Pending frames forcing a write. Defaults to 120.
+        """
+
+        if flush_interval <= 0:
+            raise ValueError("Flush interval must be positive.")
+
+        if flush_size < 1:
+            raise ValueError("Flush size must be at least one frame.")
+
+        self.__path = path
+        self.__flush_interval = flush_interval
+        self.__flush_size = flush_size
+
+        self.__pending: List[Tuple[int, np.ndarray]] = []
+        self.__pending_lock = Lock()
+        self.__write_lock = Lock()
+        self.__wake = Event()
+        self.__stop = Event()
+
+        self.__file: Union[IO, None] = None
+        self.__thread: Union[Thread, None] = None
+        self.__frames_recorded = 0
+
+        # guarded by __pending_lock, so no frame is queued once close() begins
+        self.__accepting = False
+
+    def __enter__(self) -> "FrameRecorder":
+        self.open()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @property
+    def path(self) -> str:
+        """Get the path of the file being written."""
+        return self.__path
+
+    @property
+    def flush_interval(self) -> float:
+        """Get the maximum number of seconds between writes."""
+        return self.__flush_interval
+
+    @property
+    def flush_size(self) -> int:
+        """Get the number of pending frames that triggers an early write."""
+        return self.__flush_size
+
+    @property
+    def frames_recorded(self) -> int:
+        """Get the number of frames queued since the recorder was opened."""
+        return self.__frames_recorded
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the recorder is currently accepting frames."""
+        return self.__file is not None
+
+    def open(self) -> None:
+        """Open the output file and start the writer thread."""
+        if self.is_open:
+            raise RuntimeError(f"Recorder is already open at:\n{self.__path}")
+
+        self.__file = self._open_file(self.__path)
+        self._write_header(self.__file)
+
+        self.__frames_recorded = 0
+        self.__stop.clear()
+        with self.__pending_lock:
+            self.__accepting = True
+
+        self.__thread = Thread(target=self.__writer_thread_function, daemon=True)
+        self.__thread.start()
+
+    def record(self, frame_number: int, positions: np.ndarray) -> None:
+        """
+        Queue a frame of marker positions for writing.
+
+        Called from the NatNet data thread, so does no I/O itself. Frames
+        arriving once close() has begun are not recorded, and raise a warning.
+
+        Args:
+            frame_number (int): Frame number reported by the tracking system
+            positions (np.ndarray): [n_markers, 3] array of marker positions; copied,
+                so views onto a reused receive buffer are safe to pass.
+        """
+        positions = np.array(positions)
+
+        with self.__pending_lock:
+            accepting = self.__accepting
+            if accepting:
+                self.__pending.append((frame_number, positions))
+                pending = len(self.__pending)
+
+        if not accepting:
+            warnings.warn(
+                f"Frame {frame_number} arrived while the recorder was closed, "
+                f"and was not recorded to:\n{self.__path}"
+            )
+            return
+
+        self.__frames_recorded += 1
+
+        if pending >= self.__flush_size:
+            self.__wake.set()
+
+    def flush(self) -> None:
+        """Write all pending frames to disk immediately."""
+        with self.__pending_lock:
+            pending, self.__pending = self.__pending, []
+
+        if not pending:
+            return
+
+        frame_numbers = np.concatenate(
+            [
+                np.full(len(positions), frame_number)
+                for frame_number, positions in pending
+            ]
+        )
+        markers = np.concatenate(
+            [np.arange(len(positions)) for _, positions in pending]
+        )
+        positions = np.concatenate([positions for _, positions in pending])
+
+        with self.__write_lock:
+            if self.__file is not None:
+                self._write_frames(self.__file, frame_numbers, markers, positions)
+                self._flush_file(self.__file)
+
+    def close(self) -> None:
+        """Write remaining frames, stop the writer thread and close the file."""
+        if not self.is_open:
+            return
+
+        # stop queuing first, so the flush below drains every frame accepted
+        with self.__pending_lock:
+            self.__accepting = False
+
+        self.__stop.set()
+        self.__wake.set()
+        self.__thread.join()
+        self.__thread = None
+
+        self.flush()
+
+        with self.__write_lock:
+            self.__file.close()
+            self.__file = None
+
+    def _open_file(self, path: str) -> IO:
+        """Open the output file; overridden by recorders writing other formats."""
+        return open(path, "w", newline="")
+
+    def _write_header(self, file: IO) -> None:
+        """Write the file header."""
+        csv.writer(file).writerow(self.header)
+
+    def _write_frames(
+        self,
+        file: IO,
+        frame_numbers: np.ndarray,
+        markers: np.ndarray,
+        positions: np.ndarray,
+    ) -> None:
+        """
+        Write a batch of rows, one per marker.
+
+        Args:
+            file (IO): Open output file
+            frame_numbers (np.ndarray): Frame number of each row
+            markers (np.ndarray): Marker index of each row within its frame;
+                file formats imply it from row order, so only the frame store
+                writes it
+            positions (np.ndarray): [rows, 3] array of marker positions
+        """
+        csv.writer(file).writerows(zip(*positions.T.tolist(), frame_numbers.tolist()))
+
+    def _flush_file(self, file: IO) -> None:
+        """Push written frames out to the file."""
+        file.flush()
+
+    def __writer_thread_function(self) -> None:
+        while not self.__stop.is_set():
+            self.__wake.wait(timeout=self.__flush_interval)
+            self.__wake.clear()
+            self.flush()
+
+
+class BinaryFrameRecorder(FrameRecorder):
+    """
+    A FrameRecorder writing the binary frame format instead of CSV.
+
+    Each marker is stored as a 16-byte record (uint32 frame number, float32 x/y/z)
+    after a 32-byte header, so files can be memory-mapped with open_frame_file()
+    and the last N frames read as a single slice.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.1,
+        flush_size: int = 120,
+        marker_count: int = 0,
+        sample_rate: int = 0,
+    ):
+        """
+        Initialize the BinaryFrameRecorder object.
+
+        Args:
+            path (str): Path of the file to write
+            flush_interval (float, optional): Seconds between writes. Defaults to 0.1.
+            flush_size (int, optional): Pending frames forcing a write. Defaults to 120.
+            marker_count (int, optional): Markers per frame, stored in the header. Defaults to 0.
+            sample_rate (int, optional): Sampling rate in Hz, stored in the header. Defaults to 0.
+        """
+        super().__init__(path, flush_interval, flush_size)
+
+        self.__marker_count = marker_count
+        self.__sample_rate = sample_rate
+
+    def _open_file(self, path: str) -> IO:
+        return open(path, "wb")
+
+    def _write_header(self, file: IO) -> None:
+        file.write(
+            FRAME_FILE_HEADER.pack(
+                FRAME_FILE_MAGIC,
+                FRAME_FILE_VERSION,
+                frame_record_dtype.itemsize,
+                self.__marker_count,
+                self.__sample_rate,
+            )
+        )
+
+    def _write_frames(
+        self,
+        file: IO,
+        frame_numbers: np.ndarray,
+        markers: np.ndarray,
+        positions: np.ndarray,
+    ) -> None:
+        records = np.empty(len(frame_numbers), dtype=frame_record_dtype)
+        records["frame_number"] = frame_numbers
+        records["pos_x"] = positions[:, 0]
+        records["pos_y"] = positions[:, 1]
+        records["pos_z"] = positions[:, 2]
+
+        file.write(records.tobytes())
+
+
+class SQLiteFrameRecorder(FrameRecorder):
+    """
+    A FrameRecorder inserting frames into a SQLite frame store.
+
+    Rows go into the frames table (see FRAMES_TABLE_SCHEMA) under the given
+    trial key, one executemany() and commit per flush on the writer thread.
+    Opening the recorder replaces any rows already stored for the trial, as
+    the file recorders overwrite their file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.1,
+        flush_size: int = 120,
+        trial: TrialKey = (0, 0, 0),
+    ):
+        """
+        Initialize the SQLiteFrameRecorder object.
+
+        Args:
+            path (str): Path of the frame store's database file
+            flush_interval (float, optional): Seconds between writes. Defaults to 0.1.
+            flush_size (int, optional): Pending frames forcing a write. Defaults to 120.
+            trial (TrialKey, optional): (participant_id, block_num, trial_num) to
+                store frames under. Defaults to (0, 0, 0).
+        """
+        super().__init__(path, flush_interval, flush_size)
+
+        self.__trial = tuple(trial)
+
+    @property
+    def trial(self) -> TrialKey:
+        """Get the trial key frames are stored under."""
+        return self.__trial
+
+    def _open_file(self, path: str) -> sqlite3.Connection:
+        return connect_frame_store(path)
+
+    def _write_header(self, file: sqlite3.Connection) -> None:
+        file.execute(f"DELETE FROM frames WHERE {_TRIAL}", self.__trial)
+        file.commit()
+
+    def _write_frames(
+        self,
+        file: sqlite3.Connection,
+        frame_numbers: np.ndarray,
+        markers: np.ndarray,
+        positions: np.ndarray,
+    ) -> None:
+        participant_id, block_num, trial_num = self.__trial
+        file.executemany(
+            "INSERT INTO frames VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                repeat(participant_id),
+                repeat(block_num),
+                repeat(trial_num),
+                frame_numbers.tolist(),
+                markers.tolist(),
+                *positions.T.tolist(),
+            ),
+        )
+
+    def _flush_file(self, file: sqlite3.Connection) -> None:
+        file.commit()
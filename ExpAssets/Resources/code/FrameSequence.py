@@ -0,0 +1,102 @@
+from typing import Dict
+
+
+class FrameSequence(object):
+    """
+    Tracks the continuity of a stream's frame numbers.
+
+    Shared by the NatNet clients, so both count gaps, duplicates, reordered
+    frames and restarts of the server's numbering the same way.
+
+    Attributes:
+        stream_reset_frames (int): Backward jump in frame number treated as a
+            restart of the server's numbering, rather than a reordered frame
+        discard_stale_frames (bool): Whether check() rejects duplicate and
+            reordered frames
+        stats (Dict[str, int]): Counters since the last reset() (live, not a copy)
+
+    Methods:
+        check(frame_number): Count an incoming frame, returning whether to keep it
+        restart(): Forget the last frame, e.g. after frames were skipped on purpose
+        reset(): Zero the counters
+    """
+
+    def __init__(
+        self, stream_reset_frames: int = 10, discard_stale_frames: bool = True
+    ):
+        """
+        Initialize the FrameSequence object.
+
+        Args:
+            stream_reset_frames (int, optional): Backward jump treated as a restart
+                of the numbering. Defaults to 10.
+            discard_stale_frames (bool, optional): Reject duplicate and reordered
+                frames. Defaults to True.
+        """
+        if stream_reset_frames < 0:
+            raise ValueError("Stream reset threshold cannot be negative.")
+
+        self.stream_reset_frames = stream_reset_frames
+        self.discard_stale_frames = discard_stale_frames
+
+        self.reset()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Get the counters since the last reset."""
+        return self.__stats
+
+    def check(self, frame_number: int) -> bool:
+        """
+        Update the counters for an incoming frame, flagging frames that should be skipped.
+
+        Args:
+            frame_number (int): Frame number of the incoming frame
+
+        Returns:
+            bool: False if the frame is stale (duplicate or reordered) and
+                stale frames are being discarded
+        """
+        stats = self.__stats
+        stats["received"] += 1
+        last = stats["last_frame_number"]
+
+        if last >= 0:
+            step = frame_number - last
+
+            if step < -self.stream_reset_frames:
+                # the server's numbering restarted (Motive restarted, a take
+                # re-opened, playback looped); carry on from the new numbers
+                stats["resets"] += 1
+            elif step < 1:
+                if step == 0:
+                    stats["duplicates"] += 1
+                else:
+                    stats["reordered"] += 1
+
+                # stale frames never move the sequence backwards
+                return not self.discard_stale_frames
+            elif step > 1:
+                stats["dropped"] += step - 1
+                stats["gaps"] += 1
+                stats["largest_gap"] = max(stats["largest_gap"], step - 1)
+
+        stats["last_frame_number"] = frame_number
+        return True
+
+    def restart(self) -> None:
+        """Forget the last frame, so the next is not counted against it."""
+        self.__stats["last_frame_number"] = -1
+
+    def reset(self) -> None:
+        """Zero the counters (received, dropped, reordered, resets, ...)."""
+        self.__stats = {
+            "received": 0,
+            "dropped": 0,
+            "gaps": 0,
+            "largest_gap": 0,
+            "duplicates": 0,
+            "reordered": 0,
+            "resets": 0,
+            "last_frame_number": -1,
+        }
@@ -0,0 +1,166 @@
+import numpy as np
+from typing import Dict
+
+GAP_FILL_METHODS = ("linear", "spline", "hold")
+
+
+def validity_mask(positions: np.ndarray) -> np.ndarray:
+    """
+    Flag which markers were seen in each frame.
+
+    Args:
+        positions (np.ndarray): [frames, markers, 3] positions, NaN where occluded
+
+    Returns:
+        np.ndarray: [frames, markers] boolean mask, True where the marker is valid
+    """
+    return ~np.isnan(positions).any(axis=2)
+
+
+def fill_gaps(
+    frame_numbers: np.ndarray,
+    positions: np.ndarray,
+    max_gap: int,
+    method: str = "linear",
+) -> np.ndarray:
+    """
+    Fill short occlusions of each marker, for all markers and frames at once.
+
+    Gaps are measured in frame numbers, so frames dropped by the stream count
+    towards a gap's length just as occluded ones do. "linear" and "spline"
+    (cubic Hermite) interpolate between the samples bounding a gap and leave
+    gaps longer than max_gap, or at either end of the data, untouched. "hold"
+    repeats the last valid sample for up to max_gap frames after it.
+
+    Args:
+        frame_numbers (np.ndarray): [frames] increasing frame numbers
+        positions (np.ndarray): [frames, markers, 3] positions, NaN where occluded
+        max_gap (int): Longest gap (in frames) to fill
+        method (str, optional): One of "linear", "spline" or "hold". Defaults to "linear".
+
+    Returns:
+        np.ndarray: Filled copy of positions
+    """
+    if method not in GAP_FILL_METHODS:
+        raise ValueError(f"Gap fill method must be one of {GAP_FILL_METHODS}.")
+
+    if max_gap < 0:
+        raise ValueError("Maximum gap cannot be negative.")
+
+    valid = validity_mask(positions)
+    frame_count, marker_count = valid.shape
+
+    if max_gap == 0 or frame_count == 0 or valid.all():
+        return positions.copy()
+
+    rows = np.arange(frame_count)[:, None]
+    markers = np.arange(marker_count)[None, :]
+
+    # index of the nearest valid sample at or before / at or after every frame
+    prev = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    nxt = np.minimum.accumulate(np.where(valid, rows, frame_count)[::-1], axis=0)[::-1]
+
+    t = frame_numbers.astype(float)[:, None]
+    t_prev = t[np.clip(prev, 0, None), 0]
+    t_next = t[np.clip(nxt, None, frame_count - 1), 0]
+    p_prev = positions[np.clip(prev, 0, None), markers]
+    p_next = positions[np.clip(nxt, None, frame_count - 1), markers]
+
+    if method == "hold":
+        fill = ~valid & (prev >= 0) & (t - t_prev <= max_gap)
+        return np.where(fill[..., None], p_prev, positions)
+
+    fill = ~valid & (prev >= 0) & (nxt < frame_count) & (t_next - t_prev - 1 <= max_gap)
+
+    span = np.where(fill, t_next - t_prev, 1)
+    s = ((t - t_prev) / span)[..., None]
+
+    if method == "linear":
+        filled = p_prev + s * (p_next - p_prev)
+        return np.where(fill[..., None], filled, positions)
+
+    # Tangents from the samples either side of the gap (Catmull-Rom style),
+    # falling back to the gap's secant where the gap touches another gap or an end
+    before = np.clip(prev - 1, 0, None)
+    pp = np.where(prev > 0, prev[before, markers], -1)
+    after = np.clip(nxt + 1, None, frame_count - 1)
+    nn = np.where(nxt < frame_count - 1, nxt[after, markers], frame_count)
+
+    secant = (p_next - p_prev) / span[..., None]
+
+    has_pp = (pp >= 0)[..., None]
+    t_pp = t[np.clip(pp, 0, None), 0][..., None]
+    p_pp = positions[np.clip(pp, 0, None), markers]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        m_prev = np.where(has_pp, (p_next - p_pp) / (t_next[..., None] - t_pp), secant)
+
+    has_nn = (nn < frame_count)[..., None]
+    t_nn = t[np.clip(nn, None, frame_count - 1), 0][..., None]
+    p_nn = positions[np.clip(nn, None, frame_count - 1), markers]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        m_next = np.where(has_nn, (p_nn - p_prev) / (t_nn - t_prev[..., None]), secant)
+
+    h = span[..., None]
+    s2, s3 = s**2, s**3
+    filled = (
+        (2 * s3 - 3 * s2 + 1) * p_prev
+        + (s3 - 2 * s2 + s) * h * m_prev
+        + (-2 * s3 + 3 * s2) * p_next
+        + (s3 - s2) * h * m_next
+    )
+
+    return np.where(fill[..., None], filled, positions)
+
+
+def dropout_stats(frame_numbers: np.ndarray, valid: np.ndarray) -> Dict[str, object]:
+    """
+    Summarise marker dropouts over a run of frames.
+
+    Args:
+        frame_numbers (np.ndarray): [frames] increasing frame numbers
+        valid (np.ndarray): [frames, markers] validity mask
+
+    Returns:
+        Dict[str, object]: Counts over the frames given:
+            frames (int): Frames examined
+            dropped_frames (int): Frame numbers skipped entirely by the stream
+            incomplete_frames (int): Frames missing at least one marker
+            empty_frames (int): Frames missing every marker
+            visibility (np.ndarray): [markers] fraction of frames each marker was seen
+            gap_count (np.ndarray): [markers] number of separate occlusions
+            longest_gap (np.ndarray): [markers] longest occlusion, in frames
+                (by frame number, as fill_gaps measures it, so frames dropped
+                by the stream count towards it)
+    """
+    frame_count, marker_count = valid.shape
+
+    # +1 where an occlusion starts, -1 where it ends
+    missing = np.zeros((frame_count + 2, marker_count), dtype=np.int8)
+    missing[1:-1] = ~valid
+    edges = np.diff(missing, axis=0)
+
+    # nonzero() on the transpose orders edges by marker, then frame, pairing starts with ends
+    start_markers, start_rows = np.nonzero(edges.T == 1)
+    _, end_rows = np.nonzero(edges.T == -1)
+
+    # frame numbers of the valid samples bounding each gap; gaps at either end
+    # are bounded by the frame just outside the data
+    bounds = np.empty(frame_count + 2, dtype=np.int64)
+    bounds[1:-1] = frame_numbers
+    if frame_count:
+        bounds[0], bounds[-1] = frame_numbers[0] - 1, frame_numbers[-1] + 1
+
+    longest_gap = np.zeros(marker_count, dtype=np.int64)
+    np.maximum.at(
+        longest_gap, start_markers, bounds[end_rows + 1] - bounds[start_rows] - 1
+    )
+
+    return {
+        "frames": frame_count,
+        "dropped_frames": int(np.clip(np.diff(frame_numbers) - 1, 0, None).sum()),
+        "incomplete_frames": int((~valid.all(axis=1)).sum()),
+        "empty_frames": int((~valid.any(axis=1)).sum()),
+        "visibility": valid.mean(axis=0) if frame_count else np.zeros(marker_count),
+        "gap_count": np.bincount(start_markers, minlength=marker_count),
+        "longest_gap": longest_gap,
+    }
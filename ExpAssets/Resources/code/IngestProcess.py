@@ -0,0 +1,564 @@
+"""
+Receive and parse NatNet frames in a separate process.
+
+Rendering and the NatNet data thread otherwise share one interpreter, and with
+it the GIL, so a slow frame of text rendering delays packet receipt. Here a
+child process runs its own NatNetClient and writes each frame of one marker set
+into a shared-memory ring; the experiment process receives a tiny wake-up
+message per frame and copies the frame's positions out of shared memory.
+
+Only receive and parse leave the experiment process. The listener's work
+(OptiTracker.add_frame: buffering, filtering, kinematics and events, and
+recording) still runs there per frame, so its estimates stay causal and
+current; see bench_ingest in benchmarks/bench_pipeline.py for the relay's
+own cost per frame.
+
+IngestProcess mirrors the parts of NatNetClient the experiment uses (listener
+attributes, startup/pause/resume/shutdown, frame_stats), so either can be used.
+"""
+
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Dict, Tuple, Union
+
+from LatencyLog import PARSE
+
+# Header slots (int64) at the start of the shared block
+SEQUENCE = 0  # 2 * frames written, +1 while a write is in progress
+HEARTBEAT = 1  # perf_counter_ns of the child's last sign of life
+PID = 2  # child process ID
+PAUSED = 3  # set by the parent; the child drops frames while non-zero
+RECEIVED = 4  # frame sequence counters, mirrored from the child's client
+DROPPED = 5
+DUPLICATES = 6
+REORDERED = 7
+GAPS = 8
+LARGEST_GAP = 9
+RESETS = 10
+RESET_STATS = 11  # bumped by the parent to request reset_frame_stats()
+STOP = 12  # set by the parent to ask the child to exit
+HEADER_SLOTS = 16
+
+_notification = struct.Struct("<q")
+
+
+class SharedFrameRing(object):
+    """
+    A single-writer ring of marker frames in shared memory.
+
+    Laid out as an int64 header, then per-slot frame numbers, receive/parse
+    timestamps and [marker_count, 3] float64 positions, all exposed as NumPy
+    views onto the block (no copies). The writer bumps the header sequence
+    before and after each write, so readers can tell if a slot was rewritten
+    while they read it.
+
+    Attributes:
+        name (str): Shared memory block name, for attaching from another process
+        capacity (int): Number of frames held
+        marker_count (int): Number of markers stored per frame
+        header (np.ndarray): [HEADER_SLOTS] int64 control and status fields
+        writes (int): Frames written since creation
+
+    Methods:
+        write(frame_number, positions, received, parsed): Store a frame (writer side)
+        frame(write): Get views onto the frame stored by a given write
+        overwritten(write): Check whether a write's slot has since been reused
+        close(): Detach from the block
+        unlink(): Free the block (owner only, after every process has closed it)
+    """
+
+    def __init__(self, capacity: int, marker_count: int, name: Union[str, None] = None):
+        """
+        Create a ring, or attach to an existing one by name.
+
+        Args:
+            capacity (int): Number of frames held
+            marker_count (int): Number of markers stored per frame
+            name (str, optional): Name of a ring to attach to. Defaults to None (create).
+        """
+        if capacity < 1:
+            raise ValueError("Ring capacity must be at least one frame.")
+
+        if marker_count < 1:
+            raise ValueError("Marker count must be at least one.")
+
+        self.__capacity = capacity
+        self.__marker_count = marker_count
+
+        header_size = HEADER_SLOTS * 8
+        numbers_size = capacity * 8
+        stamps_size = capacity * 2 * 8
+        size = header_size + numbers_size + stamps_size + capacity * marker_count * 24
+
+        if name is None:
+            self.__shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # children share the creator's resource tracker, so attaching
+            # does not take ownership and the block outlives them
+            self.__shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.__shm.buf
+        self.__header = np.ndarray(HEADER_SLOTS, dtype=np.int64, buffer=buf)
+        self.__frame_numbers = np.ndarray(
+            capacity, dtype=np.int64, buffer=buf, offset=header_size
+        )
+        self.__stamps = np.ndarray(
+            (capacity, 2),
+            dtype=np.int64,
+            buffer=buf,
+            offset=header_size + numbers_size,
+        )
+        self.__positions = np.ndarray(
+            (capacity, marker_count, 3),
+            dtype=np.float64,
+            buffer=buf,
+            offset=header_size + numbers_size + stamps_size,
+        )
+
+        if name is None:
+            self.__header[:] = 0
+
+    @property
+    def name(self) -> str:
+        """Get the shared memory block name."""
+        return self.__shm.name
+
+    @property
+    def capacity(self) -> int:
+        """Get the number of frames held."""
+        return self.__capacity
+
+    @property
+    def marker_count(self) -> int:
+        """Get the number of markers stored per frame."""
+        return self.__marker_count
+
+    @property
+    def header(self) -> np.ndarray:
+        """Get the control and status header (a view; writes are shared)."""
+        return self.__header
+
+    @property
+    def writes(self) -> int:
+        """Get the number of frames written since creation."""
+        return int(self.__header[SEQUENCE]) // 2
+
+    def write(
+        self, frame_number: int, positions: np.ndarray, received: int, parsed: int
+    ) -> int:
+        """
+        Store a frame in the next slot.
+
+        Args:
+            frame_number (int): Frame number reported by the tracking system
+            positions (np.ndarray): [n_markers, 3] positions; extras are discarded
+            received (int): perf_counter_ns when the packet arrived
+            parsed (int): perf_counter_ns when its markers were decoded
+
+        Returns:
+            int: Number of frames written, including this one
+        """
+        n = min(len(positions), self.__marker_count)
+        header = self.__header
+
+        header[SEQUENCE] += 1
+        slot = (header[SEQUENCE] // 2) % self.__capacity
+
+        self.__frame_numbers[slot] = frame_number
+        self.__stamps[slot] = received, parsed
+        self.__positions[slot, :n] = positions[:n]
+        self.__positions[slot, n:] = np.nan
+
+        header[SEQUENCE] += 1
+        return int(header[SEQUENCE]) // 2
+
+    def frame(self, write: int) -> Tuple[int, np.ndarray, np.ndarray]:
+        """
+        Get the frame stored by a given write (1 = first frame written).
+
+        Args:
+            write (int): Write number
+
+        Returns:
+            Tuple[int, np.ndarray, np.ndarray]: Frame number, [2] receive/parse
+                stamps, and a [marker_count, 3] view of its positions. Check
+                overwritten() after use if the view was read slowly.
+        """
+        slot = (write - 1) % self.__capacity
+        return (
+            int(self.__frame_numbers[slot]),
+            self.__stamps[slot],
+            self.__positions[slot],
+        )
+
+    def overwritten(self, write: int) -> bool:
+        """Check whether the slot of a given write has since been (or is being) reused."""
+        return int(self.__header[SEQUENCE]) + 1 >= 2 * (write + self.__capacity)
+
+    def close(self) -> None:
+        """Detach from the block; views obtained earlier become invalid."""
+        self.__header = self.__frame_numbers = self.__stamps = self.__positions = None
+        self.__shm.close()
+
+    def unlink(self) -> None:
+        """Free the block. Only the creating process should call this."""
+        self.__shm.unlink()
+
+
+class _Stamps(object):
+    """Captures the receive/parse stamps NatNetClient gives a latency log."""
+
+    def __init__(self):
+        self.received_at = 0
+        self.parsed_at = 0
+
+    def received(self) -> None:
+        self.received_at = time.perf_counter_ns()
+
+    def begin(self, frame_number: int) -> None:
+        self.parsed_at = 0
+
+    def stamp(self, stage: int) -> None:
+        if not self.parsed_at:
+            self.parsed_at = time.perf_counter_ns()
+
+
+def _ingest_main(
+    settings: Dict,
+    ring_name: str,
+    capacity: int,
+    marker_count: int,
+    label: str,
+    notify,
+    heartbeat_interval: float,
+) -> None:
+    """Child process: receive frames into the ring until told to stop."""
+    # imported here so the parent never pays for the client when unused
+    from natnetclient_rough import NatNetClient
+
+    ring = SharedFrameRing(capacity, marker_count, name=ring_name)
+    header = ring.header
+    header[PID] = os.getpid()
+    header[HEARTBEAT] = time.perf_counter_ns()
+
+    stamps = _Stamps()
+    client = NatNetClient({**settings, "marker_set_labels": (label,)})
+    client.latency_log = stamps
+
+    def listener(frame_number: int, set_label: str, markers: np.ndarray) -> None:
+        if set_label != label or header[PAUSED]:
+            return
+
+        stats = client.frame_stats
+        header[RECEIVED] = stats["received"]
+        header[DROPPED] = stats["dropped"]
+        header[DUPLICATES] = stats["duplicates"]
+        header[REORDERED] = stats["reordered"]
+        header[GAPS] = stats["gaps"]
+        header[LARGEST_GAP] = stats["largest_gap"]
+        header[RESETS] = stats["resets"]
+
+        writes = ring.write(frame_number, markers, stamps.received_at, stamps.parsed_at)
+        notify.send_bytes(_notification.pack(writes))
+
+    client.marker_arrays_listener = listener
+
+    if not client.startup():
+        ring.close()
+        raise SystemExit(2)
+
+    resets = 0
+    try:
+        # a flag in shared memory rather than a multiprocessing.Event, whose
+        # lock would be left held if this process were killed mid-wait
+        while not header[STOP]:
+            time.sleep(heartbeat_interval)
+            header[HEARTBEAT] = time.perf_counter_ns()
+
+            # reset before resuming, so no frame after a resume carries the
+            # counters of the last trial (the client unpacks nothing while paused)
+            if header[RESET_STATS] != resets:
+                resets = int(header[RESET_STATS])
+                client.reset_frame_stats()
+
+            # mirror the parent's pause state, restarting continuity on resume
+            if header[PAUSED] and not client.paused:
+                client.pause()
+            elif not header[PAUSED] and client.paused:
+                client.resume()
+    finally:
+        client.shutdown()
+        notify.close()
+
+        # views into the block must be released before it can be closed
+        client.marker_arrays_listener = None
+        del listener, header
+        ring.close()
+
+
+class IngestProcess(object):
+    """
+    Runs NatNet receive and parse in a child process, delivering one marker set.
+
+    A parent-side thread wakes on each frame's notification, copies the frame
+    out of shared memory into a reused array, and calls
+    marker_arrays_listener(frame_number, label, positions) with it (copy it to
+    keep it), exactly as NatNetClient would. Frames the child overwrote before
+    or while they were copied are dropped and counted as torn.
+
+    The child is watched for crashes (exit while running) and stalls (no
+    heartbeat within heartbeat_timeout); either stops delivery, sets status, and
+    calls crash_listener(status, exitcode) if one is set.
+
+    Attributes:
+        status (str): "stopped", "running", "crashed" or "stalled"
+        exitcode (int): Child exit code once it has exited, else None
+        frame_stats (Dict[str, int]): Frame sequence counters from the child's
+            client, plus frames dropped here as torn
+        paused (bool): Whether frame delivery is paused
+
+    Methods:
+        startup(): Start the child process
+        pause(): Stop delivering frames, keeping the child running
+        resume(): Resume delivering frames
+        reset_frame_stats(): Zero the child's frame sequence counters
+        shutdown(): Stop the child and free shared memory
+    """
+
+    def __init__(
+        self,
+        instance_settings: Dict = {},
+        marker_count: int = 10,
+        label: str = "hand",
+        capacity: int = 1200,
+        heartbeat_interval: float = 0.01,
+        heartbeat_timeout: float = 2.0,
+        start_method: str = "spawn",
+    ):
+        """
+        Initialize the IngestProcess object.
+
+        Args:
+            instance_settings (Dict, optional): NatNetClient settings for the child
+            marker_count (int, optional): Markers stored per frame. Defaults to 10.
+            label (str, optional): Marker set delivered. Defaults to "hand".
+            capacity (int, optional): Frames held in the ring. Defaults to 1200.
+            heartbeat_interval (float, optional): Seconds between child heartbeats. Defaults to 0.01.
+            heartbeat_timeout (float, optional): Heartbeat age (s) treated as a stall. Defaults to 2.
+            start_method (str, optional): multiprocessing start method. Defaults to "spawn".
+        """
+        self.settings = dict(instance_settings)
+        self.marker_count = marker_count
+        self.label = label
+        self.capacity = capacity
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+
+        self.marker_arrays_listener = None
+        self.crash_listener = None
+        self.latency_log = None
+
+        self.__context = multiprocessing.get_context(start_method)
+        self.__ring = None
+        self.__process = None
+        self.__receiver = None
+        self.__watcher = None
+        self.__status = "stopped"
+        self.__paused = False
+        self.__torn = 0
+
+    @property
+    def status(self) -> str:
+        """Get the child's status."""
+        return self.__status
+
+    @property
+    def exitcode(self) -> Union[int, None]:
+        """Get the child's exit code, or None while it runs."""
+        return None if self.__process is None else self.__process.exitcode
+
+    @property
+    def paused(self) -> bool:
+        """Get whether frame delivery is paused."""
+        return self.__paused
+
+    @property
+    def frame_stats(self) -> Dict[str, int]:
+        """Get the child's frame sequence counters, and frames dropped as torn."""
+        header = self.__ring.header if self.__ring is not None else None
+        stats = {
+            name: 0 if header is None else int(header[slot])
+            for name, slot in (
+                ("received", RECEIVED),
+                ("dropped", DROPPED),
+                ("duplicates", DUPLICATES),
+                ("reordered", REORDERED),
+                ("gaps", GAPS),
+                ("largest_gap", LARGEST_GAP),
+                ("resets", RESETS),
+            )
+        }
+        stats["torn"] = self.__torn
+        return stats
+
+    def startup(self) -> bool:
+        """
+        Start the child process and the threads delivering its frames.
+
+        Returns:
+            bool: True once the child has started
+        """
+        if self.__status == "running":
+            return True
+
+        self.__ring = SharedFrameRing(self.capacity, self.marker_count)
+        self.__ring.header[PAUSED] = int(self.__paused)
+
+        receive, notify = self.__context.Pipe(duplex=False)
+
+        self.__process = self.__context.Process(
+            target=_ingest_main,
+            args=(
+                self.settings,
+                self.__ring.name,
+                self.capacity,
+                self.marker_count,
+                self.label,
+                notify,
+                self.heartbeat_interval,
+            ),
+            name="natnet-ingest",
+            daemon=True,
+        )
+        self.__process.start()
+
+        # only the child writes to the pipe; closing our copy lets recv() see EOF
+        notify.close()
+
+        self.__status = "running"
+        self.__receiver = threading.Thread(
+            target=self.__receive, args=(receive,), daemon=True
+        )
+        self.__receiver.start()
+        self.__watcher = threading.Thread(target=self.__watch, daemon=True)
+        self.__watcher.start()
+
+        return True
+
+    def pause(self) -> None:
+        """Stop delivering frames, keeping the child and its session alive."""
+        self.__paused = True
+        if self.__ring is not None:
+            self.__ring.header[PAUSED] = 1
+
+    def resume(self) -> None:
+        """Resume delivering frames."""
+        self.__paused = False
+        if self.__ring is not None:
+            self.__ring.header[PAUSED] = 0
+
+    def reset_frame_stats(self) -> None:
+        """Ask the child to zero its frame sequence counters."""
+        self.__torn = 0
+        if self.__ring is not None:
+            header = self.__ring.header
+            header[RECEIVED:RESET_STATS] = 0
+            header[RESET_STATS] += 1
+
+    def shutdown(self, timeout: float = 2.0) -> None:
+        """
+        Stop the child, waiting up to timeout seconds before terminating it,
+        then free shared memory.
+        """
+        if self.__process is None:
+            return
+
+        if self.__status == "running":
+            self.__status = "stopped"
+
+        self.__ring.header[STOP] = 1
+        self.__process.join(timeout)
+
+        if self.__process.is_alive():
+            self.__process.terminate()
+            self.__process.join(timeout)
+
+        for thread in (self.__receiver, self.__watcher):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout)
+
+        self.__ring.close()
+        self.__ring.unlink()
+        self.__ring = None
+
+    def __receive(self, receive) -> None:
+        """Parent thread: deliver each frame the child announces."""
+        ring = self.__ring
+        delivered = ring.writes
+        positions = np.empty((ring.marker_count, 3))
+
+        while self.__status == "running":
+            try:
+                (written,) = _notification.unpack(receive.recv_bytes())
+            except (EOFError, OSError):
+                break
+
+            # several frames may land per wake-up; skip any the child has lapped
+            lapped = written - ring.capacity + 1 - delivered
+            if lapped > 0:
+                self.__torn += lapped
+                delivered += lapped
+
+            while delivered < written:
+                delivered += 1
+                frame_number, stamps, shared = ring.frame(delivered)
+                received, parsed = int(stamps[0]), int(stamps[1])
+                np.copyto(positions, shared)
+
+                # the child may have reused the slot while it was copied
+                if ring.overwritten(delivered):
+                    self.__torn += 1
+                    continue
+
+                latency_log = self.latency_log
+                if latency_log is not None:
+                    latency_log.received(received)
+                    latency_log.begin(frame_number)
+                    latency_log.stamp(PARSE, parsed)
+
+                listener = self.marker_arrays_listener
+                if listener is not None and not self.__paused:
+                    listener(frame_number, self.label, positions)
+
+        receive.close()
+
+    def __watch(self) -> None:
+        """Parent thread: flag the child as crashed or stalled."""
+        header = self.__ring.header
+
+        while self.__status == "running":
+            self.__process.join(self.heartbeat_timeout / 4)
+
+            if self.__status != "running":
+                break
+
+            if not self.__process.is_alive():
+                self.__fail("crashed")
+            elif (
+                header[HEARTBEAT]
+                and time.perf_counter_ns() - header[HEARTBEAT]
+                > self.heartbeat_timeout * 1e9
+            ):
+                self.__fail("stalled")
+
+    def __fail(self, status: str) -> None:
+        self.__status = status
+        print(f"ERROR: NatNet ingest process {status} (exit code {self.exitcode})")
+
+        if self.crash_listener is not None:
+            self.crash_listener(status, self.exitcode)
@@ -0,0 +1,433 @@
+import numpy as np
+from functools import lru_cache
+from math import factorial
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Dict, Tuple, Union
+
+from ButterworthFilter import filtfilt
+
+
+@lru_cache(maxsize=64)
+def derivative_filter(
+    offsets: Tuple[int, ...], order: int, sample_rate: float
+) -> np.ndarray:
+    """
+    Least-squares polynomial (Savitzky-Golay style) derivative weights.
+
+    Fits a polynomial of the given order through samples taken at the given
+    frame offsets from the newest sample, and returns the weights that map the
+    samples to the polynomial's value and derivatives at the newest sample.
+    Cached per offset pattern, so contiguous streams reuse one matrix and gaps
+    in frame numbers only cost a fit the first time each pattern is seen.
+
+    Args:
+        offsets (Tuple[int, ...]): Frame offsets of each sample from the newest (<= 0)
+        order (int): Polynomial order; must be below the number of samples
+        sample_rate (float): Frames per second, converting offsets to seconds
+
+    Returns:
+        np.ndarray: [order + 1, samples] weights; row k gives the k-th derivative
+    """
+    t = np.asarray(offsets, dtype=float) / sample_rate
+    k = np.arange(order + 1)
+
+    # Taylor basis about the newest sample, so coefficient k is the k-th derivative
+    basis = t[:, None] ** k / np.array([factorial(i) for i in k])
+
+    weights = np.linalg.pinv(basis)
+    weights.setflags(write=False)
+    return weights
+
+
+class KinematicsEstimator(object):
+    """
+    Incrementally estimates marker velocity, acceleration and jerk.
+
+    Each update() fits a local polynomial to the last window frames of every
+    marker at once, using real frame timestamps derived from frame numbers, so
+    dropped frames stretch the time base rather than skewing the estimate.
+    The centroid's estimates average those of the markers seen in every frame
+    of the window, so a marker dropping out or reappearing never steps it.
+    Reading the current values is constant time.
+
+    Attributes:
+        frame_number (int): Frame number of the latest update (-1 before any)
+        velocity (np.ndarray): [markers, 3] velocity in input units per second
+        acceleration (np.ndarray): [markers, 3] acceleration
+        jerk (np.ndarray): [markers, 3] jerk
+        speed (np.ndarray): [markers] magnitude of velocity
+        centroid_velocity (np.ndarray): [3] velocity of the marker centroid
+        centroid_acceleration (np.ndarray): [3] acceleration of the marker centroid
+        centroid_jerk (np.ndarray): [3] jerk of the marker centroid
+
+    Methods:
+        update(frame_number, positions): Add a frame and refresh the estimates
+        reset(): Discard all history
+    """
+
+    def __init__(
+        self, marker_count: int, sample_rate: float, window: int = 5, order: int = 3
+    ):
+        """
+        Initialize the KinematicsEstimator object.
+
+        Args:
+            marker_count (int): Number of markers per frame
+            sample_rate (float): Sampling rate in Hz
+            window (int, optional): Frames used in each local fit. Defaults to 5.
+            order (int, optional): Polynomial order (3 for jerk). Defaults to 3.
+        """
+        if window < 2:
+            raise ValueError("Window must cover at least two frames.")
+
+        if not 1 <= order <= 3:
+            raise ValueError("Order must be between one and three.")
+
+        if order >= window:
+            raise ValueError("Window must hold more frames than the order.")
+
+        self.__marker_count = marker_count
+        self.__sample_rate = sample_rate
+        self.__window = window
+        self.__order = order
+
+        # history of [markers, 3] positions, oldest first
+        self.__frames = np.zeros(window, dtype=np.int64)
+        self.__history = np.full((window, marker_count, 3), np.nan)
+        self.__filled = 0
+
+        self.__derivatives = np.full((4, marker_count + 1, 3), np.nan)
+        self.__frame_number = -1
+
+    @property
+    def frame_number(self) -> int:
+        """Get the frame number of the latest update."""
+        return self.__frame_number
+
+    @property
+    def velocity(self) -> np.ndarray:
+        """Get the current velocity of each marker."""
+        return self.__derivatives[1, :-1].copy()
+
+    @property
+    def acceleration(self) -> np.ndarray:
+        """Get the current acceleration of each marker."""
+        return self.__derivatives[2, :-1].copy()
+
+    @property
+    def jerk(self) -> np.ndarray:
+        """Get the current jerk of each marker."""
+        return self.__derivatives[3, :-1].copy()
+
+    @property
+    def speed(self) -> np.ndarray:
+        """Get the current speed of each marker."""
+        return np.linalg.norm(self.__derivatives[1, :-1], axis=1)
+
+    @property
+    def centroid_velocity(self) -> np.ndarray:
+        """Get the current velocity of the marker centroid."""
+        return self.__derivatives[1, -1].copy()
+
+    @property
+    def centroid_acceleration(self) -> np.ndarray:
+        """Get the current acceleration of the marker centroid."""
+        return self.__derivatives[2, -1].copy()
+
+    @property
+    def centroid_jerk(self) -> np.ndarray:
+        """Get the current jerk of the marker centroid."""
+        return self.__derivatives[3, -1].copy()
+
+    def update(self, frame_number: int, positions: np.ndarray) -> None:
+        """
+        Add a frame and refresh the estimates.
+
+        Args:
+            frame_number (int): Frame number reported by the tracking system
+            positions (np.ndarray): [n_markers, 3] marker positions; missing markers NaN
+        """
+        n = min(len(positions), self.__marker_count)
+
+        sample = np.full((self.__marker_count, 3), np.nan)
+        sample[:n] = positions[:n]
+
+        # shift history; the window is small, so this is cheaper than ring indexing
+        self.__frames[:-1] = self.__frames[1:]
+        self.__frames[-1] = frame_number
+        self.__history[:-1] = self.__history[1:]
+        self.__history[-1] = sample
+        self.__filled = min(self.__filled + 1, self.__window)
+
+        samples = self.__filled
+        order = min(self.__order, samples - 1)
+
+        derivatives = np.full_like(self.__derivatives, np.nan)
+        derivatives[0, :-1] = sample
+
+        if order > 0:
+            offsets = tuple((self.__frames[-samples:] - frame_number).tolist())
+            weights = derivative_filter(offsets, order, self.__sample_rate)
+
+            # one contraction fits every marker and axis at once
+            derivatives[: order + 1, :-1] = np.tensordot(
+                weights, self.__history[-samples:], axes=1
+            )
+
+        # the fit is linear, so averaging the fits of a fixed set of markers
+        # fits their average, without the steps of averaging whoever is visible
+        steady = ~np.isnan(self.__history[-samples:]).any(axis=(0, 2))
+        if steady.any():
+            derivatives[:, -1] = derivatives[:, :-1][:, steady].mean(axis=1)
+
+        # replace rather than mutate, so readers never see a partial update
+        self.__derivatives = derivatives
+        self.__frame_number = frame_number
+
+    def reset(self) -> None:
+        """Discard all history, e.g. between trials."""
+        self.__history[:] = np.nan
+        self.__filled = 0
+        self.__derivatives = np.full_like(self.__derivatives, np.nan)
+        self.__frame_number = -1
+
+
+def kabsch(
+    reference: np.ndarray, current: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Best-fit rigid transform from a reference marker layout to each frame.
+
+    Solves the (weighted) Kabsch problem for every frame at once with a
+    stacked SVD. Markers missing (NaN) from the reference or from a frame are
+    left out of that frame's fit; frames with fewer than three markers in
+    common with the reference come out as NaN.
+
+    Args:
+        reference (np.ndarray): [markers, 3] reference positions
+        current (np.ndarray): [frames, markers, 3] (or [markers, 3]) positions to fit
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Rotations [frames, 3, 3] and
+            translations [frames, 3] such that current ~= R @ reference + t, and the
+            RMS residual of each fit [frames].
+    """
+    current = np.asarray(current, dtype=float)
+    single = current.ndim == 2
+    if single:
+        current = current[None]
+
+    reference = np.asarray(reference, dtype=float)[None]
+
+    weights = (
+        ~np.isnan(reference).any(axis=2) & ~np.isnan(current).any(axis=2)
+    ).astype(float)
+    counts = weights.sum(axis=1)
+
+    ref = np.where(weights[..., None] > 0, reference, 0)
+    cur = np.where(weights[..., None] > 0, current, 0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ref_centroid = ref.sum(axis=1) / counts[:, None]
+        cur_centroid = cur.sum(axis=1) / counts[:, None]
+
+    p = (ref - ref_centroid[:, None]) * weights[..., None]
+    q = (cur - cur_centroid[:, None]) * weights[..., None]
+
+    covariance = np.einsum("fmi,fmj->fij", p, q)
+    covariance[counts < 3] = 0
+
+    u, _, vt = np.linalg.svd(covariance)
+
+    # flip the weakest axis where needed so the result is a rotation, not a reflection
+    correction = np.ones((len(current), 3))
+    correction[:, 2] = np.sign(np.linalg.det(np.einsum("fji,fkj->fik", vt, u)))
+    correction[correction == 0] = 1
+
+    rotations = np.einsum("fji,fj,fkj->fik", vt, correction, u)
+    translations = cur_centroid - np.einsum("fij,fj->fi", rotations, ref_centroid)
+
+    residuals = q - np.einsum("fij,fmj->fmi", rotations, p) * weights[..., None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rmsd = np.sqrt((residuals**2).sum(axis=(1, 2)) / counts)
+
+    degenerate = counts < 3
+    rotations[degenerate] = np.nan
+    translations[degenerate] = np.nan
+    rmsd[degenerate] = np.nan
+
+    if single:
+        return rotations[0], translations[0], rmsd[0]
+
+    return rotations, translations, rmsd
+
+
+# Keys of movement_summary(); all NaN when no movement is found
+MOVEMENT_SUMMARY_KEYS = (
+    "reaction_time",
+    "movement_time",
+    "peak_velocity",
+    "time_to_peak_velocity",
+    "path_length",
+    "endpoint_error",
+)
+
+
+def movement_summary(
+    frame_numbers: np.ndarray,
+    centroids: np.ndarray,
+    sample_rate: float,
+    start_frame: Union[int, None] = None,
+    target: Union[np.ndarray, None] = None,
+    onset_threshold: float = 5.0,
+    offset_threshold: float = 2.5,
+    onset_frames: int = 3,
+    offset_frames: int = 6,
+    filter_order: int = 2,
+    filter_cutoff: float = 10.0,
+) -> Dict[str, float]:
+    """
+    Summarise the first movement in a trial's centroid trajectory, offline.
+
+    The trajectory is first placed on a regular frame grid (dropped frames and
+    occluded centroids interpolated), then low-passed with a zero-phase
+    Butterworth filter, and speed taken by central differences. Onset and
+    offset follow the same rules as MovementDetector: speed at or above
+    onset_threshold for onset_frames frames, then below offset_threshold for
+    offset_frames frames, with crossing times interpolated between frames.
+
+    Args:
+        frame_numbers (np.ndarray): [frames] increasing frame numbers
+        centroids (np.ndarray): [frames, 3] positions (cm), NaN where occluded
+        sample_rate (float): Sampling rate in Hz
+        start_frame (int, optional): Frame at which the go signal was shown, for
+            reaction time. Defaults to None (the first frame).
+        target (np.ndarray, optional): [3] target position; NaN components are
+            ignored (e.g. height, for a target on a plane). Defaults to None.
+        onset_threshold (float, optional): Onset speed (cm/s). Defaults to 5.
+        offset_threshold (float, optional): Offset speed (cm/s). Defaults to 2.5.
+        onset_frames (int, optional): Frames needed to confirm onset. Defaults to 3.
+        offset_frames (int, optional): Frames needed to confirm offset. Defaults to 6.
+        filter_order (int, optional): Order of the smoothing filter. Defaults to 2.
+        filter_cutoff (float, optional): Cutoff of the smoothing filter in Hz. Defaults to 10.
+
+    Returns:
+        Dict[str, float]: In seconds, cm and cm/s:
+            reaction_time: Go signal to movement onset
+            movement_time: Onset to offset (NaN if the movement never stops)
+            peak_velocity: Peak speed between onset and offset
+            time_to_peak_velocity: Onset to peak speed
+            path_length: Distance travelled between onset and offset
+            endpoint_error: Distance from the target at offset (NaN without a target)
+    """
+    summary = dict.fromkeys(MOVEMENT_SUMMARY_KEYS, np.nan)
+
+    frame_numbers = np.asarray(frame_numbers)
+    visible = ~np.isnan(centroids).any(axis=1)
+    if visible.sum() < 2:
+        return summary
+
+    grid = np.arange(frame_numbers[0], frame_numbers[-1] + 1)
+    path = np.column_stack(
+        [
+            np.interp(grid, frame_numbers[visible], centroids[visible, k])
+            for k in range(3)
+        ]
+    )
+
+    # the dual pass needs a few filter lengths of padding either side
+    if len(grid) > 3 * (filter_order + 2):
+        path = filtfilt(path, filter_order, filter_cutoff, sample_rate)
+
+    time = grid / sample_rate
+    speed = np.linalg.norm(np.gradient(path, time, axis=0), axis=1)
+
+    onset = _sustained(speed >= onset_threshold, onset_frames)
+    if onset < 0:
+        return summary
+
+    offset = _sustained(speed[onset:] < offset_threshold, offset_frames)
+    offset = onset + offset if offset >= 0 else -1
+    end = offset if offset >= 0 else len(speed) - 1
+
+    onset_time = _crossing(time, speed, onset, onset_threshold)
+    peak = onset + int(np.argmax(speed[onset : end + 1]))
+
+    if start_frame is None:
+        start_frame = frame_numbers[0]
+
+    summary["reaction_time"] = onset_time - start_frame / sample_rate
+    summary["peak_velocity"] = float(speed[peak])
+    summary["time_to_peak_velocity"] = float(time[peak]) - onset_time
+
+    if offset < 0:
+        return summary
+
+    summary["movement_time"] = (
+        _crossing(time, speed, offset, offset_threshold) - onset_time
+    )
+    summary["path_length"] = float(
+        np.linalg.norm(np.diff(path[onset : offset + 1], axis=0), axis=1).sum()
+    )
+
+    if target is not None:
+        error = path[offset] - np.asarray(target, dtype=float)
+        summary["endpoint_error"] = float(np.sqrt(np.nansum(error**2)))
+
+    return summary
+
+
+def trial_centroids(frame_numbers: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """
+    Marker centroid of every frame, averaged over the same markers throughout.
+
+    Averaging whichever markers are visible in each frame makes the centroid
+    step whenever one is occluded or reappears. Instead, the markers seen in
+    every frame are averaged if there are any; otherwise every marker seen at
+    all is interpolated across its occlusions (held at its first or last
+    sample at either end) before averaging.
+
+    Args:
+        frame_numbers (np.ndarray): [frames] increasing frame numbers
+        positions (np.ndarray): [frames, markers, 3] positions, NaN where occluded
+
+    Returns:
+        np.ndarray: [frames, 3] centroids; NaN throughout if no marker was seen
+    """
+    valid = ~np.isnan(positions).any(axis=2)
+
+    steady = valid.all(axis=0)
+    if steady.any():
+        return positions[:, steady].mean(axis=1)
+
+    seen = np.flatnonzero(valid.any(axis=0))
+    if len(seen) == 0:
+        return np.full((len(frame_numbers), 3), np.nan)
+
+    filled = np.empty((len(frame_numbers), len(seen), 3))
+    for i, marker in enumerate(seen):
+        rows = valid[:, marker]
+        for k in range(3):
+            filled[:, i, k] = np.interp(
+                frame_numbers, frame_numbers[rows], positions[rows, marker, k]
+            )
+
+    return filled.mean(axis=1)
+
+
+def _sustained(mask: np.ndarray, frames: int) -> int:
+    """Index of the first run of at least frames True values, or -1."""
+    if len(mask) < frames:
+        return -1
+
+    runs = np.flatnonzero(sliding_window_view(mask, frames).all(axis=1))
+    return int(runs[0]) if len(runs) else -1
+
+
+def _crossing(time: np.ndarray, speed: np.ndarray, i: int, threshold: float) -> float:
+    """Interpolate when speed crossed threshold between samples i - 1 and i."""
+    if i == 0 or speed[i] == speed[i - 1]:
+        return float(time[i])
+
+    fraction = (threshold - speed[i - 1]) / (speed[i] - speed[i - 1])
+    return float(time[i - 1] + min(max(fraction, 0.0), 1.0) * (time[i] - time[i - 1]))
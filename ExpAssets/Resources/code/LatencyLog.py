@@ -0,0 +1,237 @@
+import json
+import numpy as np
+from time import perf_counter_ns
+from typing import Dict
+
+# Pipeline stages, in the order a frame passes through them
+RECV, PARSE, INGEST, READ, FLIP = range(5)
+STAGES = ("recv", "parse", "ingest", "read", "flip")
+
+# Intervals summarised per trial, as (name, from stage, to stage)
+INTERVALS = (
+    ("recv_to_parse", RECV, PARSE),
+    ("parse_to_ingest", PARSE, INGEST),
+    ("ingest_to_read", INGEST, READ),
+    ("read_to_flip", READ, FLIP),
+    ("recv_to_flip", RECV, FLIP),
+)
+
+
+class LatencyLog(object):
+    """
+    Per-frame timestamps through the motion-to-photon pipeline.
+
+    Each frame gets one row in a preallocated array, stamped (perf_counter_ns)
+    when its packet is received, parsed, ingested by the tracker, read by the
+    render loop, and shown by flip(). Stamping is a single array store, and
+    nothing allocates while a trial runs; frames beyond capacity are counted
+    rather than logged. Instrumentation is switched off by not attaching a log
+    (each call site checks for None), which costs one comparison per frame.
+
+    The data thread calls received(), begin(), and stamp(); the render loop
+    calls read() and flipped(). Each side writes only its own stages.
+
+    Attributes:
+        capacity (int): Maximum number of frames logged per trial
+        frame_count (int): Frames logged since last clear
+        overflow (int): Frames not logged because the log was full
+
+    Methods:
+        received(): Note the arrival time of the packet being processed
+        begin(frame_number): Open a row for a frame, carrying over its arrival time
+        stamp(stage): Stamp a stage of the current frame
+        read(frame_number): Stamp the render loop reading a frame
+        flipped(): Stamp the flip showing the last frame read
+        stamps(): Get the logged rows as a structured array
+        summary(): Summarise latencies, drops and frame-number gaps
+        write(path): Write raw stamps (.npy) and summary (.json) for a trial
+        clear(): Discard all rows, e.g. between trials
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Initialize the LatencyLog object.
+
+        Args:
+            capacity (int): Maximum number of frames logged per trial
+        """
+        if capacity < 1:
+            raise ValueError("Log capacity must be at least one frame.")
+
+        self.__capacity = capacity
+        self.__frame_numbers = np.zeros(capacity, dtype=np.int64)
+        self.__stamps = np.zeros((capacity, len(STAGES)), dtype=np.int64)
+
+        self.clear()
+
+    @property
+    def capacity(self) -> int:
+        """Get the maximum number of frames logged per trial."""
+        return self.__capacity
+
+    @property
+    def frame_count(self) -> int:
+        """Get the number of frames logged since last clear."""
+        return self.__count
+
+    @property
+    def overflow(self) -> int:
+        """Get the number of frames not logged because the log was full."""
+        return self.__overflow
+
+    def received(self, timestamp: int = 0) -> None:
+        """
+        Note the arrival time of the packet being processed.
+
+        Args:
+            timestamp (int, optional): perf_counter_ns taken elsewhere (e.g. by
+                another process). Defaults to now.
+        """
+        self.__received = timestamp or perf_counter_ns()
+
+    def begin(self, frame_number: int) -> None:
+        """
+        Open a row for a frame, carrying over the arrival time of its packet.
+
+        Args:
+            frame_number (int): Frame number reported by the tracking system
+        """
+        row = self.__count
+
+        if row >= self.__capacity:
+            self.__overflow += 1
+            self.__row = -1
+            return
+
+        self.__frame_numbers[row] = frame_number
+        self.__stamps[row] = 0
+        self.__stamps[row, RECV] = self.__received
+        self.__row = row
+
+        # publish the row only once it is complete, for read()
+        self.__count = row + 1
+
+    def stamp(self, stage: int, timestamp: int = 0) -> None:
+        """
+        Stamp a stage of the current frame, if not already stamped.
+
+        Args:
+            stage (int): One of PARSE or INGEST
+            timestamp (int, optional): perf_counter_ns taken elsewhere. Defaults to now.
+        """
+        row = self.__row
+        if row >= 0 and self.__stamps[row, stage] == 0:
+            self.__stamps[row, stage] = timestamp or perf_counter_ns()
+
+    def read(self, frame_number: int) -> None:
+        """
+        Stamp the render loop reading a frame, the first time it is read.
+
+        Args:
+            frame_number (int): Frame number of the frame read
+        """
+        count = self.__count
+        if count == 0:
+            return
+
+        # almost always the newest row; otherwise search the (increasing) frame numbers
+        row = count - 1
+        if self.__frame_numbers[row] != frame_number:
+            row = int(np.searchsorted(self.__frame_numbers[:count], frame_number))
+            if row == count or self.__frame_numbers[row] != frame_number:
+                self.__shown = -1
+                return
+
+        if self.__stamps[row, READ] == 0:
+            self.__stamps[row, READ] = perf_counter_ns()
+            self.__shown = row
+        else:
+            # already displayed; a stale read, not a new frame
+            self.__shown = -1
+
+    def flipped(self) -> None:
+        """Stamp the flip showing the last frame read."""
+        if self.__shown >= 0:
+            self.__stamps[self.__shown, FLIP] = perf_counter_ns()
+            self.__shown = -1
+
+    def stamps(self) -> np.ndarray:
+        """
+        Get the logged rows.
+
+        Returns:
+            np.ndarray: Structured array with a frame_number field and one
+                nanosecond field per stage (0 where a stage never happened).
+        """
+        count = self.__count
+        rows = np.zeros(
+            count, dtype=[("frame_number", "i8")] + [(s, "i8") for s in STAGES]
+        )
+        rows["frame_number"] = self.__frame_numbers[:count]
+        for i, stage in enumerate(STAGES):
+            rows[stage] = self.__stamps[:count, i]
+
+        return rows
+
+    def summary(self) -> Dict[str, object]:
+        """
+        Summarise the trial's latencies, drops and frame-number gaps.
+
+        Returns:
+            Dict[str, object]: p50/p95/p99 (ms) for each interval, plus counts of
+                frames logged, displayed and never displayed, log overflow, and
+                frame numbers missing from the stream.
+        """
+        count = self.__count
+        stamps = self.__stamps[:count]
+        frame_numbers = self.__frame_numbers[:count]
+
+        summary = {
+            "frames": count,
+            "displayed": int((stamps[:, FLIP] > 0).sum()),
+            "undisplayed": int((stamps[:, READ] == 0).sum()),
+            "overflow": self.__overflow,
+        }
+
+        steps = np.diff(frame_numbers)
+        summary["frame_gaps"] = int((steps > 1).sum())
+        summary["frames_missing"] = int(np.clip(steps - 1, 0, None).sum())
+        summary["frames_out_of_order"] = int((steps <= 0).sum())
+
+        for name, start, end in INTERVALS:
+            both = (stamps[:, start] > 0) & (stamps[:, end] > 0)
+            intervals = (stamps[both, end] - stamps[both, start]) / 1e6
+
+            if len(intervals):
+                p50, p95, p99 = np.percentile(intervals, [50, 95, 99])
+            else:
+                p50 = p95 = p99 = float("nan")
+
+            summary[name] = {
+                "n": int(both.sum()),
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+            }
+
+        return summary
+
+    def write(self, path: str) -> None:
+        """
+        Write the raw stamps to path.npy and the summary to path.json.
+
+        Args:
+            path (str): Output path, without extension
+        """
+        np.save(f"{path}.npy", self.stamps())
+
+        with open(f"{path}.json", "w") as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def clear(self) -> None:
+        """Discard all rows, e.g. between trials."""
+        self.__count = 0
+        self.__overflow = 0
+        self.__received = 0
+        self.__row = -1
+        self.__shown = -1
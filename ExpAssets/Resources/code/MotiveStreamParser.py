@@ -1,35 +1,200 @@
 # type: ignore
-from typing import Union, Container
-from dataStructures import unlabeledMarkerStruct, labeledMarkerStruct, rigidBodyStruct
-from construct import Int32ul, CString
+import struct
+import numpy as np
+from typing import Dict, NamedTuple, Tuple, Union, Container
+from dataStructures import (
+    unlabeledMarkerStruct,
+    labeledMarkerStruct,
+    rigidBodyStruct,
+    frameSuffixStruct,
+)
+from construct import Float32l, Int32sl, Int32ul, CString
+
+# Precompiled decoders for the fast path
+_uint32 = struct.Struct("<I")
+_int32 = struct.Struct("<i")
+_frame_suffix = struct.Struct("<IIdQQQIIh")
+_suffix_fields = tuple(sub.name for sub in frameSuffixStruct.subcons)[:9]
+
+# Packed record layouts, matching the construct definitions in dataStructures
+rigid_body_dtype = np.dtype(
+    [
+        ("id", "<i4"),
+        ("pos_x", "<f4"),
+        ("pos_y", "<f4"),
+        ("pos_z", "<f4"),
+        ("rot_x", "<f4"),
+        ("rot_y", "<f4"),
+        ("rot_z", "<f4"),
+        ("rot_w", "<f4"),
+        ("error", "<f4"),
+        ("tracking", "<i2"),
+    ]
+)
+
+# id packs the model ID (high 16 bits) and marker ID (low 16 bits)
+labeled_marker_dtype = np.dtype(
+    [
+        ("id", "<u4"),
+        ("pos_x", "<f4"),
+        ("pos_y", "<f4"),
+        ("pos_z", "<f4"),
+        ("size", "<f4"),
+        ("param", "<i2"),
+        ("residual", "<f4"),
+    ]
+)
+
+# Sections following the marker sets, in packet order (NatNet 4.1)
+SECTION_NAMES = (
+    "legacy_markers",
+    "rigid_bodies",
+    "skeletons",
+    "assets",
+    "labeled_markers",
+    "force_plates",
+    "devices",
+)
+
+RECORD_DTYPES = {
+    "rigid_body": rigid_body_dtype,
+    "labeled_marker": labeled_marker_dtype,
+}
+
+# NatNet caps asset names at 256 bytes (incl. terminator)
+MAX_LABEL_LENGTH = 256
+
+
+class FrameIndex(NamedTuple):
+    """
+    Where each part of a frame packet lives, found without decoding any of it.
+
+    Offsets are absolute positions in the packet buffer, for seek_to().
+
+    Attributes:
+        frame_number (int): Frame number of the packet
+        marker_sets (Tuple[Tuple[str, int, int], ...]): (label, offset, marker
+            count) of each marker set's positions, in stream order; labels are
+            not guaranteed unique, so every set is kept
+        sections (Dict[str, Tuple[int, int, int]]): (offset, count, byte size) of
+            each section's data, keyed by SECTION_NAMES; empty if not indexed
+        end (int): Offset just past the last indexed part
+    """
+
+    frame_number: int
+    marker_sets: Tuple[Tuple[str, int, int], ...]
+    sections: Dict[str, Tuple[int, int, int]]
+    end: int
 
 
 class MotiveStreamParser(object):
-    def __init__(self, stream: bytes):
+    """
+    Sequential reader over a NatNet packet.
+
+    By default fixed-width fields are decoded with precompiled struct.Struct
+    objects and marker blocks with a single np.frombuffer call. Passing
+    fast=False decodes everything through the construct definitions in
+    dataStructures instead; that path is slower but serves as the reference
+    implementation for validating the fast one.
+
+    The stream may be any buffer (e.g. a reused receive bytearray); parsing
+    starts at offset and never copies the packet.
+    """
+
+    def __init__(self, stream: bytes, fast: bool = True, offset: int = 0):
         self.__stream = memoryview(stream)
-        self.__offset = 0
+        self.__offset = offset
+        self.__fast = fast
 
         self.__structures = {
             "label": CString("utf8"),
             "size": Int32ul,
             "count": Int32ul,
             "frame_number": Int32ul,
+            "id": Int32sl,
+            "float": Float32l,
+            "frame_suffix": frameSuffixStruct,
             "unlabeled_marker": unlabeledMarkerStruct,
             "legacy_marker": unlabeledMarkerStruct,
             "labeled_marker": labeledMarkerStruct,
             "rigid_body": rigidBodyStruct,
         }
 
+    @property
+    def fast(self) -> bool:
+        return self.__fast
+
     def seek(self, by: int) -> None:
         self.__offset += by
 
     def tell(self) -> int:
         return self.__offset
 
+    def seek_to(self, offset: int) -> None:
+        self.__offset = offset
+
+    def index(self, sections: bool = True) -> FrameIndex:
+        """
+        Index a frame packet starting at the current offset (its frame number).
+
+        Walks only labels and the count/size fields, jumping over marker blocks
+        and whole sections, so consumers can decode just the parts they want.
+        The current offset is left unchanged.
+
+        Args:
+            sections (bool, optional): Also index the sections after the marker
+                sets. Defaults to True.
+
+        Returns:
+            FrameIndex: Frame number and the location of each marker set and section
+        """
+        start = self.__offset
+
+        frame_number = self.parse("frame_number")
+        n_marker_sets = self.parse("count")
+        size = self.parse("size")
+        marker_sets_end = self.__offset + size
+
+        marker_sets = []
+        for _ in range(n_marker_sets):
+            label = self.parse("label")
+            count = self.parse("count")
+            marker_sets.append((label, self.__offset, count))
+            self.seek(count * 12)
+
+        self.__offset = marker_sets_end
+
+        section_index = {}
+        if sections:
+            for name in SECTION_NAMES:
+                count = self.parse("count")
+                size = self.parse("size")
+                section_index[name] = (self.__offset, count, size)
+                self.seek(size)
+
+        end = self.__offset
+        self.__offset = start
+
+        return FrameIndex(frame_number, tuple(marker_sets), section_index, end)
+
     def sizeof(self, asset_type: str, asset_count: int = 1) -> int:
         return self.__structures[asset_type].sizeof() * asset_count
 
     def parse(self, asset_type: str) -> Union[str, int, Container]:
+        if self.__fast:
+            if asset_type in ("size", "count", "frame_number"):
+                (contents,) = _uint32.unpack_from(self.__stream, self.__offset)
+                self.seek(4)
+                return contents
+
+            if asset_type == "id":
+                (contents,) = _int32.unpack_from(self.__stream, self.__offset)
+                self.seek(4)
+                return contents
+
+            if asset_type == "label":
+                return self.__parse_label()
+
         struct = self.__structures[asset_type]
         contents = struct.parse(self.__stream[self.__offset :])
 
@@ -39,3 +204,83 @@ class MotiveStreamParser(object):
             self.seek(struct.sizeof())
 
         return contents
+
+    def parse_markers(self, count: int) -> np.ndarray:
+        """
+        Decode a block of count unlabeled markers into a [count, 3] float32 array.
+
+        On the fast path the array is a view onto the packet buffer, so it must be
+        copied if it is kept beyond the lifetime of the packet.
+        """
+        if self.__fast:
+            markers = np.frombuffer(
+                self.__stream, dtype="<f4", count=count * 3, offset=self.__offset
+            ).reshape(count, 3)
+            self.seek(markers.nbytes)
+            return markers
+
+        markers = np.empty((count, 3), dtype="<f4")
+        for i in range(count):
+            marker = self.parse("unlabeled_marker")
+            markers[i] = marker.pos_x, marker.pos_y, marker.pos_z
+
+        return markers
+
+    def parse_records(self, asset_type: str, count: int) -> np.ndarray:
+        """
+        Decode count fixed-size records ("rigid_body" or "labeled_marker") into a
+        structured array with the fields of RECORD_DTYPES[asset_type].
+
+        On the fast path the array is a view onto the packet buffer, so it must be
+        copied if it is kept beyond the lifetime of the packet.
+        """
+        dtype = RECORD_DTYPES[asset_type]
+
+        if self.__fast:
+            records = np.frombuffer(
+                self.__stream, dtype=dtype, count=count, offset=self.__offset
+            )
+            self.seek(records.nbytes)
+            return records
+
+        records = np.empty(count, dtype=dtype)
+        for i in range(count):
+            record = self.parse(asset_type)
+            records[i] = tuple(record[name] for name in dtype.names)
+
+        return records
+
+    def parse_floats(self, count: int) -> np.ndarray:
+        """Decode count float32 values (e.g. force plate or device channel samples)."""
+        if self.__fast:
+            floats = np.frombuffer(
+                self.__stream, dtype="<f4", count=count, offset=self.__offset
+            )
+            self.seek(floats.nbytes)
+            return floats
+
+        return np.array([self.parse("float") for _ in range(count)], dtype="<f4")
+
+    def parse_suffix(self) -> Dict[str, Union[int, float, bool]]:
+        """Decode the frame suffix (timecode, timestamps and frame parameters)."""
+        if not self.__fast:
+            suffix = self.parse("frame_suffix")
+            return {k: v for k, v in suffix.items() if not k.startswith("_")}
+
+        fields = _frame_suffix.unpack_from(self.__stream, self.__offset)
+        self.seek(_frame_suffix.size)
+
+        suffix = dict(zip(_suffix_fields, fields))
+        suffix["is_recording"] = (suffix["param"] & 0x01) != 0
+        suffix["tracked_models_changed"] = (suffix["param"] & 0x02) != 0
+        return suffix
+
+    def __parse_label(self) -> str:
+        window = bytes(self.__stream[self.__offset : self.__offset + MAX_LABEL_LENGTH])
+        end = window.find(b"\0")
+
+        if end < 0:
+            raise ValueError("Unterminated label in packet.")
+
+        self.seek(end + 1)
+        return window[:end].decode("utf8")
@@ -0,0 +1,231 @@
+import numpy as np
+from typing import Callable, Union
+
+IDLE = "idle"
+MOVING = "moving"
+
+
+class MovementDetector(object):
+    """
+    Detects movement onset, offset and target entry as frames arrive.
+
+    Each update() costs a handful of comparisons, so events are raised on the
+    thread delivering frames, within the frame that triggers them. Onset and
+    offset use separate speed thresholds (hysteresis) and must hold for a
+    number of consecutive frames; their times are interpolated to the moment
+    speed crossed the threshold, so they resolve finer than one frame.
+
+    Times are in seconds on the tracker's clock (frame_number / sample_rate).
+
+    Attributes:
+        sample_rate (float): Sampling rate in Hz
+        onset_threshold (float): Speed at or above which movement starts
+        offset_threshold (float): Speed below which movement stops
+        onset_frames (int): Consecutive frames above threshold needed for onset
+        offset_frames (int): Consecutive frames below threshold needed for offset
+        target (Callable): Predicate taking a [3] position, True when inside the target
+        state (str): "idle" or "moving"
+        onset_time (float): Time of the latest movement onset (NaN if none)
+        offset_time (float): Time of the latest movement offset (NaN if none)
+        peak_velocity (float): Peak speed of the latest movement
+        peak_time (float): Time of the peak speed
+        target_time (float): Time the target was first entered after onset
+        time_to_target (float): target_time - onset_time
+
+    Listeners (each optional, called from the thread calling update()):
+        onset_listener(frame_number, time, speed)
+        offset_listener(frame_number, time, peak_velocity)
+        target_listener(frame_number, time, time_to_target)
+
+    Methods:
+        update(frame_number, speed, position): Evaluate one frame
+        reset(): Return to idle and forget all events
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 120,
+        onset_threshold: float = 5.0,
+        offset_threshold: float = 2.5,
+        onset_frames: int = 3,
+        offset_frames: int = 6,
+        target: Union[Callable[[np.ndarray], bool], None] = None,
+    ):
+        """
+        Initialize the MovementDetector object.
+
+        Args:
+            sample_rate (float, optional): Sampling rate in Hz. Defaults to 120.
+            onset_threshold (float, optional): Onset speed (e.g. cm/s). Defaults to 5.
+            offset_threshold (float, optional): Offset speed; must not exceed onset. Defaults to 2.5.
+            onset_frames (int, optional): Frames needed to confirm onset. Defaults to 3.
+            offset_frames (int, optional): Frames needed to confirm offset. Defaults to 6.
+            target (Callable, optional): Target predicate. Defaults to None (no target).
+        """
+        if offset_threshold > onset_threshold:
+            raise ValueError("Offset threshold cannot exceed the onset threshold.")
+
+        if onset_frames < 1 or offset_frames < 1:
+            raise ValueError("Onset and offset must hold for at least one frame.")
+
+        self.sample_rate = sample_rate
+        self.onset_threshold = onset_threshold
+        self.offset_threshold = offset_threshold
+        self.onset_frames = onset_frames
+        self.offset_frames = offset_frames
+        self.target = target
+
+        self.onset_listener = None
+        self.offset_listener = None
+        self.target_listener = None
+
+        self.reset()
+
+    @property
+    def state(self) -> str:
+        """Get the current movement state."""
+        return self.__state
+
+    @property
+    def onset_time(self) -> float:
+        """Get the time of the latest movement onset."""
+        return self.__onset_time
+
+    @property
+    def offset_time(self) -> float:
+        """Get the time of the latest movement offset."""
+        return self.__offset_time
+
+    @property
+    def peak_velocity(self) -> float:
+        """Get the peak speed of the latest movement."""
+        return self.__peak_velocity
+
+    @property
+    def peak_time(self) -> float:
+        """Get the time of the peak speed."""
+        return self.__peak_time
+
+    @property
+    def target_time(self) -> float:
+        """Get the time the target was first entered after onset."""
+        return self.__target_time
+
+    @property
+    def time_to_target(self) -> float:
+        """Get the time from movement onset to target entry."""
+        return self.__target_time - self.__onset_time
+
+    def update(
+        self,
+        frame_number: int,
+        speed: float,
+        position: Union[np.ndarray, None] = None,
+    ) -> None:
+        """
+        Evaluate one frame, raising any events it completes.
+
+        Frames with NaN speed (e.g. occluded markers) are ignored.
+
+        Args:
+            frame_number (int): Frame number reported by the tracking system
+            speed (float): Current speed
+            position (np.ndarray, optional): Current [3] position, for target entry
+        """
+        if speed != speed:
+            return
+
+        time = frame_number / self.sample_rate
+
+        if self.__state == IDLE:
+            if speed >= self.onset_threshold:
+                if self.__run == 0:
+                    self.__run_start = self.__crossing(
+                        time, speed, self.onset_threshold
+                    )
+                    self.__run_peak = (speed, time)
+                elif speed > self.__run_peak[0]:
+                    self.__run_peak = (speed, time)
+                self.__run += 1
+
+                if self.__run >= self.onset_frames:
+                    self.__start_movement(frame_number, speed)
+            else:
+                self.__run = 0
+
+        else:
+            if speed > self.__peak_velocity:
+                self.__peak_velocity = speed
+                self.__peak_time = time
+
+            if speed < self.offset_threshold:
+                if self.__run == 0:
+                    self.__run_start = self.__crossing(
+                        time, speed, self.offset_threshold
+                    )
+                self.__run += 1
+
+                if self.__run >= self.offset_frames:
+                    self.__stop_movement(frame_number)
+            else:
+                self.__run = 0
+
+            if (
+                self.__target_time != self.__target_time
+                and self.target is not None
+                and position is not None
+                and self.target(position)
+            ):
+                self.__target_time = time
+                if self.target_listener is not None:
+                    self.target_listener(frame_number, time, self.time_to_target)
+
+        self.__last_time = time
+        self.__last_speed = speed
+
+    def reset(self) -> None:
+        """Return to idle and forget all events, e.g. between trials."""
+        self.__state = IDLE
+        self.__run = 0
+        self.__run_start = np.nan
+        self.__run_peak = (np.nan, np.nan)
+
+        self.__onset_time = np.nan
+        self.__offset_time = np.nan
+        self.__peak_velocity = np.nan
+        self.__peak_time = np.nan
+        self.__target_time = np.nan
+
+        self.__last_time = np.nan
+        self.__last_speed = np.nan
+
+    def __crossing(self, time: float, speed: float, threshold: float) -> float:
+        """Interpolate when speed crossed threshold since the previous frame."""
+        if self.__last_speed != self.__last_speed or speed == self.__last_speed:
+            return time
+
+        fraction = (threshold - self.__last_speed) / (speed - self.__last_speed)
+        return self.__last_time + min(max(fraction, 0.0), 1.0) * (
+            time - self.__last_time
+        )
+
+    def __start_movement(self, frame_number: int, speed: float) -> None:
+        self.__state = MOVING
+        self.__run = 0
+
+        self.__onset_time = self.__run_start
+        self.__offset_time = np.nan
+        self.__peak_velocity, self.__peak_time = self.__run_peak
+        self.__target_time = np.nan
+
+        if self.onset_listener is not None:
+            self.onset_listener(frame_number, self.__onset_time, speed)
+
+    def __stop_movement(self, frame_number: int) -> None:
+        self.__state = IDLE
+        self.__run = 0
+
+        self.__offset_time = self.__run_start
+
+        if self.offset_listener is not None:
+            self.offset_listener(frame_number, self.__offset_time, self.__peak_velocity)
@@ -0,0 +1,449 @@
+"""
+Stand-in for a Motive server, for exercising NatNetClient without a live rig.
+
+Emits NAT_FRAMEOFDATA packets in the NatNet 4.1 layout NatNetClient unpacks,
+either from synthetic marker trajectories or by replaying a recorded trial
+file, over unicast (to clients that have sent NAT_CONNECT) or multicast.
+
+Run from this directory to stress a client on loopback and report packet loss
+and callback latency:
+
+    python NatNetSimulator.py --rate 360 --markers 200 --duration 10 --measure
+    python NatNetSimulator.py --replay ../../../OptiData/<p_id>/trial_1.csv
+"""
+
+import argparse
+import os
+import socket
+import struct
+import time
+import numpy as np
+from threading import Thread
+from typing import Dict, Iterator, List, Tuple, Union
+
+from FrameRecorder import is_frame_file, open_frame_file
+
+NAT_CONNECT = 0
+NAT_SERVERINFO = 1
+NAT_FRAMEOFDATA = 7
+NAT_KEEPALIVE = 10
+
+_message_header = struct.Struct("<HH")
+_uint32 = struct.Struct("<I")
+_section_header = struct.Struct("<II")
+# timecode, timecode sub, timestamp, mid-exposure, data received, transmit,
+# precision seconds, precision fraction, params, end-of-data tag
+_frame_suffix = struct.Struct("<IIdQQQIIhI")
+
+# sections following the marker sets: legacy markers, rigid bodies, skeletons,
+# assets, labeled markers, force plates, devices; unset ones are sent empty
+# (count and size of zero)
+EMPTY_SECTIONS = 7
+
+Frame = Tuple[int, Dict[str, np.ndarray]]
+
+
+def build_frame(
+    frame_number: int,
+    marker_sets: Dict[str, np.ndarray],
+    timestamp: float = 0.0,
+    rigid_bodies: Union[np.ndarray, None] = None,
+    labeled_markers: Union[np.ndarray, None] = None,
+) -> bytes:
+    """
+    Pack one NAT_FRAMEOFDATA packet.
+
+    Args:
+        frame_number (int): Frame number to report
+        marker_sets (Dict[str, np.ndarray]): [n_markers, 3] positions keyed by set label
+        timestamp (float, optional): Seconds since streaming began. Defaults to 0.0.
+        rigid_bodies (np.ndarray, optional): Records of MotiveStreamParser.rigid_body_dtype
+        labeled_markers (np.ndarray, optional): Records of MotiveStreamParser.labeled_marker_dtype
+
+    Returns:
+        bytes: Complete packet, including message ID and packet size
+    """
+    sets = b"".join(
+        label.encode("utf8")
+        + b"\0"
+        + _uint32.pack(len(markers))
+        + np.ascontiguousarray(markers, dtype="<f4").tobytes()
+        for label, markers in marker_sets.items()
+    )
+
+    sections = [_section_header.pack(0, 0)] * EMPTY_SECTIONS
+    for index, records in ((1, rigid_bodies), (4, labeled_markers)):
+        if records is not None:
+            data = records.tobytes()
+            sections[index] = _section_header.pack(len(records), len(data)) + data
+
+    now = time.perf_counter_ns()
+    body = b"".join(
+        [
+            _uint32.pack(frame_number),
+            _section_header.pack(len(marker_sets), len(sets)),
+            sets,
+            *sections,
+            _frame_suffix.pack(0, 0, timestamp, now, now, now, 0, 0, 0, 0),
+        ]
+    )
+
+    if len(body) > 0xFFFF:
+        raise ValueError(f"Frame of {len(body)} bytes exceeds the NatNet packet limit.")
+
+    return _message_header.pack(NAT_FRAMEOFDATA, len(body)) + body
+
+
+def synthetic_frames(
+    marker_count: int, rate: int, label: str = "hand", seed: int = 0
+) -> Iterator[Frame]:
+    """
+    Generate an endless stream of frames of markers sweeping back and forth.
+
+    Args:
+        marker_count (int): Number of markers in the set
+        rate (int): Frame rate in Hz, used to advance the trajectory
+        label (str, optional): Marker set label. Defaults to "hand".
+        seed (int, optional): Seed for the marker layout. Defaults to 0.
+    """
+    layout = np.random.default_rng(seed).normal(scale=0.02, size=(marker_count, 3))
+
+    frame_number = 0
+    while True:
+        t = frame_number / rate
+        centre = np.array(
+            [0.2 * np.sin(2 * np.pi * 0.5 * t), 1.0, 0.1 * np.cos(2 * np.pi * 0.5 * t)]
+        )
+
+        yield frame_number, {label: layout + centre}
+        frame_number += 1
+
+
+def replay_frames(path: str, label: str = "hand") -> Iterator[Frame]:
+    """
+    Replay a recorded trial file (CSV or binary frame file) frame by frame.
+
+    Args:
+        path (str): Path to a trial file written by FrameRecorder/BinaryFrameRecorder
+        label (str, optional): Marker set label to report. Defaults to "hand".
+    """
+    if is_frame_file(path):
+        records = open_frame_file(path)
+        frame_numbers = np.asarray(records["frame_number"])
+        positions = np.column_stack(
+            [records["pos_x"], records["pos_y"], records["pos_z"]]
+        )
+    else:
+        data = np.genfromtxt(path, delimiter=",", names=True)
+        frame_numbers = data["frame_number"].astype(np.int64)
+        positions = np.column_stack([data["pos_x"], data["pos_y"], data["pos_z"]])
+
+    # rows are grouped by frame; split once rather than masking per frame
+    starts = np.flatnonzero(np.diff(frame_numbers, prepend=frame_numbers[:1] - 1))
+    for frame_number, markers in zip(
+        frame_numbers[starts], np.split(positions, starts[1:])
+    ):
+        yield int(frame_number), {label: markers}
+
+
+class NatNetSimulator(object):
+    """
+    A minimal NatNet server streaming frames at a fixed rate.
+
+    In unicast mode, frames are sent to every address that has sent a
+    NAT_CONNECT or keep-alive to the command port, as Motive does. In multicast
+    mode they are sent to the multicast group on the data port.
+
+    Attributes:
+        rate (int): Frames sent per second
+        frames_sent (int): Number of frames sent by the last call to stream()
+        send_times (np.ndarray): perf_counter() at which each frame number was sent
+
+    Methods:
+        start(): Open sockets and begin answering the command channel
+        stream(frames, duration): Send frames at the configured rate
+        stop(): Close sockets
+    """
+
+    def __init__(
+        self,
+        rate: int = 120,
+        local_ip: str = "127.0.0.1",
+        command_port: int = 1510,
+        data_port: int = 1511,
+        multicast: str = "239.255.42.99",
+        use_multicast: bool = False,
+    ):
+        self.rate = rate
+
+        self.__local_ip = local_ip
+        self.__command_port = command_port
+        self.__data_port = data_port
+        self.__multicast = multicast
+        self.__use_multicast = use_multicast
+
+        self.__command_socket: Union[socket.socket, None] = None
+        self.__data_socket: Union[socket.socket, None] = None
+        self.__command_thread: Union[Thread, None] = None
+        self.__clients: List[Tuple[str, int]] = []
+
+        self.__send_times = np.full(0, np.nan)
+        self.__frames_sent = 0
+
+    @property
+    def frames_sent(self) -> int:
+        return self.__frames_sent
+
+    @property
+    def send_times(self) -> np.ndarray:
+        return self.__send_times
+
+    @property
+    def clients(self) -> List[Tuple[str, int]]:
+        return list(self.__clients)
+
+    def start(self) -> None:
+        self.__command_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__command_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__command_socket.bind((self.__local_ip, self.__command_port))
+
+        self.__data_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.__use_multicast:
+            self.__data_socket.setsockopt(
+                socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1
+            )
+            self.__data_socket.setsockopt(
+                socket.IPPROTO_IP,
+                socket.IP_MULTICAST_IF,
+                socket.inet_aton(self.__local_ip),
+            )
+
+        self.__command_thread = Thread(
+            target=self.__command_thread_function, daemon=True
+        )
+        self.__command_thread.start()
+
+    def stop(self) -> None:
+        for sock in (self.__command_socket, self.__data_socket):
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                sock.close()
+
+        if self.__command_thread is not None:
+            self.__command_thread.join()
+
+        self.__command_socket = self.__data_socket = self.__command_thread = None
+
+    def wait_for_client(self, timeout: float = 5.0) -> bool:
+        """Block until a unicast client has connected, or timeout seconds pass."""
+        deadline = time.perf_counter() + timeout
+        while not self.__clients and time.perf_counter() < deadline:
+            time.sleep(0.01)
+
+        return bool(self.__clients)
+
+    def stream(self, frames: Iterator[Frame], duration: float = 0.0) -> int:
+        """
+        Send frames at the configured rate.
+
+        Args:
+            frames (Iterator[Frame]): Source of (frame_number, marker_sets) pairs
+            duration (float, optional): Seconds to stream for; 0 streams until exhausted.
+
+        Returns:
+            int: Number of frames sent
+        """
+        max_frames = int(duration * self.rate) if duration else None
+        self.__send_times = np.full(max_frames or 1 << 16, np.nan)
+        self.__frames_sent = 0
+
+        interval = 1.0 / self.rate
+        next_send = time.perf_counter()
+
+        for frame_number, marker_sets in frames:
+            if max_frames is not None and self.__frames_sent >= max_frames:
+                break
+
+            packet = build_frame(frame_number, marker_sets, frame_number / self.rate)
+
+            # absolute schedule, so send jitter doesn't accumulate as drift
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_send += interval
+
+            if frame_number >= len(self.__send_times):
+                grown = np.full(
+                    max(frame_number + 1, 2 * len(self.__send_times)), np.nan
+                )
+                grown[: len(self.__send_times)] = self.__send_times
+                self.__send_times = grown
+
+            self.__send_times[frame_number] = time.perf_counter()
+            for address in self.__destinations():
+                self.__data_socket.sendto(packet, address)
+
+            self.__frames_sent += 1
+
+        return self.__frames_sent
+
+    def __destinations(self) -> List[Tuple[str, int]]:
+        if self.__use_multicast:
+            return [(self.__multicast, self.__data_port)]
+
+        return self.__clients
+
+    def __command_thread_function(self) -> None:
+        buffer = bytearray(64 * 1024)
+
+        while True:
+            try:
+                nbytes, address = self.__command_socket.recvfrom_into(buffer)
+            except OSError:
+                return
+
+            if nbytes < 4:
+                return
+
+            message_id, _ = _message_header.unpack_from(buffer, 0)
+
+            if (
+                message_id in (NAT_CONNECT, NAT_KEEPALIVE)
+                and address not in self.__clients
+            ):
+                self.__clients.append(address)
+
+            if message_id == NAT_CONNECT:
+                server_info = (
+                    b"NatNetSimulator".ljust(256, b"\0")
+                    + bytes([3, 1, 0, 0])  # server version
+                    + bytes([4, 1, 0, 0])  # NatNet version
+                )
+                self.__command_socket.sendto(
+                    _message_header.pack(NAT_SERVERINFO, len(server_info))
+                    + server_info,
+                    address,
+                )
+
+
+def measure(args: argparse.Namespace) -> None:
+    """Stream to an in-process NatNetClient and report loss and callback latency."""
+    from natnetclient_rough import NatNetClient
+
+    simulator = NatNetSimulator(
+        rate=args.rate,
+        local_ip=args.local_ip,
+        command_port=args.command_port,
+        data_port=args.data_port,
+        use_multicast=args.multicast,
+    )
+
+    receive_times = np.full(int(args.duration * args.rate) + 1, np.nan)
+
+    def listener(frame_number: int, label: str, markers: np.ndarray) -> None:
+        if frame_number < len(receive_times):
+            receive_times[frame_number] = time.perf_counter()
+
+    client = NatNetClient(
+        {
+            "server_ip": args.local_ip,
+            "local_ip": args.local_ip,
+            "command_port": args.command_port,
+            "data_port": args.data_port,
+            "use_multicast": args.multicast,
+        }
+    )
+    client.marker_arrays_listener = listener
+
+    simulator.start()
+    client.startup()
+
+    if not args.multicast and not simulator.wait_for_client():
+        print("No client connected.")
+    else:
+        sent = simulator.stream(
+            synthetic_frames(args.markers, args.rate, args.label), args.duration
+        )
+        time.sleep(0.2)
+
+        received = np.count_nonzero(~np.isnan(receive_times[:sent]))
+        latency = (receive_times[:sent] - simulator.send_times[:sent]) * 1000
+        latency = latency[~np.isnan(latency)]
+
+        print(f"Sent {sent} frames of {args.markers} markers at {args.rate} Hz")
+        print(
+            f"Received {received} ({100 * (sent - received) / max(sent, 1):.2f}% lost)"
+        )
+        if len(latency):
+            p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+            print(
+                f"Callback latency (ms): p50 {p50:.3f}, p95 {p95:.3f}, p99 {p99:.3f}, max {latency.max():.3f}"
+            )
+
+    client.shutdown()
+    simulator.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--rate", type=int, default=120, help="frames per second")
+    parser.add_argument("--markers", type=int, default=10, help="markers per frame")
+    parser.add_argument("--label", default="hand", help="marker set label")
+    parser.add_argument(
+        "--duration", type=float, default=0.0, help="seconds to stream (0: forever)"
+    )
+    parser.add_argument(
+        "--replay", default="", help="trial file (CSV or binary) to replay"
+    )
+    parser.add_argument("--local-ip", default="127.0.0.1")
+    parser.add_argument("--command-port", type=int, default=1510)
+    parser.add_argument("--data-port", type=int, default=1511)
+    parser.add_argument(
+        "--multicast", action="store_true", help="stream to the multicast group"
+    )
+    parser.add_argument(
+        "--measure",
+        action="store_true",
+        help="run a client in-process and report loss/latency",
+    )
+    args = parser.parse_args()
+
+    if args.measure:
+        if not args.duration:
+            parser.error("--measure requires --duration")
+        measure(args)
+        return
+
+    simulator = NatNetSimulator(
+        rate=args.rate,
+        local_ip=args.local_ip,
+        command_port=args.command_port,
+        data_port=args.data_port,
+        use_multicast=args.multicast,
+    )
+
+    if args.replay:
+        if not os.path.exists(args.replay):
+            parser.error(f"No such file: {args.replay}")
+        frames = replay_frames(args.replay, args.label)
+    else:
+        frames = synthetic_frames(args.markers, args.rate, args.label)
+
+    simulator.start()
+    try:
+        if not args.multicast:
+            print(f"Waiting for a client on {args.local_ip}:{args.command_port}...")
+            simulator.wait_for_client(timeout=float("inf"))
+        sent = simulator.stream(frames, args.duration)
+        print(f"Sent {sent} frames.")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,26 @@
 import os
 import numpy as np
 import sqlite3
-from scipy.signal import butter, sosfiltfilt
-import klibs
 import warnings
-from pprint import pprint
+from typing import Tuple, Union
+from ButterworthFilter import StreamingButterworth
+from FrameBuffer import FrameBuffer, LatestFrame
+from Kinematics import KinematicsEstimator, kabsch, movement_summary, trial_centroids
+from FrameRecorder import (
+    TrialKey,
+    connect_frame_store,
+    is_frame_file,
+    open_frame_file,
+    query_frame_range,
+    query_latest_frames,
+)
+from MovementEvents import MovementDetector
+from LatencyLog import INGEST, LatencyLog
+from GapFilling import GAP_FILL_METHODS, dropout_stats, fill_gaps, validity_mask
 # from klibs.KLDatabase import KLDatabase as kld
 
 # TODO:
 # grab first frame, row count indicates num markers tracked.
-# incorporate checks to ensure frames queried match expected marker count
 # refactor nomeclature about frame indexing/querying
 
 
@@ -18,19 +29,57 @@ class OptiTracker(object):
     A class for querying and operating on motion tracking data.
 
     This class processes positional data from markers, providing functionality
-    to calculate velocities and positions in 3D space. It handles data loading,
-    frame querying, and various spatial calculations.
+    to calculate velocities and positions in 3D space. Frames are pushed in via
+    add_frame() and held in an in-memory ring buffer, so queries never touch the
+    disk; a data file is only read when no frames have been added (e.g. offline).
+    If a database is set, that read is instead an indexed lookup of the trial's
+    rows in a SQLite frame store (see SQLiteFrameRecorder).
+    The newest frame is also published to a lock-free slot, so position() never
+    waits on the thread delivering frames.
+    Markers missing from a frame are held as NaN; when max_gap is set, queries
+    fill occlusions of up to max_gap frames before anything is computed.
+    Buffered frame numbers always increase: add_frame() drops repeated or
+    reordered frames (counted in stale_frames), and a backward jump of more
+    than stream_reset_frames clears the buffer as a restart of the stream.
 
     Attributes:
         marker_count (int): Number of markers to track
         sample_rate (int): Sampling rate of the tracking system in Hz
         window_size (int): Number of frames to consider for calculations
         data_dir (str): Directory path containing the tracking data files
+        database (str): SQLite frame store read instead of data_dir when set
+        trial (TrialKey): (participant_id, block_num, trial_num) of frames read from the database
+        buffer_size (int): Number of most recent frames held in memory
+        frame_count (int): Number of frames added since the buffer was last cleared
+        stale_frames (int): Repeated or reordered frames dropped since the buffer was last cleared
+        latest_frame (LatestFrame): Newest-frame slot, with read contention/staleness counters
+        kinematics (KinematicsEstimator): Per-frame velocity/acceleration/jerk estimates, in cm
+        events (MovementDetector): Movement onset/offset/target events, evaluated per frame
+        latency_log (LatencyLog): Optional log stamped as each frame is ingested (None disables)
+        max_gap (int): Longest occlusion (in frames) filled when querying; 0 disables filling
+        gap_fill (str): Gap filling method, one of "linear", "spline" or "hold"
 
     Methods:
+        add_frame(frame_number, positions): Push a frame of marker positions into the buffer
+        clear(): Discard all buffered frames
         velocity(num_frames): Calculate velocity based on marker positions across specified number of frames
-        position(): Get current position of markers
+        position(smooth): Get current (optionally causally smoothed) position of markers
         distance(num_frames: int): Calculate distance traveled over specified number of frames
+        marker_positions(num_frames): Get per-marker positions as a [frames, markers, 3] array
+        marker_velocity(num_frames): Calculate the velocity of each marker
+        centroid(num_frames): Get the marker centroid of each frame
+        rigid_body(num_frames, reference): Fit marker orientation/translation per frame
+        validity(num_frames): Get the per-frame marker validity mask
+        dropouts(num_frames): Summarise marker dropouts over specified number of frames
+        recorded_frames(first_frame, last_frame): Get a range of frames from the database
+        movement_summary(start_frame, target): Summarise the trial's movement from buffered frames
+
+    Marker IDs index the marker axis, and correspond to each marker's position
+    within its marker set as streamed by Motive.
+
+    Windows of num_frames frames cover the last num_frames frame periods, i.e.
+    num_frames / sample_rate seconds, counted by frame number. Frames dropped
+    by the stream therefore shorten a window rather than stretch it.
     """
 
     def __init__(
@@ -39,7 +88,13 @@ class OptiTracker(object):
         sample_rate: int = 120,
         window_size: int = 5,
         data_dir: str = "",
-        db_name: str = "optitracker.db",
+        db_name: str = "",
+        buffer_size: int = 0,
+        filter_order: int = 2,
+        filter_cutoff: float = 10,
+        max_gap: int = 0,
+        gap_fill: str = "linear",
+        stream_reset_frames: int = 10,
     ):
         """
         Initialize the OptiTracker object.
@@ -49,6 +104,15 @@ class OptiTracker(object):
             sample_rate (int, optional): Sampling rate in Hz. Defaults to 120.
             window_size (int, optional): Number of frames for calculations. Defaults to 5.
             data_dir (str, optional): Path to data directory. Defaults to empty string.
+            db_name (str, optional): Path to a SQLite frame store. Defaults to empty string.
+            buffer_size (int, optional): Frames held in memory. Defaults to ten seconds' worth.
+            filter_order (int, optional): Order of the live smoothing filter. Defaults to 2.
+            filter_cutoff (float, optional): Cutoff of the live smoothing filter in Hz. Defaults to 10.
+            max_gap (int, optional): Longest occlusion (in frames) to fill. Defaults to 0 (off).
+            gap_fill (str, optional): "linear", "spline" or "hold". Defaults to "linear".
+            stream_reset_frames (int, optional): Backward jump in frame number
+                treated as a restart of the stream, rather than a reordered frame.
+                Defaults to 10.
         """
 
         if marker_count:
@@ -57,31 +121,76 @@ class OptiTracker(object):
         self.__sample_rate = sample_rate
         self.__data_dir = data_dir
         self.__window_size = window_size
-        # self.db = self.__connect(db_name)
 
-        # self.cursor = self.db.cursor()
+        if buffer_size == 0:
+            buffer_size = sample_rate * 10
 
-        db_scheme = '''
-        CREATE TABLE IF NOT EXISTS frames (
-            frame_number INTEGER PRIMARY KEY,
-            pos_x REAL,
-            pos_y REAL,
-            pos_z REAL
+        if buffer_size < window_size:
+            raise ValueError("Buffer size must cover at least one window.")
+
+        self.__buffer = FrameBuffer(capacity=buffer_size, marker_count=marker_count)
+
+        # newest frame number added, which every later frame must exceed
+        self.__stream_reset_frames = stream_reset_frames
+        self.__last_frame = -1
+        self.__stale_frames = 0
+
+        # newest frame for the render loop, handed over without locking
+        self.__latest = LatestFrame(marker_count=marker_count)
+
+        self.max_gap = max_gap
+        self.gap_fill = gap_fill
+
+        # causal low-pass over frame centroids, updated as each frame arrives
+        self.__filter_order = filter_order
+        self.__filter_cutoff = filter_cutoff
+        self.__filter = StreamingButterworth(
+            order=filter_order, cutoff=filter_cutoff, sample_rate=sample_rate
+        )
+
+        # velocity/acceleration/jerk refreshed per frame, read in constant time
+        self.__kinematics = KinematicsEstimator(
+            marker_count=marker_count,
+            sample_rate=sample_rate,
+            window=max(window_size, 4),
         )
-        '''
 
-        # self.cursor.execute(db_scheme)
+        # onset/offset/target events raised from add_frame(), i.e. on the data thread
+        self.__events = MovementDetector(sample_rate=sample_rate)
+
+        self.__latency_log = None
 
+        # connected on first query
+        self.__database = db_name
+        self.__db: Union[sqlite3.Connection, None] = None
+        self.__trial: TrialKey = (0, 0, 0)
 
-    # @property
-    # def database(self) -> str:
-    #     """Get the name of the database file."""
-    #     return self.__database
-    #
-    # @database.setter
-    # def database(self, database: str) -> None:
-    #     """Set the name of the database file."""
-    #     self.__database = database
+    @property
+    def database(self) -> str:
+        """Get the path of the SQLite frame store."""
+        return self.__database
+
+    @database.setter
+    def database(self, database: str) -> None:
+        """Set the path of the SQLite frame store; empty reads data_dir instead."""
+        if self.__db is not None:
+            self.__db.close()
+            self.__db = None
+
+        self.__database = database
+
+    @property
+    def trial(self) -> TrialKey:
+        """Get the (participant_id, block_num, trial_num) read from the database."""
+        return self.__trial
+
+    @trial.setter
+    def trial(self, trial: TrialKey) -> None:
+        """Set the (participant_id, block_num, trial_num) read from the database."""
+        if len(trial) != 3:
+            raise ValueError("Trial must be (participant_id, block_num, trial_num).")
+
+        self.__trial = tuple(trial)
 
     @property
     def marker_count(self) -> int:
@@ -112,6 +221,17 @@ class OptiTracker(object):
     def sample_rate(self, sample_rate: int) -> None:
         """Set the sampling rate."""
         self.__sample_rate = sample_rate
+        self.__filter = StreamingButterworth(
+            order=self.__filter_order,
+            cutoff=self.__filter_cutoff,
+            sample_rate=sample_rate,
+        )
+        self.__kinematics = KinematicsEstimator(
+            marker_count=self.__marker_count,
+            sample_rate=sample_rate,
+            window=max(self.__window_size, 4),
+        )
+        self.__events.sample_rate = sample_rate
 
     @property
     def window_size(self) -> int:
@@ -123,6 +243,128 @@ class OptiTracker(object):
         """Set the window size."""
         self.__window_size = window_size
 
+    @property
+    def buffer_size(self) -> int:
+        """Get the number of frames held in memory."""
+        return self.__buffer.capacity
+
+    @property
+    def frame_count(self) -> int:
+        """Get the number of frames added since the buffer was last cleared."""
+        return self.__buffer.frames_written
+
+    @property
+    def stale_frames(self) -> int:
+        """Get the number of repeated or reordered frames dropped since the buffer was last cleared."""
+        return self.__stale_frames
+
+    @property
+    def latest_frame(self) -> LatestFrame:
+        """Get the newest-frame slot shared with the render loop."""
+        return self.__latest
+
+    @property
+    def max_gap(self) -> int:
+        """Get the longest occlusion (in frames) filled when querying."""
+        return self.__max_gap
+
+    @max_gap.setter
+    def max_gap(self, max_gap: int) -> None:
+        """Set the longest occlusion (in frames) filled when querying."""
+        if max_gap < 0:
+            raise ValueError("Maximum gap cannot be negative.")
+        self.__max_gap = max_gap
+
+    @property
+    def gap_fill(self) -> str:
+        """Get the gap filling method."""
+        return self.__gap_fill
+
+    @gap_fill.setter
+    def gap_fill(self, gap_fill: str) -> None:
+        """Set the gap filling method."""
+        if gap_fill not in GAP_FILL_METHODS:
+            raise ValueError(f"Gap fill method must be one of {GAP_FILL_METHODS}.")
+        self.__gap_fill = gap_fill
+
+    @property
+    def kinematics(self) -> KinematicsEstimator:
+        """Get the per-frame kinematics estimates (cm, cm/s, cm/s^2, cm/s^3)."""
+        return self.__kinematics
+
+    @property
+    def events(self) -> MovementDetector:
+        """Get the movement event detector (speeds in cm/s, positions in cm)."""
+        return self.__events
+
+    @property
+    def latency_log(self) -> Union[LatencyLog, None]:
+        """Get the latency log stamped on ingest, if any."""
+        return self.__latency_log
+
+    @latency_log.setter
+    def latency_log(self, latency_log: Union[LatencyLog, None]) -> None:
+        """Set the latency log stamped on ingest; None disables stamping."""
+        self.__latency_log = latency_log
+
+    def add_frame(self, frame_number: int, positions: np.ndarray) -> None:
+        """
+        Push a frame of marker positions into the in-memory buffer.
+
+        Frames must arrive in increasing frame number order; a frame at or
+        behind the newest one is dropped, unless it is more than
+        stream_reset_frames behind, in which case the stream restarted and
+        the buffer is cleared before the frame is added.
+
+        Args:
+            frame_number (int): Frame number reported by the tracking system
+            positions (np.ndarray): [n_markers, 3] array of marker positions, in metres
+        """
+        if self.__last_frame >= 0 and frame_number <= self.__last_frame:
+            if self.__last_frame - frame_number <= self.__stream_reset_frames:
+                self.__stale_frames += 1
+                return
+
+            self.clear()
+
+        self.__last_frame = frame_number
+
+        if len(positions) > self.__marker_count:
+            warnings.warn(
+                f"Frame {frame_number} holds {len(positions)} markers, expected "
+                f"{self.__marker_count}; extra markers are discarded."
+            )
+
+        present = ~np.isnan(positions).any(axis=1)
+        if present.any():
+            self.__filter.update(positions[present].mean(axis=0))
+
+        # the filtered centroid shares the frame's slot, so readers never pair
+        # one frame's number with a later frame's filter output
+        self.__buffer.append(frame_number, positions)
+        self.__latest.publish(frame_number, positions, self.__filter.output)
+
+        self.__kinematics.update(frame_number, positions * 100)
+
+        self.__events.update(
+            frame_number,
+            speed=float(np.linalg.norm(self.__kinematics.centroid_velocity)),
+            position=self.__filter.output * 100,
+        )
+
+        if self.__latency_log is not None:
+            self.__latency_log.stamp(INGEST)
+
+    def clear(self) -> None:
+        """Discard all buffered frames, e.g. between trials."""
+        self.__buffer.clear()
+        self.__latest.clear()
+        self.__last_frame = -1
+        self.__stale_frames = 0
+        self.__filter.reset()
+        self.__kinematics.reset()
+        self.__events.reset()
+
     def velocity(self, num_frames: int = 0) -> float:
         """Calculate and return the current velocity."""
         if num_frames == 0:
@@ -134,10 +376,28 @@ class OptiTracker(object):
         frames = self.__query_frames(num_frames)
         return self.__velocity(frames)
 
-    def position(self) -> np.ndarray:
-        """Get the current position of markers."""
-        frame = self.__query_frames(num_frames=1)
-        return self.__column_means(smooth = False, frames = frame)
+    def position(self, smooth: bool = False) -> np.ndarray:
+        """
+        Get the current position of markers.
+
+        Args:
+            smooth (bool, optional): Return the causally low-pass filtered centroid,
+                updated in constant time as frames arrive. Defaults to False.
+        """
+        if self.__latest.writes:
+            # newest complete frame, read without taking the buffer lock
+            frame_number, positions, smoothed = self.__latest.read()
+            frame = (np.array([frame_number]), positions[None] * 100)
+        else:
+            frame = self.__query_frames(num_frames=1)
+            smoothed = None
+
+        means = self.__column_means(frames = frame)
+
+        if smooth and smoothed is not None:
+            means["pos_x"], means["pos_y"], means["pos_z"] = smoothed * 100
+
+        return means
 
     def distance(self, num_frames: int = 0) -> float:
         """Calculate and return the distance traveled over the specified number of frames."""
@@ -148,12 +408,207 @@ class OptiTracker(object):
         frames = self.__query_frames(num_frames)
         return self.__euclidean_distance(frames)
 
-    def __velocity(self, frames: np.ndarray = np.array([])) -> float:
+    def marker_positions(self, num_frames: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get per-marker positions over the specified number of frames.
+
+        Args:
+            num_frames (int, optional): Number of frames to query. Defaults to window_size.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Frame numbers, and [frames, markers, 3]
+                positions in cm indexed by marker ID; NaN where a marker was occluded.
+        """
+        return self.__query_frames(num_frames)
+
+    def marker_velocity(self, num_frames: int = 0) -> np.ndarray:
+        """
+        Calculate the velocity of each marker between the first and last queried frames.
+
+        Args:
+            num_frames (int, optional): Number of frames to query. Defaults to window_size.
+
+        Returns:
+            np.ndarray: [markers, 3] velocities in cm/s
+        """
+        frame_numbers, positions = self.__query_frames(num_frames)
+        frame_span = frame_numbers[-1] - frame_numbers[0]
+
+        if frame_span == 0:
+            raise ValueError("Frames queried must span at least two frame numbers.")
+
+        return (positions[-1] - positions[0]) / (frame_span / self.__sample_rate)
+
+    def centroid(self, num_frames: int = 0) -> np.ndarray:
+        """
+        Get the centroid of the visible markers in each frame.
+
+        Args:
+            num_frames (int, optional): Number of frames to query. Defaults to window_size.
+
+        Returns:
+            np.ndarray: [frames, 3] centroids in cm; NaN for fully occluded frames
+        """
+        _, positions = self.__query_frames(num_frames)
+        return self.__centroids(positions)
+
+    def rigid_body(
+        self, num_frames: int = 0, reference: Union[np.ndarray, None] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Fit the rigid transform taking a reference marker layout to each frame.
+
+        Args:
+            num_frames (int, optional): Number of frames to query. Defaults to window_size.
+            reference (np.ndarray, optional): [markers, 3] layout in cm. Defaults to
+                the first queried frame.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Rotations [frames, 3, 3],
+                translations [frames, 3] in cm, and RMS fit residuals [frames] in cm.
+        """
+        _, positions = self.__query_frames(num_frames)
+
+        if reference is None:
+            reference = positions[0]
+
+        return kabsch(reference, positions)
+
+    def validity(self, num_frames: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get which markers were present in each of the specified number of frames.
+
+        Args:
+            num_frames (int, optional): Number of frames to query. Defaults to window_size.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Frame numbers, and a [frames, markers]
+                boolean mask, True where a marker was seen (before any gap filling).
+        """
+        if num_frames < 0:
+            raise ValueError("Number of frames cannot be negative.")
+
+        if num_frames == 0:
+            num_frames = self.__window_size
+
+        if self.__buffer.frames_written:
+            frame_numbers, valid = self.__buffer.validity(num_frames)
+            start = self.__window_start(frame_numbers, num_frames)
+            return frame_numbers[start:], valid[start:]
+
+        frame_numbers, positions = self.__query_frames(num_frames, fill=False)
+        return frame_numbers, validity_mask(positions)
+
+    def dropouts(self, num_frames: int = 0) -> dict:
+        """
+        Summarise marker dropouts over the specified number of frames.
+
+        Args:
+            num_frames (int, optional): Number of frames to query. Defaults to all buffered frames.
+
+        Returns:
+            dict: Dropout counts (see GapFilling.dropout_stats), plus the number of
+                frames per marker that gap filling recovered ("filled").
+        """
+        if num_frames == 0:
+            # windows count frame periods, so span the buffer by frame number
+            num_frames = self.__buffer.frame_span or self.__window_size
+
+        # one snapshot, so the counts and the filled frames describe the same frames
+        frame_numbers, positions = self.__query_frames(num_frames, fill=False)
+        valid = validity_mask(positions)
+        stats = dropout_stats(frame_numbers, valid)
+
+        if self.__max_gap:
+            filled = fill_gaps(
+                frame_numbers, positions, self.__max_gap, self.__gap_fill
+            )
+            stats["filled"] = (validity_mask(filled) & ~valid).sum(axis=0)
+        else:
+            stats["filled"] = np.zeros(self.__marker_count, dtype=np.int64)
+
+        return stats
+
+    def movement_summary(
+        self,
+        start_frame: Union[int, None] = None,
+        target: Union[np.ndarray, None] = None,
+    ) -> dict:
+        """
+        Summarise the movement in all buffered frames, e.g. at the end of a trial.
+
+        Uses a centroid averaged over the same markers in every frame (see
+        Kinematics.trial_centroids), so occlusions do not read as movement, and
+        the onset/offset thresholds of events (see Kinematics.movement_summary).
+
+        Args:
+            start_frame (int, optional): Frame at which the go signal was shown.
+                Defaults to None (the first buffered frame).
+            target (np.ndarray, optional): [3] target position in cm; NaN
+                components are ignored. Defaults to None.
+
+        Returns:
+            dict: reaction_time, movement_time, time_to_peak_velocity (s),
+                peak_velocity (cm/s), path_length and endpoint_error (cm); NaN
+                where no movement (or no offset, or no target) was found.
+        """
+        # windows count frame periods, so span the buffer by frame number
+        frame_numbers, positions = self.__query_frames(
+            self.__buffer.frame_span or self.__window_size, fill=False
+        )
+        events = self.__events
+
+        return movement_summary(
+            frame_numbers,
+            trial_centroids(frame_numbers, positions),
+            self.__sample_rate,
+            start_frame=start_frame,
+            target=target,
+            onset_threshold=events.onset_threshold,
+            offset_threshold=events.offset_threshold,
+            onset_frames=events.onset_frames,
+            offset_frames=events.offset_frames,
+            filter_order=self.__filter_order,
+            filter_cutoff=self.__filter_cutoff,
+        )
+
+    def recorded_frames(
+        self, first_frame: int, last_frame: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the trial's recorded frames numbered first_frame to last_frame, inclusive.
+
+        Served by an indexed range query on the database, however long the trial.
+
+        Args:
+            first_frame (int): First frame number
+            last_frame (int): Last frame number
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Frame numbers, and [frames, markers, 3]
+                positions in cm; NaN where a marker was occluded.
+
+        Raises:
+            ValueError: If no database is set, or the range is reversed
+        """
+        if self.__database == "":
+            raise ValueError("No database was set.")
+
+        if last_frame < first_frame:
+            raise ValueError("Last frame cannot precede the first frame.")
+
+        rows = query_frame_range(self.__connect(), self.__trial, first_frame, last_frame)
+        return self.__to_dense(self.__rows_to_cm(rows))
+
+    def __velocity(self, frames: Tuple[np.ndarray, np.ndarray] = ()) -> float:
         """
         Calculate velocity using position data over the specified window.
 
+        The elapsed time is taken from the frame numbers actually spanned, so
+        windows of any length (or with dropped frames) are timed correctly.
+
         Args:
-            frames (np.ndarray, optional): Array of frame data; queries last window_size frames if empty.
+            frames (Tuple[np.ndarray, np.ndarray], optional): Frame numbers and positions; queries last window_size frames if empty.
 
         Returns:
             float: Calculated velocity in cm/s
@@ -165,30 +620,29 @@ class OptiTracker(object):
             frames = self.__query_frames()
 
         euclidean_distance = self.__euclidean_distance(frames)
+        frame_numbers, _ = frames
+        frame_span = frame_numbers.max() - frame_numbers.min()
+
+        if frame_span == 0:
+            raise ValueError("Frames queried must span at least two frame numbers.")
 
-        return euclidean_distance / (self.__window_size / self.__sample_rate)
+        return euclidean_distance / (frame_span / self.__sample_rate)
 
-    def __euclidean_distance(self, frames: np.ndarray = np.array([])) -> float:
+    def __euclidean_distance(self, frames: Tuple[np.ndarray, np.ndarray] = ()) -> float:
         """
         Calculate Euclidean distance between first and last frames.
 
         Args:
-            frames (np.ndarray, optional): Array of frame data; queries last window_size frames if empty.
+            frames (Tuple[np.ndarray, np.ndarray], optional): Frame numbers and positions; queries last window_size frames if empty.
 
         Returns:
             float: Euclidean distance
         """
 
-        if frames.size == 0:
+        if len(frames) == 0:
             frames = self.__query_frames()
 
-        positions = self.__column_means(smooth = True, frames = frames)
-
-        # print("[__euclidean_distance()]")
-        # print("Frames queried:")
-        # pprint(frames)
-        # print("Calculated postion:")
-        # pprint(positions)
+        positions = self.__column_means(frames = frames)
 
         return float(
             np.sqrt(
@@ -198,120 +652,163 @@ class OptiTracker(object):
             )
         )
 
-    # TODO: reduce dependencies by hand-rolling a butterworth filter
-    # TODO: but first make sure this isn't a bad idea.
-
-    def __smooth(
-        self, order=2, cutoff=10, filtype="low", frames: np.ndarray = np.array([])
+    def __column_means(
+        self, frames: Tuple[np.ndarray, np.ndarray] = ()
     ) -> np.ndarray:
         """
-        Apply a dual-pass Butterworth filter to positional data.
+        Calculate column means of position data.
 
         Args:
-            order (int, optional): Order of the Butterworth filter. Defaults to 2.
-            cutoff (int, optional): Cutoff frequency in Hz. Defaults to 10.
-            filtype (str, optional): Type of filter to apply. Defaults to "low".
-            frames (np.ndarray, optional): Array of frame data; queries last window_size frames if empty.
+            frames (Tuple[np.ndarray, np.ndarray], optional): Frame numbers and positions; queries last window_size frames if empty.
 
         Returns:
-            np.ndarray: Array of filtered positions
+            np.ndarray: Array of mean positions, one row per frame.
+                Occluded (NaN) markers are excluded; fully occluded frames are NaN.
         """
         if len(frames) == 0:
             frames = self.__query_frames()
 
+        frame_numbers, positions = frames
+
         # Create output array with the correct dtype
-        smooth = np.zeros(
-            len(frames),
+        means = np.zeros(
+            len(frame_numbers),
             dtype=[
                 ("frame_number", "i8"),
-                ("pos_x", "i8"),
-                ("pos_y", "i8"),
-                ("pos_z", "i8"),
+                ("pos_x", "f8"),
+                ("pos_y", "f8"),
+                ("pos_z", "f8"),
             ],
         )
 
-        butt = butter(
-            N=order, Wn=cutoff, btype=filtype, output="sos", fs=self.__sample_rate
-        )
+        centroids = self.__centroids(positions)
+
+        means["frame_number"] = frame_numbers
+        means["pos_x"] = centroids[:, 0]
+        means["pos_y"] = centroids[:, 1]
+        means["pos_z"] = centroids[:, 2]
 
-        # print("[__smooth()]")
-        # print("frames:")
-        # pprint(frames)
+        return means
 
-        smooth["pos_x"] = sosfiltfilt(sos=butt, x=frames["pos_x"])
-        smooth["pos_y"] = sosfiltfilt(sos=butt, x=frames["pos_y"])
-        smooth["pos_z"] = sosfiltfilt(sos=butt, x=frames["pos_z"])
+    def __centroids(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Average the visible markers of every frame at once.
 
-        return smooth
+        Args:
+            positions (np.ndarray): [frames, markers, 3] positions, NaN where occluded
 
-    def __column_means(self, smooth:bool = True, frames: np.ndarray = np.array([])) -> np.ndarray:
+        Returns:
+            np.ndarray: [frames, 3] centroids; NaN for fully occluded frames
         """
-        Calculate column means of position data.
+        # Markers that were occluded (NaN) contribute to neither sums nor counts
+        valid = ~np.isnan(positions).any(axis=2)
+        sums = np.where(valid[..., None], positions, 0).sum(axis=1)
+        counts = valid.sum(axis=1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts[:, None]
+
+    def __query_frames(
+        self, num_frames: int = 0, fill: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Query frame data from the in-memory buffer, falling back to the data file.
 
         Args:
-            frames (np.ndarray, optional): Array of frame data; queries last window_size frames if empty.
+            num_frames (int, optional): Number of frames to query. Defaults to window_size when empty.
+            fill (bool, optional): Fill short occlusions when max_gap is set. Defaults to True.
 
         Returns:
-            np.ndarray: Array of mean positions
+            Tuple[np.ndarray, np.ndarray]: Frame numbers, and [frames, markers, 3]
+                positions in cm; NaN where a marker was occluded.
 
-        Note:
-            Currently applies smoothing function to generate means.
-            This may (and should) be done on raw data within __query_frames instead.
+        Raises:
+            ValueError: If number of frames is negative
         """
-        if len(frames) == 0:
-            frames = self.__query_frames()
 
-        # print("OptiTracker column_means, got frames:")
-        # pprint(frames)
+        if num_frames < 0:
+            raise ValueError("Number of frames cannot be negative.")
 
-        # Create output array with the correct dtype
-        means = np.zeros(
-            len(frames) // self.__marker_count,
-            dtype=[
-                ("frame_number", "i8"),
-                ("pos_x", "i8"),
-                ("pos_y", "i8"),
-                ("pos_z", "i8"),
-            ],
-        )
+        if num_frames == 0:
+            num_frames = self.__window_size
 
-        # Group by marker (every nth row where n is marker_count)
-        start = min(frames["frame_number"])
-        stop = max(frames["frame_number"]) + 1
+        if self.__buffer.frames_written == 0:
+            frame_numbers, positions = self.__to_dense(self.__read_frames(num_frames))
+        else:
+            frame_numbers, positions = self.__buffer.latest(num_frames)
+            positions *= 100
 
-        for frame_number in range(start, stop):
-            this_frame = frames[frames["frame_number"] == frame_number,]
+        start = self.__window_start(frame_numbers, num_frames)
+        frame_numbers, positions = frame_numbers[start:], positions[start:]
 
-            # print("OptiTracker column_means, this frame:")
-            # pprint(this_frame)
+        if fill and self.__max_gap:
+            positions = fill_gaps(
+                frame_numbers, positions, self.__max_gap, self.__gap_fill
+            )
 
-            # if not len(frame):
-            #     tmp = frame_number - 1
-            #     while not len(frame) and tmp >= start:
-            #         frame = frames[frames["frame_number"] == tmp,]
-            #         tmp -= 1
+        return frame_numbers, positions
 
+    def __window_start(self, frame_numbers: np.ndarray, num_frames: int) -> int:
+        """
+        Find the first of the given frames within num_frames frame periods of the newest.
 
-            idx = frame_number - start
-            means[idx]["pos_x"] = np.mean(this_frame["pos_x"])
-            means[idx]["pos_y"] = np.mean(this_frame["pos_y"])
-            means[idx]["pos_z"] = np.mean(this_frame["pos_z"])
+        Args:
+            frame_numbers (np.ndarray): Increasing frame numbers, newest last, as
+                add_frame() and __to_dense() guarantee
+            num_frames (int): Window length in frame periods
 
-            idx += 1
+        Returns:
+            int: Index of the oldest frame inside the window
+        """
+        if len(frame_numbers) == 0:
+            return 0
 
-            # except RuntimeWarning as e:
-            #     means[idx]["pos_x"] = 0.0
-            #     means[idx]["pos_y"] = 0.0
-            #     means[idx]["pos_z"] = 0.0
+        return int(
+            np.searchsorted(frame_numbers, frame_numbers[-1] - num_frames, side="right")
+        )
 
-        # if smooth:
-        #     means = self.__smooth(frames=means)
+    def __to_dense(self, frames: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Arrange per-marker rows (as stored in data files) into a dense array.
 
-        return means
+        Each row's marker ID is its position among the rows of its frame.
+
+        Args:
+            frames (np.ndarray): Structured array with one row per marker
 
-    def __query_frames(self, num_frames: int = 0) -> np.ndarray:
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Frame numbers, and [frames, markers, 3] positions
         """
-        Query and process frame data from the data file.
+        frame_numbers = frames["frame_number"]
+        xyz = np.column_stack([frames["pos_x"], frames["pos_y"], frames["pos_z"]])
+        mc = self.__marker_count
+
+        # Fast path: rows arrive grouped by frame, each frame holding a full marker set
+        if (
+            len(frames) % mc == 0
+            and (frame_numbers.reshape(-1, mc) == frame_numbers[::mc, None]).all()
+            and (np.diff(frame_numbers[::mc]) > 0).all()
+        ):
+            return frame_numbers[::mc].astype(np.int64), xyz.reshape(-1, mc, 3)
+
+        # General path: group rows by frame number, ranking rows within each frame
+        unique_frames, group = np.unique(frame_numbers, return_inverse=True)
+
+        order = np.argsort(group, kind="stable")
+        starts = np.searchsorted(group[order], np.arange(len(unique_frames)))
+        marker_ids = np.empty(len(frames), dtype=np.int64)
+        marker_ids[order] = np.arange(len(frames)) - starts[group[order]]
+
+        # Markers beyond marker_count are dropped; missing ones stay NaN
+        keep = marker_ids < mc
+        positions = np.full((len(unique_frames), mc, 3), np.nan)
+        positions[group[keep], marker_ids[keep]] = xyz[keep]
+
+        return unique_frames.astype(np.int64), positions
+
+    def __read_frames(self, num_frames: int = 0) -> np.ndarray:
+        """
+        Read and process frame data from the data file.
 
         Args:
             num_frames (int, optional): Number of frames to query. Defaults to window_size when empty.
@@ -324,6 +821,9 @@ class OptiTracker(object):
             FileNotFoundError: If data directory does not exist
         """
 
+        if self.__database != "":
+            return self.__read_database(num_frames)
+
         if self.__data_dir == "":
             raise ValueError("No data directory was set.")
 
@@ -333,6 +833,12 @@ class OptiTracker(object):
         if num_frames < 0:
             raise ValueError("Number of frames cannot be negative.")
 
+        if num_frames == 0:
+            num_frames = self.__window_size
+
+        if is_frame_file(self.__data_dir):
+            return self.__read_frame_file(num_frames)
+
         with open(self.__data_dir, "r") as file:
             header = file.readline().strip().split(",")
 
@@ -363,10 +869,9 @@ class OptiTracker(object):
 
         for col in ['pos_x', 'pos_y', 'pos_z']:
             # NOTE: originally rescaled by 1000x.
-            data[col] = np.rint(data[col] * 100).astype(np.int32)
-
-        if num_frames == 0:
-            num_frames = self.__window_size
+            # kept as float cm, matching the buffer; rounding to int would
+            # quantise to 1 cm and turn missing (NaN) markers into INT_MIN
+            data[col] = data[col] * 100
 
         # Calculate which frames to include
         last_frame = data["frame_number"][-1]
@@ -376,12 +881,108 @@ class OptiTracker(object):
         data = data[data["frame_number"] > lookback]
 
         return data
-    
-    def __connect(self, db_name: str = "optitracker.db") -> sqlite3.Connection:
+
+    def __read_frame_file(self, num_frames: int) -> np.ndarray:
+        """
+        Read the last frames of a binary frame file via a memory map.
+
+        Records are ordered by frame number, so the window start is found by
+        binary search within a tail of the file sized for the window (marker_count
+        records per frame, widened if frames held more), and only that tail is
+        ever paged in.
+
+        Args:
+            num_frames (int): Number of frames to query
+
+        Returns:
+            np.ndarray: Array of queried frame data
+        """
+        records = open_frame_file(self.__data_dir)
+
+        if len(records) == 0:
+            raise ValueError(f"No frames recorded in:\n{self.__data_dir}")
+
+        lookback = int(records[-1]["frame_number"]) - num_frames
+
+        # searching a field of the whole memmap would copy the whole column, so
+        # search a tail just long enough to start at or before the window
+        rows = max(num_frames * self.__marker_count, 1)
+        while True:
+            tail = records[-rows:]
+            frame_numbers = tail["frame_number"]
+            if rows >= len(records) or frame_numbers[0] <= lookback:
+                break
+            rows *= 2
+
+        tail = tail[np.searchsorted(frame_numbers, lookback, side="right") :]
+
+        data = np.zeros(
+            len(tail),
+            dtype=[
+                ("frame_number", "i8"),
+                ("pos_x", "f8"),
+                ("pos_y", "f8"),
+                ("pos_z", "f8"),
+            ],
+        )
+
+        data["frame_number"] = tail["frame_number"]
+        for col in ["pos_x", "pos_y", "pos_z"]:
+            data[col] = tail[col] * 100
+
+        return data
+
+    def __read_database(self, num_frames: int) -> np.ndarray:
         """
-        Connect to the SQLite database.
+        Read the trial's last frames from the database via its frames index.
+
+        Args:
+            num_frames (int): Number of frames to query
+
+        Returns:
+            np.ndarray: Array of queried frame data
+        """
+        if num_frames < 0:
+            raise ValueError("Number of frames cannot be negative.")
+
+        if num_frames == 0:
+            num_frames = self.__window_size
+
+        rows = query_latest_frames(self.__connect(), self.__trial, num_frames)
+
+        if len(rows) == 0:
+            raise ValueError(
+                f"No frames recorded for trial {self.__trial} in:\n{self.__database}"
+            )
+
+        return self.__rows_to_cm(rows)
+
+    def __rows_to_cm(self, rows: np.ndarray) -> np.ndarray:
+        """Convert frame store rows (metres) to the frame data layout, in cm."""
+        data = np.zeros(
+            len(rows),
+            dtype=[
+                ("frame_number", "i8"),
+                ("pos_x", "f8"),
+                ("pos_y", "f8"),
+                ("pos_z", "f8"),
+            ],
+        )
+
+        data["frame_number"] = rows["frame_number"]
+        for col in ["pos_x", "pos_y", "pos_z"]:
+            data[col] = rows[col] * 100
+
+        return data
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        Connect to the SQLite frame store, once.
 
         Returns:
             sqlite3.Connection: Connection object
         """
-        return sqlite3.connect(db_name)
+        if self.__db is None:
+            self.__db = connect_frame_store(self.__database)
+
+        return self.__db
@@ -0,0 +1,257 @@
+"""
+UDP receive tuning for the NatNet channels.
+
+At high frame rates with large marker sets, frames can arrive faster than a
+Python thread wakes to read them. The kernel then queues them in the socket's
+receive buffer, and drops them silently once that buffer is full. This module
+sizes that buffer, reads the kernel's drop counters, and drains several
+queued datagrams per wake-up (recvmmsg on Linux) rather than one per call.
+"""
+
+import ctypes
+import errno
+import os
+import select
+import socket
+from typing import Dict, List, Union
+
+# Linux doubles SO_RCVBUF requests to leave room for bookkeeping, and reports
+# the doubled value back
+_KERNEL_OVERHEAD = 2 if os.name == "posix" and os.uname().sysname == "Linux" else 1
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_recvmmsg() -> Union[ctypes._CFuncPtr, None]:
+    try:
+        recvmmsg = ctypes.CDLL(None, use_errno=True).recvmmsg
+    except (AttributeError, OSError, TypeError):
+        return None
+
+    recvmmsg.argtypes = [
+        ctypes.c_int,
+        ctypes.POINTER(_mmsghdr),
+        ctypes.c_uint,
+        ctypes.c_int,
+        ctypes.c_void_p,
+    ]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+_recvmmsg = _load_recvmmsg()
+
+
+def set_receive_buffer(sock: socket.socket, size: int) -> int:
+    """
+    Request a receive buffer size, returning the size the kernel applied.
+
+    The kernel caps requests at its configured maximum (net.core.rmem_max on
+    Linux) without raising, so callers should compare the result to size.
+
+    Args:
+        sock (socket.socket): Socket to configure
+        size (int): Requested buffer size in bytes
+
+    Returns:
+        int: Buffer size actually applied, in bytes of payload
+    """
+    if size < 1:
+        raise ValueError("Receive buffer size must be positive.")
+
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    return receive_buffer_size(sock)
+
+
+def receive_buffer_size(sock: socket.socket) -> int:
+    """Get a socket's receive buffer size, comparable to what was requested."""
+    return sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // _KERNEL_OVERHEAD
+
+
+def kernel_socket_stats(sock: socket.socket) -> Dict[str, Union[int, None]]:
+    """
+    Read the kernel's counters for a UDP socket, where available (Linux).
+
+    Args:
+        sock (socket.socket): An open UDP socket
+
+    Returns:
+        Dict[str, Union[int, None]]:
+            receive_buffer (int): Applied receive buffer size, in bytes
+            queued (int): Bytes waiting to be read, or None if unavailable
+            drops (int): Datagrams dropped since the socket opened (e.g. on a
+                full buffer), or None if unavailable
+    """
+    stats = {"receive_buffer": receive_buffer_size(sock), "queued": None, "drops": None}
+
+    # /proc/net/udp lists sockets by inode, which fstat reports for a socket fd
+    inode = str(os.fstat(sock.fileno()).st_ino)
+
+    for table in ("/proc/net/udp", "/proc/net/udp6"):
+        try:
+            with open(table) as file:
+                rows = file.readlines()[1:]
+        except OSError:
+            continue
+
+        for row in rows:
+            fields = row.split()
+            if len(fields) > 12 and fields[9] == inode:
+                stats["queued"] = int(fields[4].split(":")[1], 16)
+                stats["drops"] = int(fields[12])
+                return stats
+
+    return stats
+
+
+class BatchReceiver(object):
+    """
+    Drains up to batch_size queued datagrams from a socket per wake-up.
+
+    Waits (select) until the socket is readable, then reads everything queued,
+    up to batch_size datagrams, in one recvmmsg call on Linux or a run of
+    non-blocking recv_into calls elsewhere. Datagrams land in slots of one
+    preallocated buffer, so nothing allocates per packet; the views returned
+    by packets() are only valid until the next receive().
+
+    Attributes:
+        batch_size (int): Maximum datagrams read per receive()
+        batched (bool): True if recvmmsg is in use (one system call per batch)
+
+    Methods:
+        receive(timeout): Wait for datagrams and read all queued, returning the count
+        packets(count): Get views onto the datagrams read by the last receive()
+    """
+
+    def __init__(
+        self, sock: socket.socket, batch_size: int = 32, packet_size: int = 65536
+    ):
+        """
+        Initialize the BatchReceiver object.
+
+        Args:
+            sock (socket.socket): UDP socket to read from
+            batch_size (int, optional): Maximum datagrams per receive(). Defaults to 32.
+            packet_size (int, optional): Largest datagram expected. Defaults to 64k.
+        """
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least one datagram.")
+
+        self.__socket = sock
+        self.__batch_size = batch_size
+        self.__packet_size = packet_size
+
+        self.__buffer = bytearray(batch_size * packet_size)
+        self.__view = memoryview(self.__buffer)
+        self.__lengths = [0] * batch_size
+
+        self.__batched = _recvmmsg is not None
+        if self.__batched:
+            base = ctypes.addressof(ctypes.c_char.from_buffer(self.__buffer))
+            self.__iovecs = (_iovec * batch_size)()
+            self.__headers = (_mmsghdr * batch_size)()
+
+            for i in range(batch_size):
+                self.__iovecs[i].iov_base = base + i * packet_size
+                self.__iovecs[i].iov_len = packet_size
+                self.__headers[i].msg_hdr.msg_iov = ctypes.pointer(self.__iovecs[i])
+                self.__headers[i].msg_hdr.msg_iovlen = 1
+
+    @property
+    def batch_size(self) -> int:
+        return self.__batch_size
+
+    @property
+    def batched(self) -> bool:
+        return self.__batched
+
+    def receive(self, timeout: Union[float, None] = None) -> int:
+        """
+        Wait until datagrams are queued, then read as many as fit in one batch.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to None (forever).
+
+        Returns:
+            int: Number of datagrams read (0 on timeout, or if the datagram that
+                woke select was gone by the time it was read)
+
+        Raises:
+            OSError: If the socket fails or has been closed
+        """
+        readable, _, _ = select.select([self.__socket], [], [], timeout)
+        if not readable:
+            return 0
+
+        if self.__batched:
+            count = _recvmmsg(
+                self.__socket.fileno(),
+                self.__headers,
+                self.__batch_size,
+                socket.MSG_DONTWAIT,
+                None,
+            )
+            if count < 0:
+                error = ctypes.get_errno()
+                # select can report a datagram the kernel then discards (e.g. a bad checksum)
+                if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return 0
+                raise OSError(error, os.strerror(error))
+
+            for i in range(count):
+                self.__lengths[i] = self.__headers[i].msg_len
+
+            return count
+
+        # no recvmmsg: one call per datagram, but still drained in one wake-up
+        flags = getattr(socket, "MSG_DONTWAIT", 0)
+        count = 0
+        while count < self.__batch_size:
+            start = count * self.__packet_size
+            try:
+                self.__lengths[count] = self.__socket.recv_into(
+                    self.__view[start : start + self.__packet_size],
+                    self.__packet_size,
+                    flags,
+                )
+            except BlockingIOError:
+                break
+
+            count += 1
+            if not flags:
+                break
+
+        return count
+
+    def packets(self, count: int) -> List[memoryview]:
+        """
+        Get views onto the datagrams read by the last receive().
+
+        Args:
+            count (int): Count returned by receive()
+
+        Returns:
+            List[memoryview]: One view per datagram, valid until the next receive()
+        """
+        size = self.__packet_size
+        return [
+            self.__view[i * size : i * size + self.__lengths[i]] for i in range(count)
+        ]
@@ -1,17 +1,5 @@
 # type: ignore
-from construct import this, Float32l, Int16sl, Struct, Computed, Int32ul
-
-
-def decodeMarkerID(obj, _):
-    return obj.encoded_id & 0x0000FFFF
-
-
-def decodeModelID(obj, _):
-    return obj.encoded_id >> 16
-
-
-def trackingValid(obj, _):
-    return (obj.error & 0x01) != 0
+from construct import Float32l, Float64l, Int16sl, Struct, Computed, Int32ul, Int64ul
 
 
 unlabeledMarkerStruct = Struct(
@@ -22,8 +10,8 @@ unlabeledMarkerStruct = Struct(
 
 labeledMarkerStruct = Struct(
     "id" / Int32ul,
-    "marker_id" / Computed(this.id * decodeMarkerID),
-    "model_id" / Computed(this.id * decodeModelID),
+    "marker_id" / Computed(lambda ctx: ctx.id & 0x0000FFFF),
+    "model_id" / Computed(lambda ctx: ctx.id >> 16),
     "pos_x" / Float32l,
     "pos_y" / Float32l,
     "pos_z" / Float32l,
@@ -38,11 +26,26 @@ rigidBodyStruct = Struct(
     "pos_x" / Float32l,
     "pos_y" / Float32l,
     "pos_z" / Float32l,
-    "rot_w" / Float32l,
     "rot_x" / Float32l,
     "rot_y" / Float32l,
     "rot_z" / Float32l,
+    "rot_w" / Float32l,
     "error" / Float32l,
     "tracking" / Int16sl,
     "is_valid" / Computed(lambda ctx: (ctx.tracking & 0x01) != 0),
 )
+
+
+frameSuffixStruct = Struct(
+    "timecode" / Int32ul,
+    "timecode_sub" / Int32ul,
+    "timestamp" / Float64l,
+    "stamp_camera_mid_exposure" / Int64ul,
+    "stamp_data_received" / Int64ul,
+    "stamp_transmit" / Int64ul,
+    "precision_timestamp_secs" / Int32ul,
+    "precision_timestamp_frac_secs" / Int32ul,
+    "param" / Int16sl,
+    "is_recording" / Computed(lambda ctx: (ctx.param & 0x01) != 0),
+    "tracked_models_changed" / Computed(lambda ctx: (ctx.param & 0x02) != 0),
+)
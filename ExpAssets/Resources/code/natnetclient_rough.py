@@ -18,6 +18,7 @@
 import socket
 import struct
 import time
+import numpy as np
 from threading import Thread
 from typing import Any, Callable, List, Tuple, Union
 
@@ -25,7 +26,14 @@ from typing import Any, Callable, List, Tuple, Union
 # print(os.getcwd())
 # quit()
 
-from MotiveStreamParser import MotiveStreamParser
+from MotiveStreamParser import (
+    MotiveStreamParser,
+    labeled_marker_dtype,
+    rigid_body_dtype,
+)
+from FrameSequence import FrameSequence
+from LatencyLog import PARSE
+from UdpReceive import BatchReceiver, kernel_socket_stats, set_receive_buffer
 
 def trace(*args):
     # uncomment the one you want to use
@@ -47,8 +55,19 @@ def trace_mf(*args):
     # print(''.join(map(str, args)))
 
 
-def get_message_id(bytestream: bytes) -> int:
-    message_id = int.from_bytes(bytestream[0:2], byteorder="little")
+# message ID and packet size prefix every NatNet packet
+_message_header = struct.Struct("<HH")
+
+# 64k covers the largest UDP datagram
+RECV_BUFFER_SIZE = 64 * 1024
+
+
+def _concatenate(parts: List[np.ndarray], dtype: Any) -> np.ndarray:
+    return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+
+def get_message_id(bytestream: bytes, offset: int = 0) -> int:
+    message_id = int.from_bytes(bytestream[offset : offset + 2], byteorder="little")
     return message_id
 
 
@@ -82,31 +101,70 @@ class NatNetClient:
             "is_locked": False,
             # Server has the ability to change bitstream version
             "can_change_bitstream_version": False,
+            # Decode frames with the struct/NumPy fast path; False uses the construct reference parser
+            "fast_parsing": True,
+            # Discard frames arriving out of order or twice, rather than passing them on
+            "discard_stale_frames": True,
+            # A backward jump of more than this many frames is a restart of the
+            # server's frame numbering rather than a reordered frame
+            "stream_reset_frames": 10,
+            # Marker set labels to decode (e.g. ("hand",)); None decodes every set
+            "marker_set_labels": None,
+            # Socket receive buffer in bytes (0 keeps the OS default); a larger one
+            # absorbs bursts the receive threads are too slow to read in time
+            "receive_buffer_size": 0,
+            # Drain up to batch_size queued datagrams per wake-up on the data channel
+            "batch_receive": False,
+            "batch_size": 32,
         }
 
         self.settings.update(instance_settings)
 
         self.prefix_listener = None
         self.markers_listener = None
+        # Called as (frame_number, label, ndarray[n_markers, 3]) per marker set.
+        # The array may be a view onto the receive buffer; copy it to keep it.
+        self.marker_arrays_listener = None
+        # The remaining frame sections are only decoded when their listener is set.
+        # Record arrays use the dtypes in MotiveStreamParser and, like marker
+        # arrays, may be views onto the receive buffer.
+        # (frame_number, rigid_body_dtype[n])
         self.rigid_bodies_listener = None
+        # (frame_number, labeled_marker_dtype[n])
         self.labeled_markers_listener = None
+        # (frame_number, ndarray[n_markers, 3])
         self.legacy_markers_listener = None
+        # (frame_number, skeleton_ids[n], rigid_body_dtype[n])
         self.skeletons_listener = None
+        # (frame_number, asset_ids[n], rigid_body_dtype[n])
         self.asset_rigid_bodies_listener = None
+        # (frame_number, asset_ids[n], labeled_marker_dtype[n])
         self.asset_markers_listener = None
         self.channels_listener = None
+        # (frame_number, {device_id: [samples per channel]})
         self.force_plates_listener = None
         self.devices_listener = None
+        # (frame_number, dict of timecode, timestamps and frame parameters)
         self.suffix_listener = None
 
         self.description_listener = None
 
+        # Optional LatencyLog; frames are stamped on receipt and parse when set
+        self.latency_log = None
+
         self.command_thread = None
         self.data_thread = None
         self.command_socket = None
         self.data_socket = None
 
         self.stop_threads = False
+        # While paused, sockets and threads stay up but frames are not unpacked
+        self.paused = False
+
+        # Sequence continuity of frames unpacked since the last reset_frame_stats()
+        self.__sequence = FrameSequence(
+            self.settings["stream_reset_frames"], self.settings["discard_stale_frames"]
+        )
 
     # Constants corresponding to Client/server message ids
     NAT_CONNECT = 0
@@ -123,57 +181,190 @@ class NatNetClient:
     NAT_UNRECOGNIZED_REQUEST = 100
     NAT_UNDEFINED = 999999.9999
 
-    def __unpack_data(self, stream: bytes, stream_version: List[int] = []) -> int:
-        parser = MotiveStreamParser(stream)
+    def __unpack_data(
+        self, stream: bytes, offset: int = 0, stream_version: List[int] = []
+    ) -> int:
+        parser = MotiveStreamParser(
+            stream, fast=self.settings["fast_parsing"], offset=offset
+        )
         prefix = parser.parse("frame_number")
 
-        n_marker_sets = parser.parse("count")
-        _ = parser.parse("size")
-
-        # TODO: Pointer() might aide skipping
-        for _ in range(0, n_marker_sets):
-            set_label = parser.parse("label")
-
-            marker_set = {"label": set_label, "markers": []}
-
-            n_markers_in_set = parser.parse("count")
-
-            for _ in range(n_markers_in_set):
-                marker = parser.parse("unlabeled_marker")
-                marker["frame_number"] = prefix
-                marker_set["markers"].append(marker)
-
-            self.markers_listener(marker_set)
-
-        # n_legacy_markers = parser.parse("count")
-        # _ = parser.parse("size")
-        #
-        # legacy_markers = []
-        # for _ in range(n_legacy_markers):
-        #     legacy_marker = parser.parse("legacy_marker")
-        #     legacy_marker["frame"] = prefix["frame"]
-        #     legacy_markers.append(legacy_marker)
-        #
-        # self.legacy_markers_listener(legacy_markers)
-        #
-        # n_rigid_bodies = parser.parse("count")
-        # _ = parser.parse("size")
-        #
-        # rigid_bodies = []
-        # for _ in range(n_rigid_bodies):
-        #     rigid_body = parser.parse("rigid_body")
-        #     rigid_body["frame"] = prefix["frame"]
-        #     rigid_bodies.append(rigid_body)
-        #
-        # self.rigid_bodies_listener(rigid_bodies)
-
-        return parser.tell()
+        if not self.__sequence.check(prefix):
+            return parser.tell() - offset
+
+        latency_log = self.latency_log
+        if latency_log is not None:
+            latency_log.begin(prefix)
+
+        # Marker-only consumers never touch the rest of the frame
+        decode_sections = any(
+            listener is not None
+            for listener in (
+                self.legacy_markers_listener,
+                self.rigid_bodies_listener,
+                self.skeletons_listener,
+                self.asset_rigid_bodies_listener,
+                self.asset_markers_listener,
+                self.labeled_markers_listener,
+                self.force_plates_listener,
+                self.devices_listener,
+                self.suffix_listener,
+            )
+        )
+
+        # locate every part of the frame from its count/size fields alone
+        parser.seek_to(offset)
+        index = parser.index(sections=decode_sections)
+
+        labels = self.settings["marker_set_labels"]
+
+        for set_label, set_offset, n_markers_in_set in index.marker_sets:
+            if self.markers_listener is None and self.marker_arrays_listener is None:
+                break
+
+            if labels is not None and set_label not in labels:
+                continue
+
+            parser.seek_to(set_offset)
+
+            if parser.fast or self.marker_arrays_listener is not None:
+                # whole set decodes in one call
+                markers = parser.parse_markers(n_markers_in_set)
+
+                if latency_log is not None:
+                    latency_log.stamp(PARSE)
+
+                if self.marker_arrays_listener is not None:
+                    self.marker_arrays_listener(prefix, set_label, markers)
+
+                if self.markers_listener is not None:
+                    self.markers_listener(
+                        {
+                            "label": set_label,
+                            "markers": [
+                                {"pos_x": x, "pos_y": y, "pos_z": z, "frame_number": prefix}
+                                for x, y, z in markers.tolist()
+                            ],
+                        }
+                    )
+            else:
+                marker_set = {"label": set_label, "markers": []}
+
+                for _ in range(n_markers_in_set):
+                    marker = parser.parse("unlabeled_marker")
+                    marker["frame_number"] = prefix
+                    marker_set["markers"].append(marker)
+
+                self.markers_listener(marker_set)
+
+        if not decode_sections:
+            return index.end - offset
+
+        # Sections (NatNet 4.1) are decoded only when subscribed; the rest are
+        # never visited, as the index already knows where each one starts
+        sections = index.sections
+
+        if self.legacy_markers_listener is not None:
+            section_offset, count, _ = sections["legacy_markers"]
+            parser.seek_to(section_offset)
+            self.legacy_markers_listener(prefix, parser.parse_markers(count))
+
+        if self.rigid_bodies_listener is not None:
+            section_offset, count, _ = sections["rigid_bodies"]
+            parser.seek_to(section_offset)
+            self.rigid_bodies_listener(prefix, parser.parse_records("rigid_body", count))
+
+        if self.skeletons_listener is not None:
+            section_offset, count, _ = sections["skeletons"]
+            parser.seek_to(section_offset)
+            skeleton_ids, rigid_bodies = [], []
+
+            for _ in range(count):
+                skeleton_id = parser.parse("id")
+                bodies = parser.parse_records("rigid_body", parser.parse("count"))
+                skeleton_ids.append(np.full(len(bodies), skeleton_id, dtype=np.int32))
+                rigid_bodies.append(bodies)
+
+            self.skeletons_listener(
+                prefix,
+                _concatenate(skeleton_ids, np.int32),
+                _concatenate(rigid_bodies, rigid_body_dtype),
+            )
+
+        if (
+            self.asset_rigid_bodies_listener is not None
+            or self.asset_markers_listener is not None
+        ):
+            section_offset, count, _ = sections["assets"]
+            parser.seek_to(section_offset)
+            body_ids, rigid_bodies, marker_ids, markers = [], [], [], []
+
+            for _ in range(count):
+                asset_id = parser.parse("id")
+                bodies = parser.parse_records("rigid_body", parser.parse("count"))
+                asset_markers = parser.parse_records(
+                    "labeled_marker", parser.parse("count")
+                )
+
+                body_ids.append(np.full(len(bodies), asset_id, dtype=np.int32))
+                rigid_bodies.append(bodies)
+                marker_ids.append(np.full(len(asset_markers), asset_id, dtype=np.int32))
+                markers.append(asset_markers)
+
+            if self.asset_rigid_bodies_listener is not None:
+                self.asset_rigid_bodies_listener(
+                    prefix,
+                    _concatenate(body_ids, np.int32),
+                    _concatenate(rigid_bodies, rigid_body_dtype),
+                )
+
+            if self.asset_markers_listener is not None:
+                self.asset_markers_listener(
+                    prefix,
+                    _concatenate(marker_ids, np.int32),
+                    _concatenate(markers, labeled_marker_dtype),
+                )
+
+        if self.labeled_markers_listener is not None:
+            section_offset, count, _ = sections["labeled_markers"]
+            parser.seek_to(section_offset)
+            self.labeled_markers_listener(
+                prefix, parser.parse_records("labeled_marker", count)
+            )
+
+        for name, listener in (
+            ("force_plates", self.force_plates_listener),
+            ("devices", self.devices_listener),
+        ):
+            if listener is None:
+                continue
+
+            section_offset, count, _ = sections[name]
+            parser.seek_to(section_offset)
+
+            # {device ID: [samples per channel]}; channels are few and short
+            channels = {}
+            for _ in range(count):
+                device_id = parser.parse("id")
+                channels[device_id] = [
+                    parser.parse_floats(parser.parse("count"))
+                    for _ in range(parser.parse("count"))
+                ]
+
+            listener(prefix, channels)
+
+        parser.seek_to(index.end)
+
+        if self.suffix_listener is not None:
+            self.suffix_listener(prefix, parser.parse_suffix())
+
+        return parser.tell() - offset
 
     # Functions for unpacking descriptions, called by __unpack_descriptions #
     # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
     def __unpack_descriptions(
-        self, bytestream: bytes, stream_version: List[int] = None
+        self, bytestream: bytes, offset: int = 0, stream_version: List[int] = None
     ) -> int:
         pass
 
@@ -181,9 +372,8 @@ class NatNetClient:
     # # # # # # # # # # # # # # #
 
     def __handle_response_message(
-        self, bytestream: bytes, packet_size: int, message_id: int
+        self, bytestream: bytes, offset: int, packet_size: int, message_id: int
     ) -> int:
-        offset = 0
         if message_id == self.NAT_RESPONSE:
             if packet_size == 4:
                 command_response = int.from_bytes(
@@ -196,9 +386,7 @@ class NatNetClient:
             else:
                 message, _, _ = bytes(bytestream[offset:]).partition(b"\0")
                 if message.decode("utf-8").startswith("Bitstream"):
-                    nn_version = self.__unpack_bitstream_info(
-                        bytestream[offset:], packet_size
-                    )
+                    nn_version = self.__unpack_bitstream_info(message)
                     # Update the server version
                     self.settings["nat_net_stream_version_server"] = [
                         int(v) for v in nn_version
@@ -347,12 +535,14 @@ class NatNetClient:
         if not self.settings["use_multicast"]:
             in_socket.settimeout(2.0)
 
-        # 64k buffer size
-        recv_buffer_size = 64 * 1024
+        # receive into one reusable buffer rather than allocating per packet
+        buffer = bytearray(RECV_BUFFER_SIZE)
+        bytestream = memoryview(buffer)
+
         while not stop():
             # Block for input
             try:
-                bytestream, _ = in_socket.recvfrom(recv_buffer_size)
+                nbytes = in_socket.recv_into(bytestream)
             except (
                 socket.error,
                 socket.herror,
@@ -369,7 +559,11 @@ class NatNetClient:
                     print("shutting down")
                 return 1
 
-            if bytestream:
+            if nbytes:
+                # unicast frames arrive on the command socket
+                if self.latency_log is not None:
+                    self.latency_log.received()
+
                 # peek ahead at message_id
                 message_id = get_message_id(bytestream)
                 tmp_str = f"mi_{message_id:.1f}"
@@ -381,8 +575,7 @@ class NatNetClient:
                         1 if message_id_dict[tmp_str] % print_level == 0 else 0
                     )
 
-                message_id = self.__process_message(bytestream)
-                bytestream = bytearray()
+                message_id = self.__process_message(bytestream[:nbytes])
 
             if not self.settings["use_multicast"] and not stop():
                 self.send_keep_alive(
@@ -396,14 +589,18 @@ class NatNetClient:
     def __data_thread_function(
         self, in_socket: socket.socket, stop: Callable, gprint_level: Callable
     ) -> int:
+        if self.settings["batch_receive"]:
+            return self.__batch_data_thread_function(in_socket, stop)
+
         message_id_dict = {}
-        # 64k buffer size
-        recv_buffer_size = 64 * 1024
+        # receive into one reusable buffer rather than allocating per packet
+        buffer = bytearray(RECV_BUFFER_SIZE)
+        bytestream = memoryview(buffer)
 
         while not stop():
             # Block for input
             try:
-                bytestream, _ = in_socket.recvfrom(recv_buffer_size)
+                nbytes = in_socket.recv_into(bytestream)
             except (
                 socket.error,
                 socket.herror,
@@ -414,7 +611,10 @@ class NatNetClient:
                     print(f"ERROR: data socket access error occurred:\n{e}")
                 return 1
 
-            if bytestream:
+            if nbytes:
+                if self.latency_log is not None:
+                    self.latency_log.received()
+
                 # peek ahead at message_id
                 message_id = get_message_id(bytestream)
                 tmp_str = f"mi_{message_id:.1f}"
@@ -426,22 +626,62 @@ class NatNetClient:
                         1 if message_id_dict[tmp_str] % print_level == 0 else 0
                     )
 
-                message_id = self.__process_message(bytestream)
-                bytestream = bytearray()
+                message_id = self.__process_message(bytestream[:nbytes])
 
         return 0
 
+    def __batch_data_thread_function(
+        self, in_socket: socket.socket, stop: Callable
+    ) -> int:
+        receiver = BatchReceiver(
+            in_socket, self.settings["batch_size"], RECV_BUFFER_SIZE
+        )
+
+        while not stop():
+            try:
+                # time out now and then to recheck stop()
+                count = receiver.receive(timeout=0.5)
+            except (OSError, ValueError) as e:
+                # ValueError: select() on a socket closed by shutdown()
+                if not stop():
+                    print(f"ERROR: data socket access error occurred:\n{e}")
+                return 1
+
+            for packet in receiver.packets(count):
+                # zero-length reads follow shutdown()
+                if len(packet) < _message_header.size:
+                    continue
+
+                if self.latency_log is not None:
+                    self.latency_log.received()
+
+                self.__process_message(packet)
+
+        return 0
+
+    def __size_receive_buffer(self, sock: socket.socket) -> None:
+        requested = self.settings["receive_buffer_size"]
+        if not requested:
+            return
+
+        applied = set_receive_buffer(sock, requested)
+        if applied < requested:
+            print(
+                f"WARNING: receive buffer capped at {applied} of {requested} bytes "
+                "requested; raise the OS limit (net.core.rmem_max on Linux) to allow more"
+            )
+
     def __process_message(self, bytestream: bytes) -> int:
-        message_id = get_message_id(bytestream)
-        packet_size = int.from_bytes(bytestream[2:4], byteorder="little")
+        message_id, packet_size = _message_header.unpack_from(bytestream, 0)
 
         # skip the 4 bytes for message ID and packet_size
         offset = 4
         if message_id == self.NAT_FRAMEOFDATA:
-            offset += self.__unpack_data(bytestream[offset:])
+            if not self.paused:
+                offset += self.__unpack_data(bytestream, offset)
 
         elif message_id == self.NAT_MODELDEF:
-            offset += self.__unpack_descriptions(bytestream[offset:])
+            offset += self.__unpack_descriptions(bytestream, offset)
 
         elif message_id == self.NAT_SERVERINFO:
             trace(
@@ -455,7 +695,7 @@ class NatNetClient:
             self.NAT_MESSAGESTRING,
         ]:
             offset = self.__handle_response_message(
-                bytestream[offset:], packet_size, message_id
+                bytestream, offset, packet_size, message_id
             )
 
         else:
@@ -631,6 +871,9 @@ class NatNetClient:
             return False
         self.settings["is_locked"] = True
 
+        for sock in (self.data_socket, self.command_socket):
+            self.__size_receive_buffer(sock)
+
         self.stop_threads = False
         # Create a separate thread for receiving data packets
         self.data_thread = Thread(
@@ -675,11 +918,54 @@ class NatNetClient:
         # self.send_request(self.command_socket, self.NAT_REQUEST_MODELDEF, "",  (self.settings['server_ip'], self.settings['command_port']) )
         return True
 
+    def pause(self) -> None:
+        """Stop delivering frames to listeners, keeping the session alive."""
+        self.paused = True
+
+    def resume(self) -> None:
+        """Resume delivering frames to listeners."""
+        # frames skipped while paused are not drops
+        self.__sequence.restart()
+        self.paused = False
+
+    @property
+    def frame_stats(self) -> dict:
+        """Get the frame sequence counters since the last reset_frame_stats()."""
+        return self.__sequence.stats
+
+    def reset_frame_stats(self) -> None:
+        """Zero the frame sequence counters (received, dropped, reordered, resets, ...)."""
+        self.__sequence.reset()
+
+    def socket_stats(self) -> dict:
+        """
+        Get the kernel's counters for the data and command sockets.
+
+        Drops here happen before any frame reaches the client (e.g. a full
+        receive buffer), so they are invisible to frame_stats unless they
+        leave a gap in the frame numbers.
+
+        Returns:
+            dict: {"data": ..., "command": ...}, each with receive_buffer (bytes),
+                queued (bytes waiting) and drops (datagrams); the last two are
+                None where the OS does not report them.
+        """
+        return {
+            "data": kernel_socket_stats(self.data_socket),
+            "command": kernel_socket_stats(self.command_socket),
+        }
+
     def shutdown(self) -> None:
         print("shutdown called")
         self.stop_threads = True
-        # closing sockets causes blocking recvfrom to throw
-        # an exception and break the loop
+        # shutting down wakes a blocked recv even when no more packets arrive;
+        # closing sockets then causes the next receive to throw and break the loop
+        for sock in (self.command_socket, self.data_socket):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
         self.command_socket.close()
         self.data_socket.close()
         # attempt to join the threads back.
@@ -0,0 +1,319 @@
+"""
+Benchmarks for the parse -> record -> query pipeline.
+
+Times each hot path on synthetic NatNet packets and synthetic trial files of
+increasing size, reporting per-call latency percentiles, throughput and peak
+Python heap allocation. Nothing here needs Motive or klibs:
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --quick --json bench.json
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from itertools import count
+from typing import Callable, Dict, List
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "ExpAssets",
+        "Resources",
+        "code",
+    ),
+)
+
+from FrameRecorder import (  # noqa: E402
+    BinaryFrameRecorder,
+    FrameRecorder,
+    SQLiteFrameRecorder,
+)
+from IngestProcess import IngestProcess  # noqa: E402
+from NatNetSimulator import (  # noqa: E402
+    NatNetSimulator,
+    build_frame,
+    synthetic_frames,
+)
+from natnetclient_rough import NatNetClient  # noqa: E402
+from OptiTracker import OptiTracker  # noqa: E402
+
+SAMPLE_RATE = 120
+
+# frame number field, just after the 4-byte message header of a frame packet
+_frame_number = struct.Struct("<I")
+
+
+def run(name: str, fn: Callable[[], object], calls: int, **params) -> Dict:
+    """
+    Time calls to fn and summarise them.
+
+    Args:
+        name (str): Benchmark name
+        fn (Callable): Zero-argument callable to time
+        calls (int): Number of timed calls (after a short warm-up)
+
+    Returns:
+        Dict: Latency percentiles (us), throughput (calls/s) and peak allocation (KiB)
+    """
+    for _ in range(min(calls // 10, 100)):
+        fn()
+
+    timings = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter_ns()
+        fn()
+        timings[i] = time.perf_counter_ns() - start
+
+    tracemalloc.start()
+    for _ in range(min(calls, 100)):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) / 1000
+
+    result = {
+        "name": name,
+        **params,
+        "p50_us": round(p50, 2),
+        "p95_us": round(p95, 2),
+        "p99_us": round(p99, 2),
+        "per_s": round(1e9 / timings.mean()),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+    print(
+        f"{name:<24} {json.dumps(params):<36} "
+        f"p50 {p50:>9.2f}us  p95 {p95:>9.2f}us  p99 {p99:>9.2f}us  "
+        f"{result['per_s']:>10}/s  {result['peak_kib']:>8}KiB"
+    )
+    return result
+
+
+def packet(marker_count: int, frame_number: int = 1) -> bytes:
+    _, marker_sets = next(synthetic_frames(marker_count, SAMPLE_RATE))
+    return build_frame(frame_number, marker_sets)
+
+
+def bench_parse(marker_counts: List[int], calls: int) -> List[Dict]:
+    results = []
+
+    for marker_count in marker_counts:
+        data = bytearray(packet(marker_count))
+
+        for fast in (True, False):
+            client = NatNetClient({"fast_parsing": fast})
+            client.marker_arrays_listener = lambda *_: None
+            unpack = client._NatNetClient__unpack_data  # type: ignore[attr-defined]
+
+            # a new frame number per call; repeats would only time the
+            # duplicate-frame early return
+            frame_numbers = count(1)
+
+            def unpack_next() -> int:
+                _frame_number.pack_into(data, 4, next(frame_numbers))
+                return unpack(data, 4)
+
+            results.append(
+                run(
+                    "unpack_data",
+                    unpack_next,
+                    calls if fast else max(calls // 10, 10),
+                    markers=marker_count,
+                    fast=fast,
+                )
+            )
+
+    return results
+
+
+def bench_record(marker_counts: List[int], calls: int, tmp: str) -> List[Dict]:
+    results = []
+
+    for marker_count in marker_counts:
+        positions = np.random.rand(marker_count, 3).astype("<f4")
+
+        for recorder_class in (FrameRecorder, BinaryFrameRecorder, SQLiteFrameRecorder):
+            path = os.path.join(tmp, f"record_{marker_count}.{recorder_class.__name__}")
+            recorder = recorder_class(path)
+            recorder.open()
+
+            frame = iter(range(1 << 62))
+            results.append(
+                run(
+                    "recorder.record",
+                    lambda: recorder.record(next(frame), positions),
+                    calls,
+                    markers=marker_count,
+                    format=recorder_class.__name__,
+                )
+            )
+
+            start = time.perf_counter()
+            recorder.close()
+            print(
+                f"{'':<24} close/final flush: {(time.perf_counter() - start) * 1000:.1f}ms"
+            )
+
+    return results
+
+
+def bench_query(buffer_sizes: List[int], calls: int) -> List[Dict]:
+    results = []
+
+    for buffer_size in buffer_sizes:
+        ot = OptiTracker(
+            marker_count=10,
+            sample_rate=SAMPLE_RATE,
+            window_size=5,
+            buffer_size=buffer_size,
+        )
+
+        for frame_number, marker_sets in synthetic_frames(10, SAMPLE_RATE):
+            if frame_number >= buffer_size:
+                break
+            ot.add_frame(frame_number, marker_sets["hand"])
+
+        for method in ("position", "velocity", "distance"):
+            results.append(
+                run(f"memory.{method}", getattr(ot, method), calls, frames=buffer_size)
+            )
+
+    return results
+
+
+def bench_ingest(marker_counts: List[int], duration: float) -> List[Dict]:
+    """
+    CPU time the experiment process spends relaying each frame from IngestProcess.
+
+    Frames stream over loopback from a simulator to the ingest child; the
+    listener does nothing, so the receive thread's CPU time per frame is the
+    relay alone (pipe wake-up, copy out of shared memory, torn-frame check).
+    Compare it with memory.add_frame, the work a real listener adds.
+    """
+    results = []
+    settings = {
+        "server_ip": "127.0.0.1",
+        "local_ip": "127.0.0.1",
+        "command_port": 1710,
+        "data_port": 1711,
+        "use_multicast": False,
+    }
+
+    for marker_count in marker_counts:
+        simulator = NatNetSimulator(
+            rate=SAMPLE_RATE * 4,
+            command_port=settings["command_port"],
+            data_port=settings["data_port"],
+        )
+        simulator.start()
+        ingest = IngestProcess(settings, marker_count=marker_count)
+
+        cpu = []
+        ingest.marker_arrays_listener = lambda *_: cpu.append(time.thread_time_ns())
+
+        ingest.startup()
+        simulator.wait_for_client()
+        simulator.stream(synthetic_frames(marker_count, SAMPLE_RATE * 4), duration)
+        time.sleep(0.2)
+        ingest.shutdown()
+        simulator.stop()
+
+        per_frame = (cpu[-1] - cpu[0]) / max(len(cpu) - 1, 1) / 1000 if cpu else np.nan
+        result = {
+            "name": "ingest.relay",
+            "markers": marker_count,
+            "frames": len(cpu),
+            "cpu_us_per_frame": round(per_frame, 2),
+        }
+        print(
+            f"{'ingest.relay':<24} {json.dumps({'markers': marker_count}):<36} "
+            f"cpu {per_frame:>9.2f}us/frame over {len(cpu)} frames"
+        )
+        results.append(result)
+
+        ot = OptiTracker(marker_count=marker_count, sample_rate=SAMPLE_RATE)
+        frames = synthetic_frames(marker_count, SAMPLE_RATE)
+
+        def add_next() -> None:
+            frame_number, marker_sets = next(frames)
+            ot.add_frame(frame_number, marker_sets["hand"])
+
+        results.append(run("memory.add_frame", add_next, 2000, markers=marker_count))
+
+    return results
+
+
+def bench_file_query(frame_counts: List[int], calls: int, tmp: str) -> List[Dict]:
+    results = []
+
+    for frame_count in frame_counts:
+        for recorder_class in (FrameRecorder, BinaryFrameRecorder, SQLiteFrameRecorder):
+            path = os.path.join(tmp, f"trial_{frame_count}.{recorder_class.__name__}")
+
+            with recorder_class(path) as recorder:
+                for frame_number, marker_sets in synthetic_frames(10, SAMPLE_RATE):
+                    if frame_number >= frame_count:
+                        break
+                    recorder.record(frame_number, marker_sets["hand"])
+
+            # the SQLite store is read through its index rather than as a file
+            source = "db_name" if recorder_class is SQLiteFrameRecorder else "data_dir"
+            ot = OptiTracker(
+                marker_count=10,
+                sample_rate=SAMPLE_RATE,
+                window_size=5,
+                **{source: path},
+            )
+            results.append(
+                run(
+                    "file.position",
+                    ot.position,
+                    (
+                        calls
+                        if recorder_class is not FrameRecorder
+                        else max(calls // 100, 5)
+                    ),
+                    frames=frame_count,
+                    format=recorder_class.__name__,
+                )
+            )
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="fewer sizes and calls")
+    parser.add_argument("--json", default="", help="write results to this file")
+    args = parser.parse_args()
+
+    calls = 500 if args.quick else 5000
+    marker_counts = [10, 200] if args.quick else [10, 50, 200, 1000]
+    buffer_sizes = [600, 6000] if args.quick else [600, 6000, 60000]
+    frame_counts = [600, 6000] if args.quick else [600, 6000, 60000]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        results += bench_parse(marker_counts, calls)
+        results += bench_record(marker_counts, calls, tmp)
+        results += bench_query(buffer_sizes, calls)
+        results += bench_file_query(frame_counts, calls, tmp)
+    results += bench_ingest(marker_counts[:2], 1.0 if args.quick else 5.0)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,10 @@
 __author__ = "Brett Feltmate"
 
 import os
-from csv import DictWriter
 from random import choice, shuffle
 
+import numpy as np
+
 import klibs
 from klibs import P
 from klibs.KLCommunication import message
@@ -19,6 +20,9 @@ from klibs.KLAudio import Tone
 
 from natnetclient_rough import NatNetClient  # type: ignore[import]
 from OptiTracker import OptiTracker  # type: ignore[import]
+from FrameRecorder import FrameRecorder, BinaryFrameRecorder, SQLiteFrameRecorder  # type: ignore[import]
+from LatencyLog import LatencyLog  # type: ignore[import]
+from IngestProcess import IngestProcess  # type: ignore[import]
 
 WHITE = (255, 255, 255, 255)
 GRUE = (90, 90, 96, 255)
@@ -45,11 +49,33 @@ class test_marker_pos_reporting(klibs.Experiment):
         # setup optitracker
         self.ot = OptiTracker(marker_count=10, sample_rate=120, window_size=5)
 
-        # setup motive client
-        self.nnc = NatNetClient()
+        # setup motive client, optionally receiving in its own process (off the GIL)
+        if P.opti_ingest_process:  # type: ignore[attr-defined]
+            self.nnc = IngestProcess(marker_count=self.ot.marker_count, label="hand")
+            # a dead or hung ingest process fails fast rather than stalling a trial
+            self.nnc.crash_listener = self.ingest_failed
+        else:
+            self.nnc = NatNetClient({"marker_set_labels": ("hand",)})
+
+        # set (from the ingest watcher thread) if the ingest process dies or hangs
+        self.ingest_failure = None
 
         # pass marker set listener to client for callback
-        self.nnc.markers_listener = self.marker_set_listener
+        self.nnc.marker_arrays_listener = self.marker_set_listener
+
+        # motion-to-photon stamps; a minute of frames per trial, preallocated once
+        self.latency = None
+        if P.record_latency:  # type: ignore[attr-defined]
+            self.latency = LatencyLog(capacity=self.ot.sample_rate * 60)
+            self.nnc.latency_log = self.latency
+            self.ot.latency_log = self.latency
+
+        # one session for the whole experiment; frames only flow during trials
+        self.nnc.pause()
+        self.nnc.startup()
+
+        # persists marker frames to disk off the data thread; opened per trial
+        self.recorder = None
 
         self.locs = {
             LEFT: (P.screen_c[0] - POS_OFFSET, P.screen_c[1]),  # type: ignore[attr-defined]
@@ -86,7 +112,29 @@ class test_marker_pos_reporting(klibs.Experiment):
         pass
 
     def trial_prep(self):
-        self.ot.data_dir = f"OptiData/{P.p_id}/trial_{P.trial_number}.csv"  # type: ignore[attr-defined]
+        self.ot.data_dir = f"OptiData/{P.p_id}/trial_{P.trial_number}.{P.opti_data_format}"  # type: ignore[attr-defined]
+        self.ot.clear()
+
+        if P.opti_data_format == "bin":  # type: ignore[attr-defined]
+            self.recorder = BinaryFrameRecorder(
+                self.ot.data_dir,
+                marker_count=self.ot.marker_count,
+                sample_rate=self.ot.sample_rate,
+            )
+        elif P.opti_data_format == "db":  # type: ignore[attr-defined]
+            # a frame store beside the klibs database, queried by OptiTracker as
+            # recorded; kept apart so klibs' own database keeps its journal mode
+            frames_db = os.path.splitext(P.database_path)[0] + "_frames.db"
+            self.ot.database = frames_db
+            self.ot.trial = (P.p_id, P.block_number, P.trial_number)
+            self.recorder = SQLiteFrameRecorder(frames_db, trial=self.ot.trial)
+        else:
+            self.recorder = FrameRecorder(self.ot.data_dir)
+
+        self.recorder.open()
+
+        if self.latency is not None:
+            self.latency.clear()
 
         locs = [LEFT, RIGHT]
         sizes = [SMALL, LARGE]
@@ -111,10 +159,25 @@ class test_marker_pos_reporting(klibs.Experiment):
 
         self.bounds = BoundarySet([self.target_boundary, self.distractor_boundary])
 
-        self.nnc.startup()
-        lead_time = CountDown(0.05)
+        # evaluated per frame on the data thread; positions arrive in cm
+        self.ot.events.target = lambda pos: self.bounds.within_boundary(
+            "target", p=[pos[0] * self.px_cm, pos[2] * self.px_cm]
+        )
+
+        self.nnc.reset_frame_stats()
+        self.nnc.resume()
+
+        # wait for the first frame of this trial to reach the tracker
+        first_frame = CountDown(P.opti_first_frame_timeout)  # type: ignore[attr-defined]
+        while self.ot.frame_count == 0:
+            self.check_ingest()
+
+            if not first_frame.counting():
+                raise RuntimeError(
+                    f"No motion tracking frames arrived within "
+                    f"{P.opti_first_frame_timeout} s; check that Motive is streaming."  # type: ignore[attr-defined]
+                )
 
-        while lead_time.counting():
             _ = ui_request()
 
     def trial(self):  # type: ignore[override]
@@ -124,21 +187,50 @@ class test_marker_pos_reporting(klibs.Experiment):
 
         trial_durr = CountDown(5)
 
+        # reaction time is measured from the first frame shown with the stimuli
+        start_frame = int(self.ot.position()["frame_number"][0])
+
         while trial_durr.counting():
             q = pump(True)
             ui_request(queue=q)
+            self.check_ingest()
 
             self.present_stimuli()
 
-        self.nnc.shutdown()
+        self.nnc.pause()
 
-        return {"block_num": P.block_number, "trial_num": P.trial_number}
+        frame_stats = self.nnc.frame_stats
+
+        # target centre in tracker cm; height (y) is not part of the screen plane
+        target_x, target_z = np.divide(self.locs[self.target_loc], self.px_cm)
+        kinematics = self.ot.movement_summary(
+            start_frame=start_frame, target=np.array([target_x, np.nan, target_z])
+        )
+
+        return {
+            "block_num": P.block_number,
+            "trial_num": P.trial_number,
+            "frames_received": frame_stats["received"],
+            "frames_dropped": frame_stats["dropped"],
+            "frames_duplicated": frame_stats["duplicates"],
+            "frames_reordered": frame_stats["reordered"],
+            "reaction_time": kinematics["reaction_time"],
+            "movement_time": kinematics["movement_time"],
+            "peak_velocity": kinematics["peak_velocity"],
+            "time_to_peak_velocity": kinematics["time_to_peak_velocity"],
+            "path_length": kinematics["path_length"],
+            "endpoint_error": kinematics["endpoint_error"],
+        }
 
     def trial_clean_up(self):
-        pass
+        if self.recorder is not None:
+            self.recorder.close()
+
+        if self.latency is not None:
+            self.latency.write(f"{os.path.splitext(self.ot.data_dir)[0]}_latency")
 
     def clean_up(self):
-        pass
+        self.nnc.shutdown()
 
     def present_stimuli(self):
         fill()
@@ -149,7 +241,10 @@ class test_marker_pos_reporting(klibs.Experiment):
         target_holder = self.placeholders[TARGET][self.target_size]  # type: ignore[attr-defined]
         target_holder.fill = WHITE
 
-        cursor_pos = self.ot.position()
+        cursor_pos = self.ot.position(smooth=True)
+
+        if self.latency is not None:
+            self.latency.read(cursor_pos["frame_number"][0])
 
         xy_cursor = [
             cursor_pos["pos_x"][0].item() * self.px_cm,
@@ -192,31 +287,32 @@ class test_marker_pos_reporting(klibs.Experiment):
 
         flip()
 
+        if self.latency is not None:
+            self.latency.flipped()
+
         if self.bounds.within_boundary("target", p=xy_cursor):
             self.Tone.play()
 
-    def marker_set_listener(self, marker_set: dict) -> None:
-        """Write marker set data to CSV file.
+    def ingest_failed(self, status: str, exitcode) -> None:
+        """Note that the ingest process crashed or stalled (watcher thread)."""
+        self.ingest_failure = f"NatNet ingest process {status} (exit code {exitcode})."
+
+    def check_ingest(self) -> None:
+        """Raise if the ingest process has failed, rather than wait on frames."""
+        if self.ingest_failure is not None:
+            raise RuntimeError(self.ingest_failure)
+
+    def marker_set_listener(
+        self, frame_number: int, label: str, markers: np.ndarray
+    ) -> None:
+        """Push marker set data to the tracker and queue it for recording.
 
         Args:
-            marker_set (dict): Dictionary containing marker data to be written.
-                Expected format: {'markers': [{'key1': val1, ...}, ...]}
+            frame_number (int): Frame number reported by Motive.
+            label (str): Name of the marker set.
+            markers (np.ndarray): [n_markers, 3] array of marker positions.
         """
 
-        if marker_set.get("label") == "hand":
-            # Append data to trial-specific CSV file
-            fname = self.ot.data_dir
-            header = list(marker_set["markers"][0].keys())
-
-            # if file doesn't exist, create it and write header
-            if not os.path.exists(fname):
-                with open(fname, "w", newline="") as file:
-                    writer = DictWriter(file, fieldnames=header)
-                    writer.writeheader()
-
-            # append marker data to file
-            with open(fname, "a", newline="") as file:
-                writer = DictWriter(file, fieldnames=header)
-                for marker in marker_set.get("markers", None):
-                    if marker is not None:
-                        writer.writerow(marker)
+        if label == "hand" and len(markers):
+            self.ot.add_frame(frame_number=frame_number, positions=markers)
+            self.recorder.record(frame_number=frame_number, positions=markers)